@@ -70,11 +70,16 @@ def create_app(config_name='dev'):
     from app.api.auth import auth_bp
     from app.api.store import store_bp
     from app.api.product import product_bp
+    from app.api.webhook import webhook_bp
     
     app.register_blueprint(api_bp, url_prefix='/v1')
     app.register_blueprint(auth_bp, url_prefix='/v1/auth')
     app.register_blueprint(store_bp, url_prefix='/v1/store')
     app.register_blueprint(product_bp, url_prefix='/v1/product')
+    app.register_blueprint(webhook_bp, url_prefix='/v1/webhooks')
+
+    from app.commands import sync_stores_command
+    app.cli.add_command(sync_stores_command)
 
     return app
 
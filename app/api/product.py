@@ -1,20 +1,68 @@
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from app.api.auth import token_required
 from app.services.product_service import ProductService
-from app.services.gemini_service import GeminiService
+from app.services.sync_job_service import SyncJobService
+from app.services.optimize_job_service import OptimizeJobService
+from app.services.llm_router import LLMRouter
+from app.services.llm_cache import LLMResponseCache
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
 
 product_bp = Blueprint('product', __name__)
 
+def _sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @product_bp.route('/stores/<int:store_id>/products/sync', methods=['POST'])
 @token_required
 def sync_products(current_user, store_id):
-    """Sync products from Shopify store"""
-    success, message, data = ProductService.fetch_products_from_shopify(store_id)
+    """Start a background sync of the products of a Shopify store"""
+    data = request.get_json(silent=True) or {}
+
+    # 'bulk' exports the catalog through a GraphQL bulk operation instead of paging the REST API
+    success, message, job = SyncJobService.start_sync_job(
+        store_id=store_id,
+        user_id=current_user.id,
+        full_resync=bool(data.get('full_resync', False)),
+        mode='bulk' if data.get('mode') == 'bulk' else 'rest'
+    )
+    
+    if success:
+        return jsonify({
+            'message': message,
+            'data': job
+        }), 202
+    return jsonify({'message': message}), 400
+
+@product_bp.route('/stores/<int:store_id>/products/sync/<job_id>', methods=['GET'])
+@token_required
+def get_sync_job(current_user, store_id, job_id):
+    """Get the status and progress of a product sync job"""
+    job = SyncJobService.get_sync_job(job_id)
+    if not job or job['store_id'] != store_id:
+        return jsonify({'message': 'Sync job not found'}), 404
+    
+    return jsonify({'data': job}), 200
+
+@product_bp.route('/stores/<int:store_id>/products/refresh', methods=['POST'])
+@token_required
+def refresh_products(current_user, store_id):
+    """Re-fetch selected products from Shopify without a full sync"""
+    data = request.get_json(silent=True) or {}
+    
+    if not data.get('product_ids'):
+        return jsonify({'message': 'Missing product IDs'}), 400
+    
+    success, message, result = ProductService.refresh_products(
+        store_id=store_id,
+        product_ids=data['product_ids']
+    )
     
     if success:
         return jsonify({
             'message': message,
-            'data': data
+            'data': result
         }), 200
     return jsonify({'message': message}), 400
 
@@ -59,10 +107,11 @@ def optimize_product(current_user, product_id):
     data = request.get_json()
     keywords = data.get('keywords', [])
     
-    # Generate optimized description
-    success, message, description_data = GeminiService.generate_seo_description(
+    # Generate optimized description, regenerate skips the cached description of an identical request
+    success, message, description_data = LLMRouter.generate_seo_description(
         product_id=product_id,
-        keywords=keywords
+        keywords=keywords,
+        regenerate=bool(data.get('regenerate', False))
     )
     
     if not success:
@@ -71,7 +120,9 @@ def optimize_product(current_user, product_id):
     # Save the optimized description
     success, message, saved_description = ProductService.create_optimized_description(
         product_id=product_id,
-        optimized_description=description_data['optimized_description']
+        optimized_description=description_data['optimized_description'],
+        prompt_tokens=description_data['prompt_tokens'],
+        completion_tokens=description_data['completion_tokens']
     )
     
     if success:
@@ -81,45 +132,156 @@ def optimize_product(current_user, product_id):
         }), 201
     return jsonify({'message': message}), 400
 
+@product_bp.route('/products/<int:product_id>/optimize/stream', methods=['POST'])
+@token_required
+def stream_optimize_product(current_user, product_id):
+    """Stream an SEO-optimized description over server-sent events and save it as a draft"""
+    data = request.get_json(silent=True) or {}
+    
+    success, message, stream = LLMRouter.stream_seo_description(
+        product_id=product_id,
+        keywords=data.get('keywords', []),
+        regenerate=bool(data.get('regenerate', False))
+    )
+    
+    if not success:
+        return jsonify({'message': message}), 400
+    
+    def events():
+        parts = []
+        try:
+            for chunk in stream['chunks']:
+                parts.append(chunk)
+                yield _sse_event('chunk', {'text': chunk})
+        except Exception as e:
+            current_app.logger.error(f"Error streaming description of product {product_id}: {str(e)}")
+            yield _sse_event('error', {'message': f"Error generating description: {getattr(e, 'message', str(e))}"})
+            return
+        
+        # Only a completed stream is saved, a client that disconnects early closes the generator before this
+        success, message, saved_description = ProductService.create_optimized_description(
+            product_id=product_id,
+            optimized_description=''.join(parts),
+            prompt_tokens=stream['usage']['prompt_tokens'],
+            completion_tokens=stream['usage']['completion_tokens']
+        )
+        if success:
+            yield _sse_event('done', {
+                'message': 'Description generated and saved successfully',
+                'data': saved_description
+            })
+        else:
+            yield _sse_event('error', {'message': message})
+    
+    # text/event-stream is not in the compressed mimetypes, so chunks are not buffered by Flask-Compress
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @product_bp.route('/products/bulk-optimize', methods=['POST'])
 @token_required
 def bulk_optimize_products(current_user):
-    """Generate SEO-optimized descriptions for multiple products"""
+    """Start a background job generating SEO-optimized descriptions for multiple products"""
     data = request.get_json()
     
     if 'product_ids' not in data:
         return jsonify({'message': 'Missing product IDs'}), 400
     
-    # Format keywords as a dictionary with product IDs as keys
-    keywords_dict = {}
-    if 'keywords' in data:
-        for product_id in data['product_ids']:
-            keywords_dict[product_id] = data['keywords']
+    # Descriptions are generated and saved one by one by the job, mode 'batch' uses the OpenAI Batch API
+    success, message, job = OptimizeJobService.start_optimize_job(
+        user_id=current_user.id,
+        product_ids=data['product_ids'],
+        keywords=data.get('keywords'),
+        regenerate=bool(data.get('regenerate', False)),
+        mode=data.get('mode', 'realtime')
+    )
+    
+    if success:
+        return jsonify({
+            'message': message,
+            'data': job
+        }), 202
+    return jsonify({'message': message}), 400
+
+@product_bp.route('/products/bulk-optimize/estimate', methods=['POST'])
+@token_required
+def estimate_bulk_optimize_products(current_user):
+    """Estimate the LLM tokens a bulk optimization would use before starting it"""
+    data = request.get_json()
+    
+    if 'product_ids' not in data:
+        return jsonify({'message': 'Missing product IDs'}), 400
     
-    # Generate optimized descriptions
-    success, message, descriptions = GeminiService.generate_bulk_seo_descriptions(
+    success, message, estimate = OptimizeJobService.estimate_optimize_job(
         product_ids=data['product_ids'],
-        keywords=keywords_dict
+        keywords=data.get('keywords')
     )
     
-    if not success:
-        return jsonify({'message': message}), 400
+    if success:
+        return jsonify({
+            'message': message,
+            'data': estimate
+        }), 200
+    return jsonify({'message': message}), 400
+
+@product_bp.route('/products/bulk-optimize/<job_id>', methods=['GET'])
+@token_required
+def get_bulk_optimize_job(current_user, job_id):
+    """Get the completed, failed and pending counts of a bulk optimization job"""
+    job = OptimizeJobService.get_optimize_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'message': 'Bulk optimization job not found'}), 404
     
-    # Save all generated descriptions
-    saved_descriptions = []
-    for desc in descriptions:
-        if 'error' not in desc:
-            success, _, saved_desc = ProductService.create_optimized_description(
-                product_id=desc['product_id'],
-                optimized_description=desc['optimized_description']
-            )
-            if success:
-                saved_descriptions.append(saved_desc)
+    return jsonify({'data': job}), 200
+
+@product_bp.route('/products/bulk-optimize/<job_id>/resume', methods=['POST'])
+@token_required
+def resume_bulk_optimize_job(current_user, job_id):
+    """Queue a failed or stalled bulk optimization job again, continuing where it stopped"""
+    success, message, job = OptimizeJobService.resume_optimize_job(job_id, current_user.id)
+    
+    if success:
+        return jsonify({
+            'message': message,
+            'data': job
+        }), 202
+    return jsonify({'message': message}), 400
+
+@product_bp.route('/products/bulk-optimize/<job_id>/results', methods=['GET'])
+@token_required
+def get_bulk_optimize_results(current_user, job_id):
+    """Page through the results of a bulk optimization job, also while it is running"""
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 20, type=int)
+    
+    results, total, pages = OptimizeJobService.get_optimize_job_results(
+        job_id=job_id,
+        user_id=current_user.id,
+        page=page,
+        per_page=per_page
+    )
+    if results is None:
+        return jsonify({'message': 'Bulk optimization job not found'}), 404
     
     return jsonify({
-        'message': f'Generated and saved {len(saved_descriptions)} descriptions',
-        'data': saved_descriptions
-    }), 201
+        'results': results,
+        'total': total,
+        'pages': pages,
+        'current_page': page
+    }), 200
+
+@product_bp.route('/products/optimize/cache', methods=['GET'])
+@token_required
+def get_optimize_cache_stats(current_user):
+    """Get the hit and miss counters of the generated description cache"""
+    return jsonify({'data': LLMResponseCache.stats()}), 200
+
+@product_bp.route('/products/optimize/concurrency', methods=['GET'])
+@token_required
+def get_optimize_concurrency(current_user):
+    """Get the current adaptive LLM concurrency limit of every worker process"""
+    return jsonify({'data': AdaptiveConcurrencyLimiter.metrics()}), 200
 
 @product_bp.route('/descriptions/<int:description_id>', methods=['PUT'])
 @token_required
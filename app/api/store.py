@@ -3,6 +3,7 @@ import requests
 from app.api.auth import token_required
 from app.services.store_service import StoreService
 from app.services.shopify_oauth_service import ShopifyOAuthService
+from app.services.webhook_service import ShopifyWebhookService
 
 store_bp = Blueprint('store', __name__)
 
@@ -51,6 +52,9 @@ def oauth_callback():
     if not success:
         return jsonify({'message': message}), 400
     
+    # Keep the catalog up to date between syncs, a failure here is only logged
+    ShopifyWebhookService.register_product_webhooks(StoreService.get_store_by_id(store['id']))
+    
     return jsonify({
         'message': 'Store connected successfully',
         'data': store
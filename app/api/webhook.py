@@ -0,0 +1,34 @@
+import json
+from flask import Blueprint, request, jsonify, current_app
+from app.services.webhook_service import ShopifyWebhookService, PRODUCT_WEBHOOK_TOPICS
+
+webhook_bp = Blueprint('webhook', __name__)
+
+@webhook_bp.route('/shopify/products', methods=['POST'])
+def shopify_product_webhook():
+    """Receive Shopify product webhooks and queue them for processing"""
+    body = request.get_data()
+    if not ShopifyWebhookService.verify_hmac(body, request.headers.get('X-Shopify-Hmac-Sha256')):
+        return jsonify({'message': 'Invalid webhook signature'}), 401
+    
+    topic = request.headers.get('X-Shopify-Topic')
+    shop = request.headers.get('X-Shopify-Shop-Domain')
+    if topic not in PRODUCT_WEBHOOK_TOPICS or not shop:
+        return jsonify({'message': 'Unsupported webhook'}), 400
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        payload = None
+    # Shopify retries any non 2xx answer, a malformed payload would only fail again
+    if not ShopifyWebhookService.is_valid_product_payload(payload):
+        return jsonify({'message': 'Invalid webhook payload'}), 400
+    
+    try:
+        ShopifyWebhookService.enqueue_product_event(shop, topic, payload)
+    except Exception as e:
+        current_app.logger.error(f"Error queueing {topic} webhook from {shop}: {str(e)}")
+        # A non 2xx answer makes Shopify retry the delivery
+        return jsonify({'message': 'Error queueing webhook'}), 500
+    
+    return jsonify({'message': 'Webhook received'}), 200
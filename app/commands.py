@@ -0,0 +1,29 @@
+"""Flask CLI commands, run with `flask --app runserver <command>`."""
+
+import json
+
+import click
+from flask.cli import with_appcontext
+
+from app.services.sync_orchestrator import SyncOrchestrator
+
+
+@click.command('sync-stores')
+@click.option('--store-id', 'store_ids', type=int, multiple=True, help='Store to sync, repeatable. Defaults to all stores.')
+@click.option('--workers', type=int, default=None, help='Number of stores synced concurrently.')
+@click.option('--full-resync', is_flag=True, help='Ignore the sync watermarks and fetch every product.')
+@click.option('--mode', type=click.Choice(['rest', 'bulk']), default='rest', help='Sync engine to use.')
+@with_appcontext
+def sync_stores_command(store_ids, workers, full_resync, mode):
+    """Sync the products of many stores in parallel and print a per-store summary."""
+    success, message, data = SyncOrchestrator.sync_stores(
+        store_ids=list(store_ids) or None,
+        max_workers=workers,
+        full_resync=full_resync,
+        mode=mode
+    )
+    click.echo(message)
+    if data:
+        click.echo(json.dumps(data, indent=2))
+    if not success:
+        raise SystemExit(1)
@@ -14,6 +14,9 @@ class OptimizedDescription(BaseModel):
     original_description = db.Column(db.Text)
     optimized_description = db.Column(db.Text, nullable=False)
     status = db.Column(db.Enum(DescriptionStatus), default=DescriptionStatus.DRAFT, nullable=False)
+    # Tokens of the LLM call that generated the description, 0 when it came from the cache
+    prompt_tokens = db.Column(db.Integer)
+    completion_tokens = db.Column(db.Integer)
     
     def __repr__(self):
         return f'<OptimizedDescription {self.id} for Product {self.product_id}>'
@@ -25,6 +28,8 @@ class OptimizedDescription(BaseModel):
             'original_description': self.original_description,
             'optimized_description': self.optimized_description,
             'status': self.status.value,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         } 
\ No newline at end of file
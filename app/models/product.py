@@ -4,6 +4,9 @@ from app.models.base import BaseModel
 
 class Product(BaseModel):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_store_id_shopify_product_id', 'store_id', 'shopify_product_id', unique=True),
+    )
     
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
     shopify_product_id = db.Column(db.BigInteger, nullable=False)
@@ -15,6 +18,8 @@ class Product(BaseModel):
     status = db.Column(db.String(50), default='active')
     shopify_created_at = db.Column(db.DateTime)
     shopify_updated_at = db.Column(db.DateTime)
+    # Fingerprint of the synced content fields, used to skip no-op writes
+    content_hash = db.Column(db.String(32))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
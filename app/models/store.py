@@ -11,6 +11,11 @@ class Store(BaseModel):
     access_token = db.Column(db.String(255), nullable=False)
     store_name = db.Column(db.String(255))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # Highest shopify_updated_at stored by a completed sync, used for delta syncs
+    sync_watermark = db.Column(db.DateTime)
+    # Per-store overrides for sharded syncs of very large catalogs
+    sync_shard_size = db.Column(db.Integer)
+    sync_parallelism = db.Column(db.Integer)
 
     # Relationship with User model
     user = db.relationship('User', backref=db.backref('stores', lazy=True))
@@ -29,6 +34,9 @@ class Store(BaseModel):
             'store_name': self.store_name,
             'user_id': self.user_id,
             'access_token': self.access_token,
+            'sync_watermark': self.sync_watermark.isoformat() if self.sync_watermark else None,
+            'sync_shard_size': self.sync_shard_size,
+            'sync_parallelism': self.sync_parallelism,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         } 
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import re
+from typing import Callable, Optional
+from flask import current_app
+from app.services.bounded_executor import BoundedExecutor
+from app.services.llm_cache import LLMResponseCache
+
+# Markdown code fences some models wrap JSON output in
+CODE_FENCE = re.compile(r'^\s*```(?:json)?\s*|\s*```\s*$')
+
+
+class BatchedGeneration:
+    """
+    Generates descriptions for many products with one LLM request per batch
+    of products instead of one per product. Every batch asks for a JSON object
+    keyed by product id; products missing from the answer or with an invalid
+    description are retried in later batches, up to max_attempts in total.
+    """
+
+    @staticmethod
+    def build_products_block(products: list, keywords: dict = None) -> str:
+        """
+        JSON list of the products of a batch as it is embedded in the prompt
+        """
+        return json.dumps([{
+            'id': product['id'],
+            'title': product['title'],
+            'original_description': product['description'] or 'No description available',
+            'keywords': (keywords or {}).get(product['id']) or []
+        } for product in products], ensure_ascii=False, indent=1)
+
+    @staticmethod
+    def parse_response(text: str, product_ids: list) -> dict:
+        """
+        Split a batched answer into {product_id: description}, keeping only
+        the requested products that got a non-empty description
+        """
+        try:
+            answer = json.loads(CODE_FENCE.sub('', text or ''))
+        except ValueError:
+            return {}
+        if not isinstance(answer, dict):
+            return {}
+
+        descriptions = {}
+        for product_id in product_ids:
+            description = answer.get(str(product_id))
+            if isinstance(description, str) and description.strip():
+                descriptions[product_id] = description.strip()
+        return descriptions
+
+    @staticmethod
+    def run(generate_batch: Callable, products: list, keywords: dict, batch_size: int, max_attempts: int,
+            cache_key: Callable = None, regenerate: bool = False, on_result: Optional[Callable] = None,
+            limiter=None) -> dict:
+        """
+        Generate descriptions for products in batches of batch_size.
+        generate_batch(products, keywords) returns (success, message, data) with data
+        {'descriptions': {product_id: description}, 'prompt_tokens': int, 'completion_tokens': int}.
+        A batch's tokens are shared among its products, prompt tokens evenly and
+        completion tokens by the length of their descriptions.
+        cache_key(product, keywords) names a product's LLMResponseCache entry;
+        cached products are answered without a request unless regenerate is set.
+        on_result(product_id, (success, message, data)) is called as soon as each product is final.
+        Batches are sent up to LLM_BULK_CONCURRENCY at a time, or as many as limiter allows.
+        Returns: {product_id: (success: bool, message: str, data: dict)}
+        """
+        results = {}
+
+        def finish(product_id, outcome):
+            results[product_id] = outcome
+            if on_result:
+                on_result(product_id, outcome)
+
+        pending = []
+        for product in products:
+            cached_description = None
+            if cache_key and not regenerate:
+                cached_description = LLMResponseCache.get(cache_key(product, keywords))
+            if cached_description is not None:
+                finish(product['id'], (True, "Description generated successfully", {
+                    'product_id': product['id'],
+                    'optimized_description': cached_description,
+                    'cached': True,
+                    'prompt_tokens': 0,
+                    'completion_tokens': 0
+                }))
+            else:
+                pending.append(product)
+
+        last_errors = {}
+        for attempt in range(1, max_attempts + 1):
+            if not pending:
+                break
+            batches = [pending[offset:offset + batch_size] for offset in range(0, len(pending), batch_size)]
+            retry = []
+
+            def record_batch(index, outcome):
+                success, message, data = outcome
+                if not success:
+                    data = {'descriptions': {}, 'prompt_tokens': 0, 'completion_tokens': 0}
+                descriptions = data['descriptions']
+                batch_chars = sum(len(description) for description in descriptions.values()) or 1
+                for product in batches[index]:
+                    description = descriptions.get(product['id'])
+                    if description is None:
+                        last_errors[product['id']] = message if not success else "Missing or invalid in batched response"
+                        retry.append(product)
+                        continue
+                    if cache_key:
+                        LLMResponseCache.set(cache_key(product, keywords), description)
+                    finish(product['id'], (True, "Description generated successfully", {
+                        'product_id': product['id'],
+                        'optimized_description': description,
+                        'cached': False,
+                        'prompt_tokens': round(data['prompt_tokens'] / len(batches[index])),
+                        'completion_tokens': round(data['completion_tokens'] * len(description) / batch_chars)
+                    }))
+
+            BoundedExecutor.run(
+                lambda batch: generate_batch(batch, keywords),
+                batches,
+                max_workers=current_app.config['LLM_CONCURRENCY_MAX' if limiter else 'LLM_BULK_CONCURRENCY'],
+                # Output grows with the batch, so the deadline does too
+                item_timeout=current_app.config['LLM_ITEM_TIMEOUT'] * batch_size,
+                thread_name_prefix='llm-batch',
+                on_result=record_batch,
+                limiter=limiter
+            )
+
+            if retry and attempt < max_attempts:
+                current_app.logger.warning(f"Retrying {len(retry)} products missing from batched answers "
+                                           f"(attempt {attempt} of {max_attempts})")
+            pending = retry
+
+        for product in pending:
+            finish(product['id'], (False, f"Error generating description: {last_errors[product['id']]}", None))
+        return results
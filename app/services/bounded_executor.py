@@ -0,0 +1,73 @@
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+from flask import current_app
+
+
+class BoundedExecutor:
+    """
+    Runs a service call for many items on a bounded thread pool. Every call
+    runs in its own app context, gets its own deadline that starts when a
+    worker picks it up, and results come back in the order of the items.
+    """
+
+    @staticmethod
+    def run(func: Callable, items: list, max_workers: int, item_timeout: float,
+            thread_name_prefix: str = 'bounded', on_result: Optional[Callable] = None, limiter=None) -> list:
+        """
+        Call func(item) for every item. func returns a (success, message, data)
+        tuple; exceptions and calls that run past item_timeout are reported as
+        failed tuples instead. on_result(index, result) is called on the
+        calling thread as soon as each item's result is known. With an
+        AdaptiveConcurrencyLimiter, an item first waits for one of its slots
+        and its deadline only starts once it holds one.
+        Returns: [(success: bool, message: str, data)] in the order of items
+        """
+        if not items:
+            return []
+
+        app = current_app._get_current_object()
+        started_at = {}
+
+        def run_item(index, item):
+            with app.app_context(), limiter.slot() if limiter else nullcontext():
+                started_at[index] = time.monotonic()
+                return func(item)
+
+        results = [None] * len(items)
+        executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix=thread_name_prefix)
+        try:
+            futures = {executor.submit(run_item, index, item): index for index, item in enumerate(items)}
+            pending = set(futures)
+            while pending:
+                now = time.monotonic()
+                deadlines = [started_at[futures[future]] + item_timeout
+                             for future in pending if futures[future] in started_at]
+                wait_for = max(min(deadlines) - now, 0) if deadlines else item_timeout
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    index = futures[future]
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        current_app.logger.error(f"Error processing item {items[index]}: {str(e)}")
+                        results[index] = (False, f"Error: {str(e)}", None)
+                    if on_result:
+                        on_result(index, results[index])
+
+                now = time.monotonic()
+                for future in list(pending):
+                    index = futures[future]
+                    if index in started_at and now - started_at[index] >= item_timeout:
+                        # The worker thread can't be interrupted, its late result is discarded
+                        current_app.logger.warning(f"Item {items[index]} timed out after {item_timeout}s")
+                        results[index] = (False, f"Timed out after {item_timeout}s", None)
+                        pending.discard(future)
+                        if on_result:
+                            on_result(index, results[index])
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return results
@@ -0,0 +1,162 @@
+import uuid
+from typing import Optional
+from flask import current_app, has_app_context
+from redis.exceptions import RedisError
+from app import redis_obj
+from config import Config_is
+
+# Decide whether a call may go through. An open circuit lets a single probe
+# through once ARGV[1] seconds have passed since it opened, and another one if
+# the probe has not reported back within ARGV[2] seconds. The probe is
+# identified by the token ARGV[3].
+# Returns {allowed (1/0), state, seconds until the next probe, probe token or ''}
+ALLOW_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local circuit = redis.call('HMGET', KEYS[1], 'state', 'opened_at', 'probe_until')
+local state = circuit[1] or 'closed'
+if state == 'closed' then
+    return {1, state, '0', ''}
+end
+local reset_timeout = tonumber(ARGV[1])
+local probe_timeout = tonumber(ARGV[2])
+if state == 'open' then
+    local probe_at = tonumber(circuit[2]) + reset_timeout
+    if now < probe_at then
+        return {0, state, tostring(probe_at - now), ''}
+    end
+elseif now < tonumber(circuit[3]) then
+    return {0, state, tostring(tonumber(circuit[3]) - now), ''}
+end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + probe_timeout, 'probe', ARGV[3])
+redis.call('EXPIRE', KEYS[1], math.ceil(reset_timeout + probe_timeout) * 2)
+return {1, 'half_open', '0', ARGV[3]}
+"""
+
+# Report the outcome of a call. ARGV: success (1/0), failure threshold,
+# failure window, reset timeout and probe timeout in seconds, and the probe
+# token allow() gave the call ('' for other calls).
+# Returns the state before and after the report
+RECORD_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local circuit = redis.call('HMGET', KEYS[1], 'state', 'failures', 'first_failure_at', 'probe')
+local state = circuit[1] or 'closed'
+local ttl = math.ceil(tonumber(ARGV[4]) + tonumber(ARGV[5])) * 2
+-- Calls admitted before the circuit opened neither close nor reopen it, only the probe does
+if state == 'open' or (state == 'half_open' and (ARGV[6] == '' or circuit[4] ~= ARGV[6])) then
+    return {state, state}
+end
+if ARGV[1] == '1' then
+    if circuit[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    return {state, 'closed'}
+end
+local failures = 1
+if state == 'closed' and circuit[3] and now - tonumber(circuit[3]) <= tonumber(ARGV[3]) then
+    failures = tonumber(circuit[2]) + 1
+end
+if state == 'half_open' or failures >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', now)
+    redis.call('EXPIRE', KEYS[1], ttl)
+    return {state, 'open'}
+end
+if failures == 1 then
+    redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 1, 'first_failure_at', now)
+else
+    redis.call('HSET', KEYS[1], 'failures', failures)
+end
+redis.call('EXPIRE', KEYS[1], ttl)
+return {state, 'closed'}
+"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breakers around external dependencies (an LLM provider, a store's
+    Shopify API), shared by every process through Redis. A circuit opens
+    after CIRCUIT_FAILURE_THRESHOLD failures in a row within
+    CIRCUIT_FAILURE_WINDOW seconds; while open, calls are refused at once
+    instead of waiting for the dependency to time out. After
+    CIRCUIT_RESET_TIMEOUT seconds one probe call is let through (half-open):
+    its success closes the circuit, its failure opens it again. Outcomes of
+    other calls, admitted before the circuit opened, are ignored meanwhile.
+    When Redis is unavailable every call is let through.
+    """
+
+    @staticmethod
+    def _circuit_key(name: str) -> str:
+        return f"circuit:{name}"
+
+    @staticmethod
+    def _log(level: str, message: str):
+        if has_app_context():
+            getattr(current_app.logger, level)(message)
+
+    @staticmethod
+    def allow(name: str) -> tuple:
+        """
+        Whether a call to the dependency may go through now. A call let
+        through as the probe of a half-open circuit gets a token to hand
+        back to record().
+        Returns: (allowed: bool, seconds until the next probe: float, probe token: str or None)
+        """
+        if redis_obj is None:
+            return True, 0.0, None
+        try:
+            allowed, state, retry_in, probe = redis_obj.eval(
+                ALLOW_SCRIPT, 1, CircuitBreaker._circuit_key(name),
+                Config_is.CIRCUIT_RESET_TIMEOUT, Config_is.CIRCUIT_PROBE_TIMEOUT, uuid.uuid4().hex
+            )
+        except RedisError as e:
+            CircuitBreaker._log('warning', f"Circuit breaker unavailable: {str(e)}")
+            return True, 0.0, None
+        if allowed and state == 'half_open':
+            CircuitBreaker._log('info', f"Circuit {name} is half-open, probing")
+        return bool(allowed), float(retry_in), probe or None
+
+    @staticmethod
+    def record(name: str, success: bool, probe: Optional[str] = None):
+        """
+        Report the outcome of a call that allow() let through, with the
+        probe token allow() gave it
+        """
+        if redis_obj is None:
+            return
+        try:
+            previous, state = redis_obj.eval(
+                RECORD_SCRIPT, 1, CircuitBreaker._circuit_key(name), 1 if success else 0,
+                Config_is.CIRCUIT_FAILURE_THRESHOLD, Config_is.CIRCUIT_FAILURE_WINDOW,
+                Config_is.CIRCUIT_RESET_TIMEOUT, Config_is.CIRCUIT_PROBE_TIMEOUT, probe or ''
+            )
+        except RedisError as e:
+            CircuitBreaker._log('warning', f"Circuit breaker unavailable: {str(e)}")
+            return
+        if state == 'open' and previous != 'open':
+            CircuitBreaker._log('warning', f"Circuit {name} opened, failing fast for "
+                                           f"{Config_is.CIRCUIT_RESET_TIMEOUT}s")
+        elif state == 'closed' and previous != 'closed':
+            CircuitBreaker._log('info', f"Circuit {name} closed")
+
+    @staticmethod
+    def is_failure_status(status: int) -> bool:
+        """
+        Whether a response status means the dependency is unhealthy. Client
+        errors and throttling are left to the caller and the rate limiters.
+        """
+        return status >= 500
+
+    @staticmethod
+    def is_failure_error(error: Exception) -> bool:
+        """
+        Whether an error raised by a call means the dependency is unhealthy:
+        a server error status, or no answer at all (connection errors and
+        timeouts, requests' included, are OSErrors)
+        """
+        # CustomErrors carry .status, google.api_core errors carry the HTTP status as .code
+        status = getattr(error, 'status', None) or getattr(error, 'code', None)
+        if isinstance(status, int):
+            return CircuitBreaker.is_failure_status(status)
+        return isinstance(error, OSError)
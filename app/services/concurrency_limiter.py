@@ -0,0 +1,171 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app
+from app import redis_obj
+
+METRIC_KEY_PREFIX = 'llm_concurrency'
+# HTTP statuses a provider answers with when it wants fewer requests, or timed out at its gateway
+THROTTLE_STATUSES = (429, 503, 504)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on the concurrent calls of one LLM provider in this process.
+    The limit grows by about one slot per limit's worth of calls answered
+    within LLM_LATENCY_TARGET and is multiplied by LLM_CONCURRENCY_DECREASE
+    when the provider throttles (429/503/504), times out or answers too slowly.
+    Only calls started after the last cut can cut again, so a burst of
+    failures from the same window halves the limit once, not once per call.
+    """
+    _lock = threading.Lock()
+    _pid = None
+    _limiters = {}
+
+    def __init__(self, provider: str, initial: float, minimum: int, maximum: int):
+        self.provider = provider
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease_at = 0.0
+        self.published_at = 0.0
+        self._condition = threading.Condition()
+        self._held = threading.local()
+
+    @classmethod
+    def for_provider(cls, provider: str) -> 'AdaptiveConcurrencyLimiter':
+        """
+        Process wide limiter of a provider, rebuilt after a fork like the LLM clients
+        """
+        with cls._lock:
+            if cls._pid != os.getpid():
+                cls._pid = os.getpid()
+                cls._limiters = {}
+            limiter = cls._limiters.get(provider)
+            if limiter is None:
+                limiter = cls(
+                    provider,
+                    current_app.config['LLM_BULK_CONCURRENCY'],
+                    current_app.config['LLM_CONCURRENCY_MIN'],
+                    current_app.config['LLM_CONCURRENCY_MAX']
+                )
+                cls._limiters[provider] = limiter
+            return limiter
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one of the limit's slots, waiting for one to free up. Re-entrant
+        per thread, so a call made while the thread already holds a slot
+        (a bulk worker reserving its slot before its deadline starts) does not
+        take a second one.
+        """
+        if getattr(self._held, 'depth', 0):
+            self._held.depth += 1
+            try:
+                yield
+            finally:
+                self._held.depth -= 1
+            return
+
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        self._held.depth = 1
+        try:
+            yield
+        finally:
+            self._held.depth = 0
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def record(self, started: float, seconds: float, throttled: bool = False):
+        """
+        Feed back the outcome of a call started at started (time.monotonic)
+        that took seconds, throttled if the provider refused or timed it out
+        """
+        latency_target = current_app.config['LLM_LATENCY_TARGET']
+        with self._condition:
+            previous = int(self.limit)
+            if throttled or seconds > latency_target:
+                if started < self.last_decrease_at:
+                    return
+                self.limit = max(self.limit * current_app.config['LLM_CONCURRENCY_DECREASE'], self.minimum)
+                self.last_decrease_at = time.monotonic()
+                self.decreases += 1
+                reason = 'throttled' if throttled else f'{seconds:.1f}s over the {latency_target}s target'
+                current_app.logger.warning(f"{self.provider} concurrency cut to {int(self.limit)} ({reason})")
+            elif self.limit < self.maximum:
+                self.limit = min(self.limit + 1 / self.limit, self.maximum)
+                self.increases += 1
+                if int(self.limit) > previous:
+                    self._condition.notify(int(self.limit) - previous)
+            changed = int(self.limit) != previous
+        self._publish(changed)
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            return {
+                'provider': self.provider,
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'min': self.minimum,
+                'max': self.maximum,
+                'increases': self.increases,
+                'decreases': self.decreases
+            }
+
+    def _publish(self, changed: bool):
+        """
+        Report the current limit to Redis on every change and at least every
+        LLM_CONCURRENCY_METRIC_INTERVAL seconds, under a key per process that
+        expires once the process stops reporting
+        """
+        interval = current_app.config['LLM_CONCURRENCY_METRIC_INTERVAL']
+        now = time.monotonic()
+        if redis_obj is None or (not changed and now - self.published_at < interval):
+            return
+        self.published_at = now
+        try:
+            redis_obj.setex(
+                f"{METRIC_KEY_PREFIX}:{self.provider}:{socket.gethostname()}:{os.getpid()}",
+                max(int(interval * 3), 1),
+                json.dumps(self.snapshot())
+            )
+        except Exception as e:
+            current_app.logger.warning(f"Publishing the {self.provider} concurrency limit failed: {str(e)}")
+
+    @staticmethod
+    def is_throttle(error: Exception) -> bool:
+        """
+        Whether a provider error asks for less concurrency: a 429/503/504 status or a timeout
+        """
+        # LLMProviderError carries .status, google.api_core errors carry the HTTP status as .code
+        status = getattr(error, 'status', None) or getattr(error, 'code', None)
+        if isinstance(status, int) and status in THROTTLE_STATUSES:
+            return True
+        return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+    @staticmethod
+    def metrics() -> list:
+        """
+        Current limits of every process that reported one recently
+        """
+        if redis_obj is None:
+            return []
+        metrics = []
+        for key in redis_obj.scan_iter(match=f"{METRIC_KEY_PREFIX}:*", count=100):
+            value = redis_obj.get(key)
+            if value is None:
+                continue
+            _, provider, host, pid = key.split(':', 3)
+            metrics.append(dict(json.loads(value), host=host, pid=int(pid)))
+        return sorted(metrics, key=lambda metric: (metric['provider'], metric['host'], metric['pid']))
@@ -54,6 +54,21 @@ class Conflict(CustomError):
         CustomError.__init__(self, message, 409)
 
 
+class ShopifyAPIError(CustomError):
+    def __init__(self, message="Shopify API request failed", status=502):
+        CustomError.__init__(self, message, status)
+
+
+class ShopifyRateLimitError(ShopifyAPIError):
+    def __init__(self, message="Shopify rate limit reached, please try again later."):
+        ShopifyAPIError.__init__(self, message, 429)
+
+
+class LLMProviderError(CustomError):
+    def __init__(self, message="LLM provider request failed", status=502):
+        CustomError.__init__(self, message, status)
+
+
 @bp.errorhandler(CustomError)
 def handle_invalid_usage(error):
     response = jsonify(error.to_dict())
@@ -0,0 +1,119 @@
+import hashlib
+import json
+import time
+from typing import Optional
+from flask import current_app
+from app import redis_obj
+
+CACHE_KEY_PREFIX = 'llm_cache'
+
+
+class LLMResponseCache:
+    """
+    Content addressed cache of generated descriptions. Entries are keyed by a
+    hash of everything that shapes the LLM output, expire after LLM_CACHE_TTL
+    and the least recently used ones are evicted past LLM_CACHE_MAX_ENTRIES.
+    Redis errors never fail a generation, the cache is simply skipped.
+    """
+
+    @staticmethod
+    def _entry_key(digest: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{digest}"
+
+    @staticmethod
+    def _lru_key() -> str:
+        return f"{CACHE_KEY_PREFIX}:lru"
+
+    @staticmethod
+    def _stats_key() -> str:
+        return f"{CACHE_KEY_PREFIX}:stats"
+
+    @staticmethod
+    def make_key(provider: str, model: str, prompt_version: int, product: dict, keywords: list = None,
+                 temperature: float = None) -> str:
+        """
+        Digest of the provider, model, prompt template version, product content,
+        keywords and temperature of a generation
+        """
+        content = json.dumps([
+            provider, model, prompt_version, product['title'], product['description'] or '',
+            list(keywords or []), temperature
+        ], ensure_ascii=False)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=20).hexdigest()
+
+    @staticmethod
+    def get(digest: str) -> Optional[str]:
+        """
+        Cached description of a key, counting the lookup as a hit or a miss
+        """
+        if redis_obj is None:
+            return None
+        try:
+            # An empty description is never a valid answer, older empty entries count as misses
+            cached = redis_obj.get(LLMResponseCache._entry_key(digest)) or None
+            pipeline = redis_obj.pipeline()
+            pipeline.hincrby(LLMResponseCache._stats_key(), 'hits' if cached is not None else 'misses', 1)
+            if cached is not None:
+                pipeline.zadd(LLMResponseCache._lru_key(), {digest: time.time()}, xx=True)
+            else:
+                # The entry may have expired by TTL, it must not keep taking a place in the index
+                pipeline.zrem(LLMResponseCache._lru_key(), digest)
+            pipeline.execute()
+            return cached
+        except Exception as e:
+            current_app.logger.warning(f"LLM cache lookup failed: {str(e)}")
+            return None
+
+    @staticmethod
+    def set(digest: str, description: str):
+        """
+        Cache a description, evicting the least recently used entries beyond the size limit
+        """
+        if redis_obj is None or not description:
+            return
+        try:
+            now = time.time()
+            pipeline = redis_obj.pipeline()
+            pipeline.setex(LLMResponseCache._entry_key(digest), current_app.config['LLM_CACHE_TTL'], description)
+            pipeline.zadd(LLMResponseCache._lru_key(), {digest: now})
+            # Entries unused for a whole TTL have expired, they must not count against the size limit
+            pipeline.zremrangebyscore(LLMResponseCache._lru_key(), '-inf', now - current_app.config['LLM_CACHE_TTL'])
+            pipeline.zcard(LLMResponseCache._lru_key())
+            size = pipeline.execute()[-1]
+
+            overflow = size - current_app.config['LLM_CACHE_MAX_ENTRIES']
+            if overflow > 0:
+                evicted = [member for member, _ in redis_obj.zpopmin(LLMResponseCache._lru_key(), overflow)]
+                pipeline = redis_obj.pipeline()
+                pipeline.delete(*[LLMResponseCache._entry_key(member) for member in evicted])
+                pipeline.hincrby(LLMResponseCache._stats_key(), 'evictions', len(evicted))
+                pipeline.execute()
+        except Exception as e:
+            current_app.logger.warning(f"LLM cache write failed: {str(e)}")
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Hit, miss and eviction counters and the current number of entries
+        """
+        empty_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': None, 'entries': 0}
+        if redis_obj is None:
+            return empty_stats
+        try:
+            pipeline = redis_obj.pipeline()
+            pipeline.hgetall(LLMResponseCache._stats_key())
+            pipeline.zcount(LLMResponseCache._lru_key(), time.time() - current_app.config['LLM_CACHE_TTL'], '+inf')
+            counters, entries = pipeline.execute()
+        except Exception as e:
+            current_app.logger.warning(f"LLM cache stats unavailable: {str(e)}")
+            return empty_stats
+        hits = int(counters.get('hits', 0))
+        misses = int(counters.get('misses', 0))
+        return {
+            'hits': hits,
+            'misses': misses,
+            'evictions': int(counters.get('evictions', 0)),
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+            # Entries unused for a whole TTL have expired even while they are still indexed
+            'entries': entries
+        }
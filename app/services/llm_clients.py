@@ -0,0 +1,67 @@
+import os
+import threading
+import google.generativeai as genai
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+
+
+class LLMClientRegistry:
+    """
+    Process wide registry of configured LLM clients. genai.configure drops the
+    cached gRPC clients and their connections, so it runs once per process and
+    API key, and model objects are built once per model name. Everything is
+    rebuilt after a fork (gunicorn / celery prefork workers) because gRPC
+    channels and pooled sockets must not be shared with the parent.
+    """
+    _lock = threading.Lock()
+    _pid = None
+    _gemini_api_key = None
+    _gemini_models = {}
+    _openai_session = None
+
+    @classmethod
+    def _reset_after_fork(cls):
+        """
+        Drop clients inherited from a parent process, caller holds the lock
+        """
+        if cls._pid != os.getpid():
+            cls._pid = os.getpid()
+            cls._gemini_api_key = None
+            cls._gemini_models = {}
+            cls._openai_session = None
+
+    @classmethod
+    def get_gemini_model(cls, model_name: str = None) -> genai.GenerativeModel:
+        """
+        Configured Gemini model, GEMINI_MODEL unless another model is named
+        """
+        model_name = model_name or current_app.config['GEMINI_MODEL']
+        api_key = current_app.config.get('GEMINI_API_KEY')
+        with cls._lock:
+            cls._reset_after_fork()
+            if cls._gemini_api_key != api_key:
+                genai.configure(api_key=api_key)
+                cls._gemini_api_key = api_key
+                cls._gemini_models = {}
+
+            model = cls._gemini_models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                cls._gemini_models[model_name] = model
+            return model
+
+    @classmethod
+    def get_openai_session(cls) -> requests.Session:
+        """
+        Pooled HTTP session for the OpenAI API, sized for concurrent bulk generation
+        """
+        with cls._lock:
+            cls._reset_after_fork()
+            if cls._openai_session is None:
+                session = requests.Session()
+                session.mount('https://', HTTPAdapter(
+                    pool_connections=1, pool_maxsize=current_app.config['LLM_CONCURRENCY_MAX']
+                ))
+                cls._openai_session = session
+            return cls._openai_session
@@ -0,0 +1,436 @@
+import itertools
+import time
+from typing import Callable, Iterator, Optional
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.models.optimized_description import OptimizedDescription
+from app.models.product import Product
+from app.services.batched_generation import BatchedGeneration
+from app.services.bounded_executor import BoundedExecutor
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.services.custom_errors import LLMProviderError
+from app.services.llm_cache import LLMResponseCache
+from app.services.prompt_compaction import PromptCompaction
+
+# Bump whenever a prompt changes so cached descriptions of the old prompt are not reused
+PROMPT_TEMPLATE_VERSION = 1
+BATCH_PROMPT_TEMPLATE_VERSION = 1
+MAX_TOKENS = 1000
+SYSTEM_PROMPT = "You are an expert SEO copywriter specializing in e-commerce product descriptions."
+
+
+class LLMProvider:
+    """
+    Base of the LLM services. A provider implements model_name, is_configured,
+    _complete and _stream_completion against its own pooled client; prompts,
+    caching, bulk fan out and batching are shared by every provider.
+    Calls are refused at once while the provider's CircuitBreaker is open,
+    and completions go through its AdaptiveConcurrencyLimiter.
+    Provider calls raise LLMProviderError, the public methods return the
+    usual (success, message, data) tuples.
+    """
+    name = None
+    temperature = None
+
+    @classmethod
+    def model_name(cls) -> str:
+        raise NotImplementedError
+
+    @classmethod
+    def is_configured(cls) -> bool:
+        raise NotImplementedError
+
+    @classmethod
+    def _complete(cls, prompt: str, max_tokens: int = MAX_TOKENS, json_output: bool = False) -> tuple:
+        """
+        Send one prompt and return the generated text with the token usage the
+        provider reported, {'prompt_tokens': int, 'completion_tokens': int} or None
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _stream_completion(cls, prompt: str) -> Iterator[str]:
+        """
+        Send one prompt and yield the generated text as it arrives
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _circuit_name(cls) -> str:
+        return f"llm:{cls.name}"
+
+    @classmethod
+    def _check_circuit(cls) -> Optional[str]:
+        """
+        Fail fast while the provider's circuit is open
+        Returns: the probe token of a call probing a half-open circuit
+        """
+        allowed, retry_in, probe = CircuitBreaker.allow(cls._circuit_name())
+        if not allowed:
+            raise LLMProviderError(f"{cls.name} is failing, retry in {retry_in:.1f}s", 503)
+        return probe
+
+    @classmethod
+    def _limited_complete(cls, prompt: str, max_tokens: int = MAX_TOKENS, json_output: bool = False) -> tuple:
+        """
+        _complete behind the provider's circuit breaker and within a slot of
+        its adaptive concurrency limit, feeding the outcome back to both.
+        Token usage the provider does not report is estimated.
+        Returns: (text: str, usage: dict)
+        """
+        probe = cls._check_circuit()
+        limiter = AdaptiveConcurrencyLimiter.for_provider(cls.name)
+        with limiter.slot():
+            started = time.monotonic()
+            try:
+                text, usage = cls._complete(prompt, max_tokens=max_tokens, json_output=json_output)
+            except Exception as e:
+                if AdaptiveConcurrencyLimiter.is_throttle(e):
+                    limiter.record(started, time.monotonic() - started, throttled=True)
+                CircuitBreaker.record(cls._circuit_name(), success=not CircuitBreaker.is_failure_error(e), probe=probe)
+                raise
+            # Latency is compared per MAX_TOKENS asked, batched prompts ask for more
+            limiter.record(started, (time.monotonic() - started) / max(max_tokens / MAX_TOKENS, 1))
+            CircuitBreaker.record(cls._circuit_name(), success=True, probe=probe)
+            return text, usage or cls._estimate_usage(prompt, text)
+
+    @staticmethod
+    def _estimate_usage(prompt: str, text: str = None) -> dict:
+        return {
+            'prompt_tokens': PromptCompaction.estimate_tokens(prompt),
+            'completion_tokens': PromptCompaction.estimate_tokens(text)
+        }
+
+    @staticmethod
+    def _product_data(product: Product) -> dict:
+        """
+        Prompt input of a product, its body_html reduced to text within LLM_DESCRIPTION_TOKEN_BUDGET
+        """
+        return {
+            'id': product.id,
+            'title': product.title,
+            'description': PromptCompaction.compact_description(
+                product.description, current_app.config['LLM_DESCRIPTION_TOKEN_BUDGET']
+            ) or None
+        }
+
+    @staticmethod
+    def _build_prompt(product: dict, keywords: list = None) -> str:
+        """
+        Prompt asking for the SEO description of a product
+        """
+        return f"""
+            Create an SEO-optimized product description for the following product:
+
+            Product Title: {product['title']}
+            Original Description: {product['description'] or 'No description available'}
+
+            The description should:
+            1. Be engaging and persuasive
+            2. Include relevant keywords naturally
+            3. Be between 150-300 words
+            4. Highlight key features and benefits
+            5. Include a call to action
+            6. Be formatted with appropriate HTML tags for Shopify
+
+            Keywords to include: {', '.join(keywords) if keywords else 'Use relevant keywords based on the product'}
+            """
+
+    @staticmethod
+    def _build_batch_prompt(products: list, keywords: dict = None) -> str:
+        """
+        Prompt asking for the SEO descriptions of several products as one JSON object
+        """
+        return f"""
+            Create an SEO-optimized product description for each of the following products.
+
+            Each description should:
+            1. Be engaging and persuasive
+            2. Include the product's keywords naturally, or relevant keywords based on the product if it has none
+            3. Be between 150-300 words
+            4. Highlight key features and benefits
+            5. Include a call to action
+            6. Be formatted with appropriate HTML tags for Shopify
+
+            Answer with only a JSON object mapping every product id, as a string, to its description.
+
+            Products:
+            {BatchedGeneration.build_products_block(products, keywords)}
+            """
+
+    @classmethod
+    def _cache_key(cls, product: dict, keywords: list = None, batched: bool = False) -> str:
+        prompt_version = f'batch-{BATCH_PROMPT_TEMPLATE_VERSION}' if batched else PROMPT_TEMPLATE_VERSION
+        return LLMResponseCache.make_key(cls.name, cls.model_name(), prompt_version, product, keywords, cls.temperature)
+
+    @classmethod
+    def _generate_description(cls, product: dict, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Generate the description of an already loaded product. Only reads the
+        product dict, so it can run on a worker thread with its own app context.
+        A cached description of identical input is returned unless regenerate is set.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            if not cls.is_configured():
+                current_app.logger.error(f"{cls.name} API key is not configured")
+                return False, f"Error: {cls.name} API key is not configured", None
+
+            cache_key = cls._cache_key(product, keywords)
+            cached_description = None if regenerate else LLMResponseCache.get(cache_key)
+            if cached_description is not None:
+                return True, "Description generated successfully", {
+                    'product_id': product['id'],
+                    'optimized_description': cached_description,
+                    'cached': True,
+                    'prompt_tokens': 0,
+                    'completion_tokens': 0
+                }
+
+            current_app.logger.info(f"Generating description for product {product['id']} "
+                                    f"using {cls.name} model {cls.model_name()}")
+            generated_description, usage = cls._limited_complete(cls._build_prompt(product, keywords))
+            LLMResponseCache.set(cache_key, generated_description)
+
+            return True, "Description generated successfully", {
+                'product_id': product['id'],
+                'optimized_description': generated_description,
+                'cached': False,
+                'prompt_tokens': usage['prompt_tokens'],
+                'completion_tokens': usage['completion_tokens']
+            }
+
+        except LLMProviderError as e:
+            current_app.logger.error(f"Error calling {cls.name}: {e.message}")
+            return False, f"Error generating description: {e.message}", None
+        except Exception as e:
+            current_app.logger.error(f"Error in generate_seo_description: {str(e)}")
+            return False, f"Error generating description: {str(e)}", None
+
+    @classmethod
+    def _generate_batch(cls, products: list, keywords: dict = None) -> tuple:
+        """
+        Generate the descriptions of a batch of loaded products with one request
+        Returns: (success: bool, message: str,
+                  data: {'descriptions': {product_id: description}, 'prompt_tokens': int, 'completion_tokens': int})
+        """
+        try:
+            if not cls.is_configured():
+                return False, f"{cls.name} API key is not configured", None
+
+            current_app.logger.info(f"Generating descriptions for {len(products)} products "
+                                    f"using {cls.name} model {cls.model_name()}")
+            text, usage = cls._limited_complete(cls._build_batch_prompt(products, keywords),
+                                                max_tokens=MAX_TOKENS * len(products), json_output=True)
+            return True, "Batch generated", dict(usage, descriptions=BatchedGeneration.parse_response(
+                text, [product['id'] for product in products]
+            ))
+
+        except LLMProviderError as e:
+            current_app.logger.error(f"Error calling {cls.name}: {e.message}")
+            return False, e.message, None
+        except Exception as e:
+            current_app.logger.error(f"Error in _generate_batch: {str(e)}")
+            return False, str(e), None
+
+    @classmethod
+    def generate_seo_description(cls, product_id: int, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Generate an SEO-optimized description for a product
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            # Get product details
+            product = Product.query.get(product_id)
+            if not product:
+                return False, "Product not found", None
+
+            return cls._generate_description(cls._product_data(product), keywords, regenerate)
+
+        except Exception as e:
+            current_app.logger.error(f"Error in generate_seo_description: {str(e)}")
+            return False, f"Error generating description: {str(e)}", None
+
+    @classmethod
+    def stream_seo_description(cls, product_id: int, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Stream an SEO-optimized description as the model generates it. A cached
+        description of identical input is streamed as one chunk unless
+        regenerate is set, and a completed stream is added to the cache.
+        Token usage is estimated, its completion tokens once the stream is complete.
+        Returns: (success: bool, message: str, data: {'chunks': iterator of text chunks, 'usage': dict})
+        """
+        try:
+            product = Product.query.get(product_id)
+            if not product:
+                return False, "Product not found", None
+            product_data = cls._product_data(product)
+
+            if not cls.is_configured():
+                current_app.logger.error(f"{cls.name} API key is not configured")
+                return False, f"Error: {cls.name} API key is not configured", None
+
+            cache_key = cls._cache_key(product_data, keywords)
+            cached_description = None if regenerate else LLMResponseCache.get(cache_key)
+            if cached_description is not None:
+                return True, "Description streamed from cache", {
+                    'chunks': iter([cached_description]),
+                    'usage': {'prompt_tokens': 0, 'completion_tokens': 0}
+                }
+
+            current_app.logger.info(f"Streaming description for product {product_id} "
+                                    f"using {cls.name} model {cls.model_name()}")
+            prompt = cls._build_prompt(product_data, keywords)
+            usage = cls._estimate_usage(prompt)
+            probe = cls._check_circuit()
+            limiter = AdaptiveConcurrencyLimiter.for_provider(cls.name)
+
+            def chunks():
+                # The slot is held until the stream ends, fails or its consumer closes it
+                with limiter.slot():
+                    started = time.monotonic()
+                    parts = []
+                    try:
+                        for text in cls._stream_completion(prompt):
+                            parts.append(text)
+                            yield text
+                        # Rejected like an empty completion, so it is neither cached nor saved
+                        if not ''.join(parts):
+                            raise LLMProviderError("No response from API")
+                    except Exception as e:
+                        if AdaptiveConcurrencyLimiter.is_throttle(e):
+                            limiter.record(started, time.monotonic() - started, throttled=True)
+                        CircuitBreaker.record(cls._circuit_name(), success=not CircuitBreaker.is_failure_error(e),
+                                              probe=probe)
+                        raise
+                    # Only a stream that ran to its end proves the provider healthy
+                    limiter.record(started, time.monotonic() - started)
+                    CircuitBreaker.record(cls._circuit_name(), success=True, probe=probe)
+                description = ''.join(parts)
+                usage['completion_tokens'] = PromptCompaction.estimate_tokens(description)
+                LLMResponseCache.set(cache_key, description)
+
+            stream = chunks()
+            # Wait for the first chunk, so a provider that cannot start streaming falls back to the next one
+            first_chunk = next(stream)
+            return True, "Description stream started", {'chunks': itertools.chain([first_chunk], stream),
+                                                        'usage': usage}
+
+        except LLMProviderError as e:
+            current_app.logger.error(f"Error calling {cls.name}: {e.message}")
+            return False, f"Error generating description: {e.message}", None
+        except Exception as e:
+            current_app.logger.error(f"Error in stream_seo_description: {str(e)}")
+            return False, f"Error generating description: {str(e)}", None
+
+    @classmethod
+    def estimate_bulk_usage(cls, product_ids: list, keywords: dict = None) -> dict:
+        """
+        Tokens a bulk generation of the products would use, before any cache
+        hits: prompt tokens of the exact prompts it would send, and completion
+        tokens from the average of the descriptions generated so far (None
+        until there is one)
+        """
+        products = [cls._product_data(product) for product in Product.query.filter(Product.id.in_(product_ids))]
+        batch_size = current_app.config[f'{cls.name.upper()}_BATCH_SIZE']
+        if batch_size > 1:
+            prompts = [cls._build_batch_prompt(products[offset:offset + batch_size], keywords)
+                       for offset in range(0, len(products), batch_size)]
+        else:
+            prompts = [cls._build_prompt(product, (keywords or {}).get(product['id'])) for product in products]
+
+        average_completion_tokens = db.session.query(func.avg(OptimizedDescription.completion_tokens)).filter(
+            OptimizedDescription.completion_tokens > 0
+        ).scalar()
+        return {
+            'provider': cls.name,
+            'model': cls.model_name(),
+            'products': len(products),
+            'requests': len(prompts),
+            'prompt_tokens': sum(PromptCompaction.estimate_tokens(prompt) for prompt in prompts),
+            'completion_tokens': round(average_completion_tokens * len(products))
+            if average_completion_tokens else None
+        }
+
+    @classmethod
+    def generate_bulk_seo_descriptions(cls, product_ids: list, keywords: dict = None, on_result: Callable = None,
+                                       regenerate: bool = False) -> tuple:
+        """
+        Generate SEO-optimized descriptions for multiple products, as many at a
+        time as the provider's adaptive concurrency limit allows, with an
+        LLM_ITEM_TIMEOUT per product.
+        on_result(result) is called with each product's result as soon as it is ready.
+        With a <PROVIDER>_BATCH_SIZE above 1, products are sent several per request.
+        Returns: (success: bool, message: str, data: list) with data in the order of product_ids
+        """
+        try:
+            # Load every product up front in one query
+            products = {
+                product.id: cls._product_data(product)
+                for product in Product.query.filter(Product.id.in_(product_ids))
+            }
+
+            def item_result(product_id, outcome):
+                success, message, data = outcome
+                return data if success else {
+                    'product_id': product_id,
+                    'error': message
+                }
+
+            # Workers wait for a slot of the limit, so the pool only caps how far it can grow
+            limiter = AdaptiveConcurrencyLimiter.for_provider(cls.name)
+            batch_size = current_app.config[f'{cls.name.upper()}_BATCH_SIZE']
+            if batch_size > 1:
+                # Several products per request, answered as one JSON object keyed by product id
+                product_outcomes = BatchedGeneration.run(
+                    cls._generate_batch,
+                    [products[product_id] for product_id in product_ids if product_id in products],
+                    keywords,
+                    batch_size,
+                    current_app.config['LLM_BATCH_MAX_ATTEMPTS'],
+                    cache_key=lambda product, keywords: cls._cache_key(
+                        product, (keywords or {}).get(product['id']), batched=True
+                    ),
+                    regenerate=regenerate,
+                    on_result=(lambda product_id, outcome: on_result(item_result(product_id, outcome)))
+                    if on_result else None,
+                    limiter=limiter
+                )
+                outcomes = []
+                for product_id in product_ids:
+                    if product_id not in product_outcomes:
+                        product_outcomes[product_id] = (False, "Product not found", None)
+                        if on_result:
+                            on_result(item_result(product_id, product_outcomes[product_id]))
+                    outcomes.append(product_outcomes[product_id])
+            else:
+                def generate(product_id):
+                    if product_id not in products:
+                        return False, "Product not found", None
+                    # Get product-specific keywords if available
+                    product_keywords = keywords.get(product_id, []) if keywords else None
+                    return cls._generate_description(products[product_id], product_keywords, regenerate)
+
+                outcomes = BoundedExecutor.run(
+                    generate,
+                    product_ids,
+                    max_workers=current_app.config['LLM_CONCURRENCY_MAX'],
+                    item_timeout=current_app.config['LLM_ITEM_TIMEOUT'],
+                    thread_name_prefix=f'{cls.name}-bulk',
+                    on_result=(lambda index, outcome: on_result(item_result(product_ids[index], outcome)))
+                    if on_result else None,
+                    limiter=limiter
+                )
+
+            results = [item_result(product_id, outcome) for product_id, outcome in zip(product_ids, outcomes)]
+            success_count = sum(1 for success, _, _ in outcomes if success)
+            error_count = len(outcomes) - success_count
+
+            return True, f"Processed {len(product_ids)} products. Success: {success_count}, Errors: {error_count}", results
+
+        except Exception as e:
+            current_app.logger.error(f"Error in generate_bulk_seo_descriptions: {str(e)}")
+            return False, f"Error in bulk generation: {str(e)}", None
+
@@ -0,0 +1,227 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+from flask import Flask, current_app
+from app.models.product import Product
+from app.services.gemini_service import GeminiService
+from app.services.llm_provider import LLMProvider
+from app.services.openai_service import OpenAIService
+
+PROVIDERS = {provider.name: provider for provider in (GeminiService, OpenAIService)}
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies per provider in this process, used to
+    derive the p95 after which a request is hedged
+    """
+    _lock = threading.Lock()
+    _samples = {}
+
+    @classmethod
+    def record(cls, provider: str, seconds: float):
+        with cls._lock:
+            samples = cls._samples.get(provider)
+            if samples is None:
+                samples = cls._samples[provider] = deque(maxlen=current_app.config['LLM_LATENCY_WINDOW'])
+            samples.append(seconds)
+
+    @classmethod
+    def percentile(cls, provider: str, percentile: float) -> Optional[float]:
+        """
+        Latency percentile of a provider, None until enough calls were seen
+        """
+        with cls._lock:
+            samples = sorted(cls._samples.get(provider) or [])
+        if len(samples) < current_app.config['LLM_LATENCY_MIN_SAMPLES']:
+            return None
+        return samples[min(math.ceil(percentile / 100 * len(samples)) - 1, len(samples) - 1)]
+
+
+class LLMRouter:
+    """
+    Sends description requests to the primary LLM provider and routes around
+    it when it misbehaves: a request still unanswered after the primary's p95
+    latency is hedged by sending it to the fallback provider as well, and the
+    first successful answer wins. Failed requests fall back automatically.
+    """
+
+    @staticmethod
+    def get_providers() -> list:
+        """
+        Configured providers in order of preference
+        """
+        names = [current_app.config['LLM_PRIMARY_PROVIDER'], current_app.config['LLM_FALLBACK_PROVIDER']]
+        providers = []
+        for name in names:
+            provider = PROVIDERS.get(name)
+            if provider and provider not in providers and provider.is_configured():
+                providers.append(provider)
+        return providers
+
+    @staticmethod
+    def hedge_delay(provider: LLMProvider) -> float:
+        """
+        Seconds to wait on a provider before hedging, its p95 latency once known
+        """
+        p95 = LatencyTracker.percentile(provider.name, 95)
+        if p95 is None:
+            return current_app.config['LLM_HEDGE_DEFAULT_DELAY']
+        return max(p95, current_app.config['LLM_HEDGE_MIN_DELAY'])
+
+    @staticmethod
+    def _timed_generate(app: Flask, provider: LLMProvider, product: dict, keywords: list, regenerate: bool) -> tuple:
+        """
+        Generate with one provider on a worker thread, recording the latency of real calls
+        """
+        with app.app_context():
+            started = time.monotonic()
+            success, message, data = provider._generate_description(product, keywords, regenerate)
+            if success:
+                if not data['cached']:
+                    LatencyTracker.record(provider.name, time.monotonic() - started)
+                data['provider'] = provider.name
+            return success, message, data
+
+    @staticmethod
+    def generate_for_product(product: dict, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Generate the description of a loaded product with hedging and fallback
+        Returns: (success: bool, message: str, data: dict)
+        """
+        providers = LLMRouter.get_providers()
+        if not providers:
+            return False, "Error: no LLM provider is configured", None
+
+        app = current_app._get_current_object()
+        hedging = current_app.config['LLM_HEDGE_ENABLED']
+        deadline = time.monotonic() + current_app.config['LLM_ITEM_TIMEOUT']
+        executor = ThreadPoolExecutor(max_workers=len(providers), thread_name_prefix='llm-hedge')
+        try:
+            waiting = list(providers)
+            running = {}
+            hedge_at = None
+            last_failure = (False, "Error generating description: no provider answered in time", None)
+
+            while True:
+                now = time.monotonic()
+                # Start the next provider first of all, once the primary stalls past its p95, or after a failure
+                if waiting and (not running or (hedge_at is not None and now >= hedge_at)):
+                    provider = waiting.pop(0)
+                    if running:
+                        current_app.logger.warning(f"Hedging product {product['id']} with {provider.name}")
+                    running[executor.submit(LLMRouter._timed_generate, app, provider, product, keywords,
+                                            regenerate)] = provider
+                    hedge_at = now + LLMRouter.hedge_delay(provider) if hedging and waiting else None
+                    continue
+                if not running or now >= deadline:
+                    return last_failure
+
+                timeout = deadline - now if hedge_at is None else min(hedge_at, deadline) - now
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    provider = running.pop(future)
+                    outcome = future.result()
+                    if outcome[0]:
+                        return outcome
+                    current_app.logger.warning(f"{provider.name} failed for product {product['id']}: {outcome[1]}")
+                    last_failure = outcome
+        finally:
+            # A losing request can't be cancelled, its answer is dropped when it arrives
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def generate_seo_description(product_id: int, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Generate an SEO-optimized description for a product
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            product = Product.query.get(product_id)
+            if not product:
+                return False, "Product not found", None
+
+            return LLMRouter.generate_for_product(LLMProvider._product_data(product), keywords, regenerate)
+        except Exception as e:
+            current_app.logger.error(f"Error in generate_seo_description: {str(e)}")
+            return False, f"Error generating description: {str(e)}", None
+
+    @staticmethod
+    def stream_seo_description(product_id: int, keywords: list = None, regenerate: bool = False) -> tuple:
+        """
+        Stream an SEO-optimized description from the first provider that starts streaming
+        Returns: (success: bool, message: str, data: {'chunks': iterator of text chunks, 'usage': dict})
+        """
+        providers = LLMRouter.get_providers()
+        if not providers:
+            return False, "Error: no LLM provider is configured", None
+
+        for provider in providers:
+            success, message, stream = provider.stream_seo_description(product_id, keywords, regenerate)
+            if success or message == "Product not found":
+                return success, message, stream
+            current_app.logger.warning(f"{provider.name} could not stream product {product_id}: {message}")
+        return success, message, stream
+
+    @staticmethod
+    def estimate_bulk_usage(product_ids: list, keywords: dict = None) -> dict:
+        """
+        Tokens a bulk generation would use with the primary provider
+        """
+        provider = PROVIDERS[current_app.config['LLM_PRIMARY_PROVIDER']]
+        return provider.estimate_bulk_usage(product_ids, keywords)
+
+    @staticmethod
+    def generate_bulk_seo_descriptions(product_ids: list, keywords: dict = None, on_result: Callable = None,
+                                       regenerate: bool = False) -> tuple:
+        """
+        Generate descriptions for many products with the primary provider,
+        retrying the products it failed on with the fallback provider.
+        on_result(result) is called once per product with its final result.
+        Returns: (success: bool, message: str, data: list) with data in the order of product_ids
+        """
+        providers = LLMRouter.get_providers()
+        if not providers:
+            return False, "Error: no LLM provider is configured", None
+
+        results = {}
+        remaining = list(product_ids)
+        for position, provider in enumerate(providers):
+            last_provider = position == len(providers) - 1
+
+            def record(result, provider=provider, last_provider=last_provider):
+                # Failures are held back while another provider can still retry them
+                if 'error' in result and not last_provider and result['error'] != "Product not found":
+                    return
+                if 'error' not in result:
+                    result['provider'] = provider.name
+                if on_result:
+                    on_result(result)
+
+            success, message, provider_results = provider.generate_bulk_seo_descriptions(
+                remaining, keywords, on_result=record, regenerate=regenerate
+            )
+            if not success:
+                if last_provider:
+                    return False, message, None
+                current_app.logger.warning(f"Bulk generation with {provider.name} failed: {message}")
+                continue
+
+            for result in provider_results:
+                results[result['product_id']] = result
+            remaining = [
+                product_id for product_id in remaining
+                if 'error' in results[product_id] and results[product_id]['error'] != "Product not found"
+            ]
+            if not remaining:
+                break
+            if not last_provider:
+                current_app.logger.warning(f"Retrying {len(remaining)} products with the fallback provider")
+
+        ordered = [results[product_id] for product_id in product_ids]
+        error_count = sum(1 for result in ordered if 'error' in result)
+        return True, (f"Processed {len(product_ids)} products. Success: {len(ordered) - error_count}, "
+                      f"Errors: {error_count}"), ordered
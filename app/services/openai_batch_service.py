@@ -0,0 +1,308 @@
+import json
+import tempfile
+import time
+from typing import Callable, Iterable, Iterator, Optional
+from flask import current_app
+from app.models.product import Product
+from app.services.custom_errors import LLMProviderError
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_clients import LLMClientRegistry
+from app.services.openai_service import OpenAIService
+
+CHAT_COMPLETIONS_ENDPOINT = '/v1/chat/completions'
+BATCH_FINISHED_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+CUSTOM_ID_PREFIX = 'product-'
+# Products loaded per query when prompts are written
+PRODUCT_LOAD_CHUNK_SIZE = 1000
+
+
+class OpenAIBatchService:
+    """
+    Description generation through the OpenAI Batch API, for catalog wide runs
+    that can wait hours for their answers in exchange for the lower batch price.
+    The prompts of up to OPENAI_BATCH_MAX_REQUESTS products are written to a
+    JSONL input file, uploaded and submitted as one batch; finished batches
+    are polled for and their output files streamed back line by line.
+
+    The batches of a run are kept in a state dict that is handed to on_state
+    after every change. Running again with the saved state resumes polling and
+    collecting the same batches instead of submitting them again. Products
+    answered with an error or missing from a finished batch are submitted in a
+    new batch, up to OPENAI_BATCH_MAX_ATTEMPTS times in total.
+    """
+
+    @staticmethod
+    def _api(method: str, path: str, **kwargs):
+        """
+        Call the OpenAI API, raising LLMProviderError unless it succeeds
+        """
+        kwargs.setdefault('timeout', current_app.config['LLM_ITEM_TIMEOUT'])
+        response = LLMClientRegistry.get_openai_session().request(
+            method,
+            f"{current_app.config['OPENAI_API_BASE']}{path}",
+            headers=OpenAIService._auth_headers(),
+            **kwargs
+        )
+        if response.status_code >= 300:
+            current_app.logger.error(f"Error calling OpenAI {method} {path}: {response.text}")
+            raise LLMProviderError(f"OpenAI {method} {path} failed: {response.status_code}", response.status_code)
+        return response
+
+    @staticmethod
+    def iter_products(product_ids: list) -> Iterator[dict]:
+        """
+        Prompt input of the products, loaded a chunk at a time
+        """
+        for offset in range(0, len(product_ids), PRODUCT_LOAD_CHUNK_SIZE):
+            chunk = product_ids[offset:offset + PRODUCT_LOAD_CHUNK_SIZE]
+            for product in Product.query.filter(Product.id.in_(chunk)):
+                yield OpenAIService._product_data(product)
+
+    @staticmethod
+    def write_input_file(products: list, keywords: dict = None):
+        """
+        Write the chat completion request of every product as a JSONL batch input file
+        Returns: the file, positioned at its start
+        """
+        input_file = tempfile.TemporaryFile()
+        for product in products:
+            prompt = OpenAIService._build_prompt(product, (keywords or {}).get(product['id']))
+            input_file.write(json.dumps({
+                'custom_id': f"{CUSTOM_ID_PREFIX}{product['id']}",
+                'method': 'POST',
+                'url': CHAT_COMPLETIONS_ENDPOINT,
+                'body': OpenAIService._request_body(prompt)
+            }, ensure_ascii=False).encode('utf-8') + b'\n')
+        input_file.seek(0)
+        return input_file
+
+    @staticmethod
+    def submit_batch(products: list, keywords: dict = None) -> dict:
+        """
+        Upload the input file of the products and start a batch of it
+        Returns: the batch as it is kept in the run state
+        """
+        with OpenAIBatchService.write_input_file(products, keywords) as input_file:
+            uploaded = OpenAIBatchService._api(
+                'POST', '/files',
+                data={'purpose': 'batch'},
+                files={'file': ('descriptions.jsonl', input_file, 'application/jsonl')}
+            ).json()
+
+        batch = OpenAIBatchService._api('POST', '/batches', json={
+            'input_file_id': uploaded['id'],
+            'endpoint': CHAT_COMPLETIONS_ENDPOINT,
+            'completion_window': '24h'
+        }).json()
+        current_app.logger.info(f"Submitted OpenAI batch {batch['id']} of {len(products)} products")
+
+        return {
+            'id': batch['id'],
+            'input_file_id': uploaded['id'],
+            'status': batch['status'],
+            # Cache entries are named after the input the descriptions were generated from
+            'cache_keys': {
+                str(product['id']): OpenAIService._cache_key(product, (keywords or {}).get(product['id']))
+                for product in products
+            },
+            'submitted_at': time.time(),
+            'collected': False
+        }
+
+    @staticmethod
+    def cancel_batch(batch_id: str):
+        """
+        Ask OpenAI to stop a batch, logging rather than raising when it refuses
+        """
+        try:
+            OpenAIBatchService._api('POST', f"/batches/{batch_id}/cancel")
+        except LLMProviderError as e:
+            current_app.logger.warning(f"Error cancelling OpenAI batch {batch_id}: {str(e)}")
+
+    @staticmethod
+    def wait_for_batch(batch: dict, poll_interval: float, timeout: float, wait: bool = True) -> Optional[dict]:
+        """
+        Poll a batch until it has finished. A batch still running timeout
+        seconds after its submission is cancelled and reported as 'timed_out',
+        so its products are resubmitted or failed like those of a failed
+        batch. With wait False the batch is only checked once.
+        Returns: the finished batch as the API describes it, None if it is still running
+        """
+        while True:
+            info = OpenAIBatchService._api('GET', f"/batches/{batch['id']}").json()
+            if info['status'] in BATCH_FINISHED_STATUSES:
+                return info
+            if time.time() > batch['submitted_at'] + timeout:
+                current_app.logger.warning(f"OpenAI batch {batch['id']} still {info['status']} after {timeout}s, "
+                                           f"cancelling it")
+                OpenAIBatchService.cancel_batch(batch['id'])
+                return dict(info, status='timed_out')
+            if not wait:
+                return None
+            time.sleep(poll_interval)
+
+    @staticmethod
+    def iter_output(file_id: str) -> Iterator[tuple]:
+        """
+        Stream a batch output or error file one line at a time
+        Yields: (product_id, (success: bool, message: str, data: dict))
+        """
+        with OpenAIBatchService._api('GET', f"/files/{file_id}/content", stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                item = json.loads(line)
+                product_id = int(item['custom_id'][len(CUSTOM_ID_PREFIX):])
+                answer = item.get('response') or {}
+                if item.get('error') or answer.get('status_code') != 200:
+                    error = item.get('error') or (answer.get('body') or {}).get('error') or {}
+                    message = error.get('message') or f"status {answer.get('status_code')}"
+                    yield product_id, (False, f"Error generating description: {message}", None)
+                    continue
+
+                body = answer['body']
+                usage = body.get('usage') or {}
+                yield product_id, (True, "Description generated successfully", {
+                    'product_id': product_id,
+                    'optimized_description': body['choices'][0]['message']['content'],
+                    'cached': False,
+                    'prompt_tokens': usage.get('prompt_tokens'),
+                    'completion_tokens': usage.get('completion_tokens')
+                })
+
+    @staticmethod
+    def _without_finished(products: list, product_ids: list, keywords: dict, regenerate: bool,
+                          finish: Callable) -> list:
+        """
+        Finish the products that need no request, missing ones as not found and,
+        unless regenerate is set, cached ones with their cached description
+        Returns: the products left to submit
+        """
+        loaded_ids = {product['id'] for product in products}
+        for product_id in product_ids:
+            if product_id not in loaded_ids:
+                finish(product_id, {'product_id': product_id, 'error': "Product not found"})
+        if regenerate:
+            return products
+
+        uncached = []
+        for product in products:
+            cached_description = LLMResponseCache.get(
+                OpenAIService._cache_key(product, (keywords or {}).get(product['id']))
+            )
+            if cached_description is None:
+                uncached.append(product)
+                continue
+            finish(product['id'], {
+                'product_id': product['id'],
+                'optimized_description': cached_description,
+                'cached': True,
+                'prompt_tokens': 0,
+                'completion_tokens': 0
+            })
+        return uncached
+
+    @staticmethod
+    def run(product_ids: list, keywords: dict = None, regenerate: bool = False, state: Optional[dict] = None,
+            on_result: Callable = None, on_state: Callable = None,
+            load_products: Callable[[list], Iterable[dict]] = None, wait: bool = True) -> tuple:
+        """
+        Generate the descriptions of the products through batches.
+        product_ids are the products still to report; on a resumed run, the
+        products reported before are left out and skipped in collected output.
+        state is the saved state of an interrupted run, on_state(state) is
+        called whenever it changes and on_result(result) once per product with
+        its final result. load_products(product_ids) yields prompt input,
+        OpenAIBatchService.iter_products by default.
+        With wait False, a run returns as soon as a batch is still running
+        instead of polling it; run again with the state to continue.
+        Returns: (success: bool, message: str, data: dict) with data the state,
+                 its 'finished' set once every product got its final result
+        """
+        try:
+            if not OpenAIService.is_configured():
+                return False, "Error: openai API key is not configured", None
+
+            state = state or {'attempt': 0, 'batches': [], 'errors': {}, 'finished': False}
+            load_products = load_products or OpenAIBatchService.iter_products
+            on_state = on_state or (lambda state: None)
+            pending = set(product_ids)
+            # Last error of every product, kept in the state for runs that continue after a wait
+            last_errors = state['errors']
+            counts = {'completed': 0, 'failed': 0}
+
+            def finish(product_id, result):
+                pending.discard(product_id)
+                counts['failed' if 'error' in result else 'completed'] += 1
+                if on_result:
+                    on_result(result)
+
+            while True:
+                running = False
+                for batch in [batch for batch in state['batches'] if not batch['collected']]:
+                    info = OpenAIBatchService.wait_for_batch(
+                        batch,
+                        current_app.config['OPENAI_BATCH_POLL_INTERVAL'],
+                        current_app.config['OPENAI_BATCH_TIMEOUT'],
+                        wait=wait
+                    )
+                    if info is None:
+                        running = True
+                        continue
+                    batch['status'] = info['status']
+                    if info['status'] != 'completed':
+                        current_app.logger.warning(f"OpenAI batch {batch['id']} {info['status']}: {info.get('errors')}")
+                    for file_id in (info.get('output_file_id'), info.get('error_file_id')):
+                        if not file_id:
+                            continue
+                        for product_id, (success, message, data) in OpenAIBatchService.iter_output(file_id):
+                            if product_id not in pending:
+                                continue
+                            if success:
+                                LLMResponseCache.set(batch['cache_keys'][str(product_id)],
+                                                     data['optimized_description'])
+                                finish(product_id, data)
+                            else:
+                                last_errors[str(product_id)] = message
+                    for product_id in batch['cache_keys']:
+                        if int(product_id) in pending and product_id not in last_errors:
+                            last_errors[product_id] = f"Error generating description: batch {info['status']}"
+                    batch['collected'] = True
+                    on_state(state)
+
+                if running:
+                    return True, "Waiting for OpenAI batches", state
+
+                retry_ids = [product_id for product_id in product_ids if product_id in pending]
+                if not retry_ids:
+                    break
+                if state['attempt'] >= current_app.config['OPENAI_BATCH_MAX_ATTEMPTS']:
+                    for product_id in retry_ids:
+                        finish(product_id, {
+                            'product_id': product_id,
+                            'error': last_errors.get(str(product_id), "Error generating description: no batch answered it")
+                        })
+                    break
+
+                products = list(load_products(retry_ids))
+                if state['attempt'] == 0:
+                    products = OpenAIBatchService._without_finished(products, retry_ids, keywords, regenerate, finish)
+                elif products:
+                    current_app.logger.warning(f"Resubmitting {len(products)} products that failed in OpenAI batches")
+                state['attempt'] += 1
+                max_requests = current_app.config['OPENAI_BATCH_MAX_REQUESTS']
+                for offset in range(0, len(products), max_requests):
+                    state['batches'].append(
+                        OpenAIBatchService.submit_batch(products[offset:offset + max_requests], keywords)
+                    )
+                    # Saved right after every submission, so a resumed run polls the batch instead of paying twice
+                    on_state(state)
+
+            state['finished'] = True
+            on_state(state)
+            return True, (f"Processed {len(product_ids)} products. Success: {counts['completed']}, "
+                          f"Errors: {counts['failed']}"), state
+
+        except Exception as e:
+            current_app.logger.error(f"Error in OpenAI batch generation: {str(e)}")
+            return False, f"Error in batch generation: {str(e)}", None
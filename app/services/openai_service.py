@@ -1,108 +1,86 @@
-import requests
 import json
+from typing import Iterator
 from flask import current_app
-from app.models.product import Product
+from app.services.custom_errors import LLMProviderError
+from app.services.llm_clients import LLMClientRegistry
+from app.services.llm_provider import LLMProvider, MAX_TOKENS, SYSTEM_PROMPT
+
+
+class OpenAIService(LLMProvider):
+    """
+    OpenAI chat completions, through the pooled session of LLMClientRegistry
+    """
+    name = 'openai'
+    temperature = 0.7
+
+    @classmethod
+    def model_name(cls) -> str:
+        return current_app.config['OPENAI_MODEL']
+
+    @classmethod
+    def is_configured(cls) -> bool:
+        return bool(current_app.config.get('OPENAI_API_KEY'))
+
+    @classmethod
+    def _request_body(cls, prompt: str, max_tokens: int = MAX_TOKENS) -> dict:
+        return {
+            "model": cls.model_name(),
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": cls.temperature,
+            "max_tokens": max_tokens
+        }
 
-class OpenAIService:
-    @staticmethod
-    def generate_seo_description(product_id: int, keywords: list = None) -> tuple:
-        """
-        Generate an SEO-optimized description for a product using OpenAI
-        Returns: (success: bool, message: str, data: dict)
-        """
-        try:
-            # Get product details
-            product = Product.query.get(product_id)
-            if not product:
-                return False, "Product not found", None
-            
-            # Prepare prompt for OpenAI
-            prompt = f"""
-            Create an SEO-optimized product description for the following product:
-            
-            Product Title: {product.title}
-            Original Description: {product.description or 'No description available'}
-            
-            The description should:
-            1. Be engaging and persuasive
-            2. Include relevant keywords naturally
-            3. Be between 150-300 words
-            4. Highlight key features and benefits
-            5. Include a call to action
-            6. Be formatted with appropriate HTML tags for Shopify
-            
-            Keywords to include: {', '.join(keywords) if keywords else 'Use relevant keywords based on the product'}
-            """
-            
-            # Call OpenAI API
-            response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {current_app.config['OPENAI_API_KEY']}",
-                    "Content-Type": "application/json",
-                    "OpenAI-Beta": "assistants=v1"
-                },
-                json={
-                    "model": current_app.config['OPENAI_MODEL'],
-                    "messages": [
-                        {"role": "system", "content": "You are an expert SEO copywriter specializing in e-commerce product descriptions."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    "temperature": 0.7,
-                    "max_tokens": 1000
-                }
-            )
-            
-            if response.status_code != 200:
-                current_app.logger.error(f"Error calling OpenAI API: {response.text}")
-                return False, f"Error generating description: {response.status_code}", None
-            
-            # Extract the generated description
-            result = response.json()
-            generated_description = result['choices'][0]['message']['content']
-            
-            return True, "Description generated successfully", {
-                'product_id': product_id,
-                'optimized_description': generated_description
-            }
-            
-        except Exception as e:
-            current_app.logger.error(f"Error in generate_seo_description: {str(e)}")
-            return False, f"Error generating description: {str(e)}", None
-    
     @staticmethod
-    def generate_bulk_seo_descriptions(product_ids: list, keywords: dict = None) -> tuple:
-        """
-        Generate SEO-optimized descriptions for multiple products
-        Returns: (success: bool, message: str, data: list)
-        """
-        try:
-            results = []
-            success_count = 0
-            error_count = 0
-            
-            for product_id in product_ids:
-                # Get product-specific keywords if available
-                product_keywords = keywords.get(product_id, []) if keywords else None
-                
-                # Generate description for this product
-                success, message, data = OpenAIService.generate_seo_description(
-                    product_id=product_id,
-                    keywords=product_keywords
-                )
-                
-                if success:
-                    results.append(data)
-                    success_count += 1
-                else:
-                    results.append({
-                        'product_id': product_id,
-                        'error': message
-                    })
-                    error_count += 1
-            
-            return True, f"Generated {success_count} descriptions, {error_count} errors", results
-            
-        except Exception as e:
-            current_app.logger.error(f"Error in generate_bulk_seo_descriptions: {str(e)}")
-            return False, f"Error generating bulk descriptions: {str(e)}", [] 
\ No newline at end of file
+    def _auth_headers() -> dict:
+        return {"Authorization": f"Bearer {current_app.config['OPENAI_API_KEY']}"}
+
+    @classmethod
+    def _post(cls, body: dict, timeout: float, stream: bool = False):
+        response = LLMClientRegistry.get_openai_session().post(
+            f"{current_app.config['OPENAI_API_BASE']}/chat/completions",
+            headers={**cls._auth_headers(), "Content-Type": "application/json"},
+            json=body,
+            timeout=timeout,
+            stream=stream
+        )
+        if response.status_code != 200:
+            current_app.logger.error(f"Error calling OpenAI API: {response.text}")
+            raise LLMProviderError(f"{response.status_code}", response.status_code)
+        return response
+
+    @classmethod
+    def _complete(cls, prompt: str, max_tokens: int = MAX_TOKENS, json_output: bool = False) -> tuple:
+        body = cls._request_body(prompt, max_tokens)
+        if json_output:
+            body["response_format"] = {"type": "json_object"}
+        # Larger answers take longer, scale the timeout with the tokens asked for
+        timeout = current_app.config['LLM_ITEM_TIMEOUT'] * max(max_tokens // MAX_TOKENS, 1)
+        result = cls._post(body, timeout).json()
+        usage = result.get('usage')
+        return result['choices'][0]['message']['content'], {
+            'prompt_tokens': usage['prompt_tokens'],
+            'completion_tokens': usage['completion_tokens']
+        } if usage else None
+
+    @classmethod
+    def _stream_completion(cls, prompt: str) -> Iterator[str]:
+        response = cls._post(dict(cls._request_body(prompt), stream=True),
+                             current_app.config['LLM_ITEM_TIMEOUT'], stream=True)
+
+        def chunks():
+            with response:
+                # Server-sent events, one "data: {json}" line per delta and "data: [DONE]" at the end
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data: '):
+                        continue
+                    if line == 'data: [DONE]':
+                        break
+                    choices = json.loads(line[len('data: '):]).get('choices') or [{}]
+                    text = choices[0].get('delta', {}).get('content')
+                    if text:
+                        yield text
+
+        return chunks()
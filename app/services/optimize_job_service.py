@@ -0,0 +1,318 @@
+import json
+import math
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+from flask import current_app
+from app import redis_obj
+from app.services.llm_router import LLMRouter
+from app.services.openai_batch_service import OpenAIBatchService
+from app.services.openai_service import OpenAIService
+from app.services.product_service import ProductService
+from app.services.task_queue import enqueue_task
+
+# Finished jobs and their results stay queryable for a week
+OPTIMIZE_JOB_TTL = 7 * 24 * 3600
+# realtime jobs call the LLM providers per product, batch jobs go through the OpenAI Batch API
+OPTIMIZE_JOB_MODES = ('realtime', 'batch')
+
+# Mark a product done and append its result in one step, unless it was done
+# already, and renew the job's lease.
+# KEYS: done set, results list, counts hash, lease. ARGV: product id, result, count field, TTL, lease seconds
+RECORD_RESULT_SCRIPT = """
+redis.call('SET', KEYS[4], 1, 'PX', math.ceil(tonumber(ARGV[5]) * 1000))
+if redis.call('SADD', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('RPUSH', KEYS[2], ARGV[2])
+redis.call('HINCRBY', KEYS[3], ARGV[3], 1)
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ARGV[4])
+end
+return 1
+"""
+
+
+class OptimizeJobService:
+    """
+    Bulk optimizations run as celery jobs. Every description is saved as soon
+    as it is generated and its result appended to a Redis list, so clients
+    can follow the counts and page through finished results while the job runs.
+    Batch mode jobs keep the state of their OpenAI batches in the job, so a
+    failed or redelivered job resumes the batches it already submitted.
+    """
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"product_optimize_job:{job_id}"
+
+    @staticmethod
+    def _counts_key(job_id: str) -> str:
+        return f"product_optimize_job:{job_id}:counts"
+
+    @staticmethod
+    def _results_key(job_id: str) -> str:
+        return f"product_optimize_job:{job_id}:results"
+
+    @staticmethod
+    def _done_key(job_id: str) -> str:
+        return f"product_optimize_job:{job_id}:done"
+
+    @staticmethod
+    def _lease_key(job_id: str) -> str:
+        return f"product_optimize_job:{job_id}:lease"
+
+    @staticmethod
+    def _renew_lease(job_id: str, seconds: float = None):
+        """
+        Mark a job as alive for seconds, OPTIMIZE_JOB_LEASE by default
+        """
+        seconds = seconds or current_app.config['OPTIMIZE_JOB_LEASE']
+        redis_obj.psetex(OptimizeJobService._lease_key(job_id), math.ceil(seconds * 1000), 1)
+
+    @staticmethod
+    def _save_job(job: dict):
+        redis_obj.setex(OptimizeJobService._job_key(job['id']), OPTIMIZE_JOB_TTL, json.dumps(job))
+
+    @staticmethod
+    def _load_job(job_id: str) -> Optional[dict]:
+        stored_job = redis_obj.get(OptimizeJobService._job_key(job_id))
+        return json.loads(stored_job) if stored_job else None
+
+    @staticmethod
+    def _update_job(job_id: str, **fields) -> Optional[dict]:
+        job = OptimizeJobService._load_job(job_id)
+        if not job:
+            return None
+        job.update(fields)
+        OptimizeJobService._save_job(job)
+        return job
+
+    @staticmethod
+    def _record_result(job_id: str, result: dict, created_after: datetime = None):
+        """
+        Save a generated description and append the product's result to the job.
+        The product is only marked done once its description is saved, and a
+        save repeated by a redelivered job returns the draft saved before
+        (drafts since created_after) instead of a duplicate.
+        """
+        product_id = int(result['product_id'])
+        if redis_obj.sismember(OptimizeJobService._done_key(job_id), product_id):
+            return
+        if 'error' not in result:
+            success, message, saved_description = ProductService.create_optimized_description(
+                product_id=product_id,
+                optimized_description=result['optimized_description'],
+                prompt_tokens=result.get('prompt_tokens'),
+                completion_tokens=result.get('completion_tokens'),
+                created_after=created_after
+            )
+            result = saved_description if success else {'product_id': product_id, 'error': message}
+
+        # A product is only recorded once, even when a redelivered job runs it again
+        redis_obj.eval(
+            RECORD_RESULT_SCRIPT, 4,
+            OptimizeJobService._done_key(job_id), OptimizeJobService._results_key(job_id),
+            OptimizeJobService._counts_key(job_id), OptimizeJobService._lease_key(job_id),
+            product_id, json.dumps(result), 'failed' if 'error' in result else 'completed', OPTIMIZE_JOB_TTL,
+            current_app.config['OPTIMIZE_JOB_LEASE']
+        )
+
+    @staticmethod
+    def _product_keywords(product_ids: list, keywords: list = None) -> Optional[dict]:
+        """
+        The job's keywords, shared by every product, in the per product form of bulk generation
+        """
+        return {product_id: keywords for product_id in product_ids} if keywords else None
+
+    @staticmethod
+    def estimate_optimize_job(product_ids: list, keywords: list = None) -> tuple:
+        """
+        Estimate the LLM tokens a bulk optimization of the products would use, without running it
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            product_ids = list(dict.fromkeys(product_ids))
+            keywords = OptimizeJobService._product_keywords(product_ids, keywords)
+            return True, "Bulk optimization estimated", LLMRouter.estimate_bulk_usage(product_ids, keywords)
+        except Exception as e:
+            current_app.logger.error(f"Error estimating bulk optimization job: {str(e)}")
+            return False, f"Error estimating bulk optimization: {str(e)}", None
+
+    @staticmethod
+    def start_optimize_job(user_id: int, product_ids: list, keywords: list = None, regenerate: bool = False,
+                           mode: str = 'realtime') -> tuple:
+        """
+        Queue the optimization of a list of products
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            if mode not in OPTIMIZE_JOB_MODES:
+                return False, f"Unknown mode {mode}, expected one of {', '.join(OPTIMIZE_JOB_MODES)}", None
+            if mode == 'batch' and not OpenAIService.is_configured():
+                return False, "Batch mode needs the OpenAI API key to be configured", None
+            try:
+                # Stored as ints, like the done set is read back, so resumed runs match them
+                product_ids = list(dict.fromkeys(int(product_id) for product_id in product_ids))
+            except (TypeError, ValueError):
+                return False, "Product IDs must be integers", None
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'user_id': user_id,
+                'product_ids': product_ids,
+                'keywords': keywords,
+                'regenerate': regenerate,
+                'mode': mode,
+                'openai_batch': None,
+                'status': 'queued',
+                'error': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None
+            }
+            OptimizeJobService._save_job(job)
+            enqueue_task('bulk_optimize_products', job['id'])
+
+            return True, "Bulk optimization started", OptimizeJobService.job_to_dict(job)
+        except Exception as e:
+            current_app.logger.error(f"Error starting bulk optimization job: {str(e)}")
+            return False, f"Error starting bulk optimization: {str(e)}", None
+
+    @staticmethod
+    def run_optimize_job(job_id: str) -> dict:
+        """
+        Generate and save the descriptions of a queued job, skipping products
+        an earlier, interrupted run of the same job already finished. A batch
+        mode job whose batches are still running queues itself again to check
+        on them later
+        Returns: the finished job, or the waiting one
+        """
+        job = OptimizeJobService._load_job(job_id)
+        if not job:
+            raise ValueError(f"Optimize job {job_id} not found")
+
+        OptimizeJobService._renew_lease(job_id)
+        job = OptimizeJobService._update_job(job_id, status='running', started_at=job['started_at'] or time.time())
+        done = {int(product_id) for product_id in redis_obj.smembers(OptimizeJobService._done_key(job_id))}
+        product_ids = [product_id for product_id in map(int, job['product_ids']) if product_id not in done]
+        created_after = datetime.utcfromtimestamp(job['created_at'])
+        keywords = OptimizeJobService._product_keywords(product_ids, job['keywords'])
+        if job.get('mode') == 'batch':
+            success, message, state = OpenAIBatchService.run(
+                product_ids=product_ids,
+                keywords=keywords,
+                regenerate=job['regenerate'],
+                state=job.get('openai_batch'),
+                on_result=lambda result: OptimizeJobService._record_result(job_id, result, created_after),
+                on_state=lambda state: OptimizeJobService._update_job(job_id, openai_batch=state),
+                wait=False
+            )
+            if success and not state['finished']:
+                # Batches take hours, the job checks on them again later instead of holding a worker
+                poll_interval = current_app.config['OPENAI_BATCH_POLL_INTERVAL']
+                OptimizeJobService._renew_lease(job_id, poll_interval + current_app.config['OPTIMIZE_JOB_LEASE'])
+                enqueue_task('bulk_optimize_products', job_id, countdown=poll_interval)
+                return OptimizeJobService._update_job(job_id, status='waiting')
+        else:
+            success, message, _ = LLMRouter.generate_bulk_seo_descriptions(
+                product_ids=product_ids,
+                keywords=keywords,
+                on_result=lambda result: OptimizeJobService._record_result(job_id, result, created_after),
+                regenerate=job['regenerate']
+            )
+
+        redis_obj.delete(OptimizeJobService._lease_key(job_id))
+        return OptimizeJobService._update_job(
+            job_id,
+            status='completed' if success else 'failed',
+            error=None if success else message,
+            finished_at=time.time()
+        )
+
+    @staticmethod
+    def job_to_dict(job: dict) -> dict:
+        """
+        Public view of a job with its completed, failed and pending counts
+        """
+        counts = redis_obj.hgetall(OptimizeJobService._counts_key(job['id']))
+        completed = int(counts.get('completed', 0))
+        failed = int(counts.get('failed', 0))
+
+        return {
+            'id': job['id'],
+            'mode': job.get('mode', 'realtime'),
+            'status': job['status'],
+            'total': len(job['product_ids']),
+            'completed': completed,
+            'failed': failed,
+            'pending': len(job['product_ids']) - completed - failed,
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+
+    @staticmethod
+    def resume_optimize_job(job_id: str, user_id: int) -> tuple:
+        """
+        Queue a failed job again, or a running or waiting one whose worker
+        stopped renewing its lease (it died, or the check of a waiting batch
+        job was lost). Products it already finished are skipped and a batch
+        mode job picks up the OpenAI batches it had submitted.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            job = OptimizeJobService._load_job(job_id)
+            if not job or job['user_id'] != user_id:
+                return False, "Bulk optimization job not found", None
+            if job['status'] in ('running', 'waiting'):
+                if redis_obj.exists(OptimizeJobService._lease_key(job_id)):
+                    return False, f"The job is still {job['status']}", None
+            elif job['status'] != 'failed':
+                return False, f"Only failed or stalled jobs can be resumed, this one is {job['status']}", None
+
+            job = OptimizeJobService._update_job(job_id, status='queued', error=None, finished_at=None)
+            enqueue_task('bulk_optimize_products', job_id)
+
+            return True, "Bulk optimization resumed", OptimizeJobService.job_to_dict(job)
+        except Exception as e:
+            current_app.logger.error(f"Error resuming bulk optimization job: {str(e)}")
+            return False, f"Error resuming bulk optimization: {str(e)}", None
+
+    @staticmethod
+    def get_optimize_job(job_id: str, user_id: int) -> Optional[dict]:
+        """
+        Get a bulk optimization job of a user by id
+        """
+        try:
+            job = OptimizeJobService._load_job(job_id)
+            if not job or job['user_id'] != user_id:
+                return None
+            return OptimizeJobService.job_to_dict(job)
+        except Exception as e:
+            current_app.logger.error(f"Error getting optimize job: {str(e)}")
+            return None
+
+    @staticmethod
+    def get_optimize_job_results(job_id: str, user_id: int, page: int = 1, per_page: int = 20) -> tuple:
+        """
+        Page through the results a job has finished so far, in completion order
+        Returns: (results: list, total: int, pages: int), or (None, 0, 0) for an unknown job
+        """
+        try:
+            job = OptimizeJobService._load_job(job_id)
+            if not job or job['user_id'] != user_id:
+                return None, 0, 0
+
+            total = redis_obj.llen(OptimizeJobService._results_key(job_id))
+            start = (page - 1) * per_page
+            results = [
+                json.loads(result) for result in
+                redis_obj.lrange(OptimizeJobService._results_key(job_id), start, start + per_page - 1)
+            ]
+            return results, total, math.ceil(total / per_page)
+        except Exception as e:
+            current_app.logger.error(f"Error getting optimize job results: {str(e)}")
+            return None, 0, 0
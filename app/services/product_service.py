@@ -1,13 +1,41 @@
-import requests
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlparse, parse_qs
 from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
 from app import db
 from app.models.product import Product
+from app.models.store import Store
 from app.models.optimized_description import OptimizedDescription, DescriptionStatus
 from app.services.store_service import StoreService
 from app.services.crud import CRUD
-from datetime import datetime
+from app.services.custom_errors import ShopifyAPIError
+from app.services.shopify_client import ShopifyClient
+from app.services.sync_checkpoint import SyncCheckpoint
+from app.services.utils import iter_json_array_items
+from datetime import datetime, timedelta
 import pytz
 
+# Product columns that make up the content fingerprint of a synced product
+FINGERPRINT_PRODUCT_COLUMNS = ('title', 'description', 'vendor', 'product_type', 'handle', 'status')
+
+# Product columns that are overwritten from Shopify on every sync
+SYNCED_PRODUCT_COLUMNS = FINGERPRINT_PRODUCT_COLUMNS + ('shopify_updated_at', 'content_hash')
+
+# Shopify product fields read by _product_data_from_shopify, requested with fields= so
+# variants, images and options are never sent over the wire
+SHOPIFY_PRODUCT_FIELDS = 'id,title,body_html,vendor,product_type,handle,status,created_at,updated_at'
+
+# Most ids Shopify accepts in one products.json?ids= call
+SHOPIFY_IDS_PER_REQUEST = 250
+
+# Bytes read from the socket at a time while decoding a products page
+PRODUCT_PAGE_READ_SIZE = 64 * 1024
+
+
 class ProductService:
     @staticmethod
     def _convert_shopify_datetime(datetime_str: str) -> datetime:
@@ -25,83 +53,471 @@ class ProductService:
             return None
 
     @staticmethod
-    def fetch_products_from_shopify(store_id: int, limit: int = 250) -> tuple:
+    def _parse_next_page_info(link_header: str) -> Optional[str]:
         """
-        Fetch products from Shopify for a specific store
-        Returns: (success: bool, message: str, data: list)
+        Extract the page_info cursor of the rel="next" entry from a Shopify Link header
+        """
+        if not link_header:
+            return None
+        for link in link_header.split(','):
+            url_part, _, rel_part = link.partition(';')
+            if 'rel="next"' not in rel_part:
+                continue
+            query = urlparse(url_part.strip().strip('<>')).query
+            return parse_qs(query).get('page_info', [None])[0]
+        return None
+
+    @staticmethod
+    def _read_shopify_products(response) -> list:
+        """
+        Decode the products of a streamed products.json response product by
+        product as the body arrives, instead of buffering the whole body and
+        building its parse tree
         """
         try:
-            # Get store details
-            store = StoreService.get_store_by_id(store_id)
-            if not store:
-                return False, "Store not found", []
-            
-            # Prepare Shopify API request
-            headers = {
-                'X-Shopify-Access-Token': store.access_token,
-                'Content-Type': 'application/json'
-            }
-            
-            # Fetch products from Shopify
-            response = requests.get(
-                f"https://{store.store_url}/admin/api/2024-01/products.json?limit={limit}",
-                headers=headers
-            )
-            
+            return list(iter_json_array_items(response.iter_content(PRODUCT_PAGE_READ_SIZE), 'products'))
+        finally:
+            response.close()
+
+    @staticmethod
+    def _iter_shopify_product_pages(store: Store, limit: int = 250, updated_at_min: Optional[datetime] = None,
+                                    page_info: Optional[str] = None) -> Iterator[tuple]:
+        """
+        Walk the store's catalog following Link header page_info cursors,
+        restricted to products updated since updated_at_min when it is given.
+        Starts from the given page_info cursor when resuming a sync.
+        Yields: (products: list, elapsed: float, next_page_info: str) for every page as soon as it arrives
+        """
+        client = ShopifyClient.for_store(store)
+        # Shopify rejects any filter other than limit and fields once a page_info cursor is sent
+        params = {'limit': limit, 'fields': SHOPIFY_PRODUCT_FIELDS}
+        if page_info:
+            params['page_info'] = page_info
+        elif updated_at_min:
+            params['updated_at_min'] = updated_at_min.isoformat()
+
+        while True:
+            started = time.monotonic()
+            response = client.get('products.json', params=params, stream=True)
+
             if response.status_code != 200:
                 current_app.logger.error(f"Error fetching products from Shopify: {response.text}")
-                return False, f"Error fetching products: {response.status_code}", []
-            
-            shopify_products = response.json().get('products', [])
-            
-            # Process and store products
-            products_added = 0
-            products_updated = 0
-            
-            for shopify_product in shopify_products:
-                # Check if product already exists
-                existing_product = Product.query.filter_by(
-                    store_id=store_id,
-                    shopify_product_id=shopify_product['id']
-                ).first()
-                
-                if existing_product:
-                    # Update existing product
-                    product_data = {
-                        'title': shopify_product['title'],
-                        'description': shopify_product.get('body_html', ''),
-                        'vendor': shopify_product.get('vendor', ''),
-                        'product_type': shopify_product.get('product_type', ''),
-                        'handle': shopify_product.get('handle', ''),
-                        'status': shopify_product.get('status', 'active'),
-                        'shopify_updated_at': ProductService._convert_shopify_datetime(shopify_product.get('updated_at'))
-                    }
-                    CRUD.update(Product, {'id': existing_product.id}, product_data)
-                    products_updated += 1
+                raise ShopifyAPIError(f"Error fetching products: {response.status_code}", response.status_code)
+
+            page_info = ProductService._parse_next_page_info(response.headers.get('Link'))
+            yield ProductService._read_shopify_products(response), time.monotonic() - started, page_info
+
+            if not page_info:
+                return
+            params = {'limit': limit, 'fields': SHOPIFY_PRODUCT_FIELDS, 'page_info': page_info}
+
+    @staticmethod
+    def _iter_shopify_product_id_range(store: Store, since_id: int, max_id: Optional[int] = None,
+                                       limit: int = 250, updated_at_min: Optional[datetime] = None) -> Iterator[tuple]:
+        """
+        Walk the products with since_id < id < max_id in ascending id order using
+        since_id paging, so independent id ranges can be fetched in parallel
+        Yields: (products: list, elapsed: float) for every page as soon as it arrives
+        """
+        client = ShopifyClient.for_store(store)
+        while True:
+            started = time.monotonic()
+            params = {'limit': limit, 'fields': SHOPIFY_PRODUCT_FIELDS, 'since_id': since_id}
+            if updated_at_min:
+                params['updated_at_min'] = updated_at_min.isoformat()
+            response = client.get('products.json', params=params, stream=True)
+
+            if response.status_code != 200:
+                current_app.logger.error(f"Error fetching products from Shopify: {response.text}")
+                raise ShopifyAPIError(f"Error fetching products: {response.status_code}", response.status_code)
+
+            shopify_products = ProductService._read_shopify_products(response)
+            in_range = [
+                shopify_product for shopify_product in shopify_products
+                if max_id is None or shopify_product['id'] < max_id
+            ]
+            if in_range:
+                yield in_range, time.monotonic() - started
+
+            if len(shopify_products) < limit or len(in_range) < len(shopify_products):
+                return
+            since_id = shopify_products[-1]['id']
+
+    @staticmethod
+    def _fetch_shopify_products_by_ids(app, store: Store, shopify_product_ids: list) -> list:
+        """
+        Fetch up to SHOPIFY_IDS_PER_REQUEST products in one products.json?ids= call,
+        run on a worker thread so it gets its own app context
+        """
+        with app.app_context():
+            response = ShopifyClient.for_store(store).get('products.json', params={
+                'ids': ','.join(str(shopify_product_id) for shopify_product_id in shopify_product_ids),
+                'limit': SHOPIFY_IDS_PER_REQUEST,
+                'fields': SHOPIFY_PRODUCT_FIELDS
+            }, stream=True)
+
+            if response.status_code != 200:
+                current_app.logger.error(f"Error fetching products from Shopify: {response.text}")
+                raise ShopifyAPIError(f"Error fetching products: {response.status_code}", response.status_code)
+            return ProductService._read_shopify_products(response)
+
+    @staticmethod
+    def _product_fingerprint(product_data: dict) -> str:
+        """
+        Compact hash of the synced content fields of a product
+        """
+        content = '\x1f'.join(str(product_data.get(column) or '') for column in FINGERPRINT_PRODUCT_COLUMNS)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _product_data_from_shopify(shopify_product: dict) -> dict:
+        """
+        Map a Shopify product payload onto Product columns
+        """
+        product_data = {
+            'title': shopify_product['title'],
+            'description': shopify_product.get('body_html', ''),
+            'vendor': shopify_product.get('vendor', ''),
+            'product_type': shopify_product.get('product_type', ''),
+            'handle': shopify_product.get('handle', ''),
+            'status': shopify_product.get('status', 'active'),
+            'shopify_updated_at': ProductService._convert_shopify_datetime(shopify_product.get('updated_at'))
+        }
+        product_data['content_hash'] = ProductService._product_fingerprint(product_data)
+        return product_data
+
+    @staticmethod
+    def _load_existing_products(store_id: int, shopify_product_ids: list = None) -> dict:
+        """
+        Map shopify_product_id -> (local product id, content hash) for a whole store,
+        or only for the given Shopify ids, in a single query
+        """
+        rows = db.session.query(Product.shopify_product_id, Product.id, Product.content_hash).filter(
+            Product.store_id == store_id
+        )
+        if shopify_product_ids is not None:
+            rows = rows.filter(Product.shopify_product_id.in_(shopify_product_ids))
+        return {shopify_product_id: (product_id, content_hash) for shopify_product_id, product_id, content_hash in rows}
+
+    @staticmethod
+    def _insert_products(rows: list):
+        """
+        Insert a chunk of products with one executemany statement.
+        On dialects with INSERT ... ON CONFLICT a row created concurrently by
+        another sync is updated instead of failing the whole chunk.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            db.session.execute(insert(Product.__table__), rows)
+            return
+
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = dialect_insert(Product.__table__)
+        statement = statement.on_conflict_do_update(
+            index_elements=['store_id', 'shopify_product_id'],
+            set_={column: statement.excluded[column] for column in SYNCED_PRODUCT_COLUMNS + ('updated_at',)}
+        )
+        db.session.execute(statement, rows)
+
+    @staticmethod
+    def _upsert_products(store_id: int, shopify_products: list, existing_products: dict, chunk_size: int) -> tuple:
+        """
+        Bulk upsert Shopify products, committing once per chunk.
+        existing_products is the preloaded shopify_product_id -> (id, content hash)
+        map and is kept up to date with the rows written here. Products whose
+        content hash did not change are not written at all.
+        Returns: (added: int, updated: int, unchanged: int)
+        """
+        products_added = 0
+        products_updated = 0
+        products_unchanged = 0
+
+        for offset in range(0, len(shopify_products), chunk_size):
+            inserts = {}
+            updates = {}
+            for shopify_product in shopify_products[offset:offset + chunk_size]:
+                product_data = ProductService._product_data_from_shopify(shopify_product)
+                product_id, content_hash = existing_products.get(shopify_product['id'], (None, None))
+                if product_id and content_hash == product_data['content_hash']:
+                    products_unchanged += 1
+                elif product_id:
+                    product_data['id'] = product_id
+                    updates[shopify_product['id']] = product_data
                 else:
-                    # Create new product
-                    product_data = {
+                    product_data.update({
                         'store_id': store_id,
                         'shopify_product_id': shopify_product['id'],
-                        'title': shopify_product['title'],
-                        'description': shopify_product.get('body_html', ''),
-                        'vendor': shopify_product.get('vendor', ''),
-                        'product_type': shopify_product.get('product_type', ''),
-                        'handle': shopify_product.get('handle', ''),
-                        'status': shopify_product.get('status', 'active'),
-                        'shopify_created_at': ProductService._convert_shopify_datetime(shopify_product.get('created_at')),
-                        'shopify_updated_at': ProductService._convert_shopify_datetime(shopify_product.get('updated_at'))
-                    }
-                    CRUD.create(Product, product_data)
-                    products_added += 1
-            
-            return True, f"Products synced successfully. Added: {products_added}, Updated: {products_updated}", {
+                        'shopify_created_at': ProductService._convert_shopify_datetime(shopify_product.get('created_at'))
+                    })
+                    inserts[shopify_product['id']] = product_data
+
+            if not inserts and not updates:
+                continue
+            if inserts:
+                ProductService._insert_products(list(inserts.values()))
+            if updates:
+                db.session.execute(update(Product), list(updates.values()))
+            CRUD.db_commit()
+
+            for shopify_product_id, product_data in updates.items():
+                existing_products[shopify_product_id] = (product_data['id'], product_data['content_hash'])
+            if inserts:
+                existing_products.update(
+                    (shopify_product_id, (product_id, content_hash))
+                    for shopify_product_id, product_id, content_hash in db.session.query(
+                        Product.shopify_product_id, Product.id, Product.content_hash
+                    ).filter(
+                        Product.store_id == store_id,
+                        Product.shopify_product_id.in_(list(inserts))
+                    )
+                )
+            products_added += len(inserts)
+            products_updated += len(updates)
+
+        return products_added, products_updated, products_unchanged
+
+    @staticmethod
+    def _get_sync_watermark(store: Store) -> Optional[datetime]:
+        """
+        Get the store's sync watermark as an aware UTC datetime
+        """
+        if not store.sync_watermark:
+            return None
+        if store.sync_watermark.tzinfo is None:
+            return store.sync_watermark.replace(tzinfo=pytz.UTC)
+        return store.sync_watermark
+
+    @staticmethod
+    def _advance_watermark(watermark: Optional[datetime], shopify_products: list) -> Optional[datetime]:
+        """
+        Highest of the current watermark and the updated_at of the given Shopify products
+        """
+        return max(filter(None, [watermark] + [
+            ProductService._convert_shopify_datetime(shopify_product.get('updated_at'))
+            for shopify_product in shopify_products
+        ]), default=None)
+
+    @staticmethod
+    def _final_watermark(new_watermark: Optional[datetime], sync_started_at: datetime) -> Optional[datetime]:
+        """
+        Watermark to store once a sync that started at sync_started_at has
+        finished: the highest updated_at it saw, but never past its start
+        minus SHOPIFY_SYNC_WATERMARK_MARGIN. A product edited while the sync
+        ran, after its page was fetched, is then fetched again by the next sync.
+        """
+        if new_watermark is None:
+            return None
+        return min(new_watermark,
+                   sync_started_at - timedelta(seconds=current_app.config['SHOPIFY_SYNC_WATERMARK_MARGIN']))
+
+    @staticmethod
+    def count_shopify_products(store: Store, updated_at_min: Optional[datetime] = None) -> Optional[int]:
+        """
+        Number of products a sync from updated_at_min will fetch, None when Shopify cannot tell
+        """
+        params = {'updated_at_min': updated_at_min.isoformat()} if updated_at_min else {}
+        response = ShopifyClient.for_store(store).get('products/count.json', params=params)
+        if response.status_code != 200:
+            current_app.logger.error(f"Error counting Shopify products: {response.text}")
+            return None
+        return response.json().get('count')
+
+    @staticmethod
+    def fetch_products_from_shopify(store_id: int, limit: int = 250, full_resync: bool = False,
+                                    progress_callback: Callable[[dict], None] = None,
+                                    lock_owner: str = None) -> tuple:
+        """
+        Fetch products from Shopify for a specific store.
+        Only products updated since the store's sync watermark are requested
+        unless full_resync is set or the store has never been synced.
+        Pages are processed one at a time as they arrive, so memory use does
+        not grow with the size of the catalog. progress_callback, when given,
+        receives the running totals after every page.
+        A checkpoint is saved after every stored page; a sync with the same
+        full_resync setting resumes from the checkpoint of an interrupted one.
+        A sync of a store that is already being synced is refused, unless
+        lock_owner (a sync job id) is the one holding its lock.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        lock_token = None
+        try:
+            # Get store details
+            store = StoreService.get_store_by_id(store_id)
+            if not store:
+                return False, "Store not found", []
+
+            lock_token = SyncCheckpoint.acquire_lock(store_id, lock_owner)
+            if lock_token is None:
+                return False, "A product sync of this store is already running", []
+
+            sync_started = time.monotonic()
+            chunk_size = current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+            existing_products = ProductService._load_existing_products(store_id)
+            checkpoint = SyncCheckpoint.load(store_id, 'rest')
+            if not checkpoint or checkpoint['full_resync'] != full_resync:
+                watermark = None if full_resync else ProductService._get_sync_watermark(store)
+                checkpoint = {
+                    'full_resync': full_resync,
+                    'started_at': datetime.now(pytz.UTC).isoformat(),
+                    'page_info': None,
+                    'watermark': watermark.isoformat() if watermark else None,
+                    'new_watermark': watermark.isoformat() if watermark else None,
+                    'pages': 0,
+                    'products_seen': 0,
+                    'added': 0,
+                    'updated': 0,
+                    'unchanged': 0
+                }
+            else:
+                current_app.logger.info(f"Resuming product sync of store {store_id} after page {checkpoint['pages']}")
+
+            watermark = datetime.fromisoformat(checkpoint['watermark']) if checkpoint['watermark'] else None
+            new_watermark = datetime.fromisoformat(checkpoint['new_watermark']) if checkpoint['new_watermark'] else None
+            resumed_pages = checkpoint['pages']
+            products_added = checkpoint['added']
+            products_updated = checkpoint['updated']
+            products_unchanged = checkpoint['unchanged']
+            products_seen = checkpoint['products_seen']
+            page_stats = []
+
+            # Saved after the last page: every page is stored, only the watermark and clearing are left
+            if resumed_pages and checkpoint['page_info'] is None:
+                current_app.logger.info(f"Finalizing product sync of store {store_id}, all pages were stored")
+                pages = iter(())
+            else:
+                pages = ProductService._iter_shopify_product_pages(store, limit, watermark, checkpoint['page_info'])
+
+            for page_number, (shopify_products, fetch_elapsed, next_page_info) in enumerate(pages,
+                                                                                             start=resumed_pages + 1):
+                page_started = time.monotonic()
+                added, updated, unchanged = ProductService._upsert_products(
+                    store_id, shopify_products, existing_products, chunk_size
+                )
+
+                products_added += added
+                products_updated += updated
+                products_unchanged += unchanged
+                products_seen += len(shopify_products)
+                new_watermark = ProductService._advance_watermark(new_watermark, shopify_products)
+                page_stats.append({
+                    'page': page_number,
+                    'products': len(shopify_products),
+                    'elapsed': round(fetch_elapsed + time.monotonic() - page_started, 3)
+                })
+                checkpoint.update({
+                    'page_info': next_page_info,
+                    'new_watermark': new_watermark.isoformat() if new_watermark else None,
+                    'pages': page_number,
+                    'products_seen': products_seen,
+                    'added': products_added,
+                    'updated': products_updated,
+                    'unchanged': products_unchanged
+                })
+                SyncCheckpoint.save(store_id, 'rest', checkpoint, lock_token)
+                if progress_callback:
+                    progress_callback({
+                        'pages': page_number,
+                        'products_seen': products_seen,
+                        'rows_written': products_added + products_updated
+                    })
+
+            # Pages are not ordered by updated_at, so the watermark only moves once every page is stored
+            new_watermark = ProductService._final_watermark(new_watermark, datetime.fromisoformat(
+                checkpoint.get('started_at') or datetime.now(pytz.UTC).isoformat()
+            ))
+            if new_watermark and new_watermark != watermark:
+                CRUD.update(Store, {'id': store_id}, {'sync_watermark': new_watermark})
+            SyncCheckpoint.clear(store_id, 'rest')
+
+            return True, (f"Products synced successfully. Added: {products_added}, Updated: {products_updated}, "
+                          f"Unchanged: {products_unchanged}"), {
                 'added': products_added,
-                'updated': products_updated
+                'updated': products_updated,
+                'unchanged': products_unchanged,
+                'full_resync': watermark is None,
+                'watermark': new_watermark.isoformat() if new_watermark else None,
+                'resumed_from_page': resumed_pages or None,
+                'pages': resumed_pages + len(page_stats),
+                'products_seen': products_seen,
+                'elapsed': round(time.monotonic() - sync_started, 3),
+                'page_stats': page_stats
             }
+        except ShopifyAPIError as e:
+            # Shopify answers 400 to a page_info cursor it no longer accepts, start over next time
+            if e.status == 400:
+                SyncCheckpoint.clear(store_id, 'rest')
+            return False, e.message, []
         except Exception as e:
+            db.session.rollback()
             current_app.logger.error(f"Error syncing products: {str(e)}")
             return False, f"Error syncing products: {str(e)}", []
+        finally:
+            SyncCheckpoint.release_lock(store_id, lock_token)
+
+    @staticmethod
+    def refresh_products(store_id: int, product_ids: list) -> tuple:
+        """
+        Re-fetch the given local products from Shopify and apply the changes
+        through the sync upsert, without syncing the rest of the store.
+        Ids are fetched SHOPIFY_IDS_PER_REQUEST per call, with the calls run
+        concurrently inside the store's shared rate limit bucket.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            store = StoreService.get_store_by_id(store_id)
+            if not store:
+                return False, "Store not found", None
+
+            products = db.session.query(Product.id, Product.shopify_product_id).filter(
+                Product.store_id == store_id,
+                Product.id.in_(product_ids)
+            ).all()
+            product_ids_by_shopify_id = {shopify_product_id: product_id for product_id, shopify_product_id in products}
+            shopify_product_ids = list(product_ids_by_shopify_id)
+            batches = [
+                shopify_product_ids[offset:offset + SHOPIFY_IDS_PER_REQUEST]
+                for offset in range(0, len(shopify_product_ids), SHOPIFY_IDS_PER_REQUEST)
+            ]
+
+            shopify_products = []
+            if batches:
+                app = current_app._get_current_object()
+                max_workers = min(current_app.config['SHOPIFY_REFRESH_CONCURRENCY'], len(batches))
+                with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='product-refresh') as executor:
+                    for batch_products in executor.map(
+                            lambda batch: ProductService._fetch_shopify_products_by_ids(app, store, batch), batches):
+                        shopify_products.extend(batch_products)
+
+            added, updated, unchanged = ProductService._upsert_products(
+                store_id,
+                shopify_products,
+                ProductService._load_existing_products(store_id, shopify_product_ids),
+                current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+            )
+
+            # Products Shopify no longer returns were deleted there since the last sync
+            returned_ids = {shopify_product['id'] for shopify_product in shopify_products}
+            missing = [product_ids_by_shopify_id[shopify_product_id]
+                       for shopify_product_id in shopify_product_ids if shopify_product_id not in returned_ids]
+            not_found = sorted(set(product_ids) - set(product_ids_by_shopify_id.values()))
+
+            # added only happens when a product row was removed locally while the refresh ran
+            updated += added
+            return True, f"Products refreshed successfully. Updated: {updated}, Unchanged: {unchanged}", {
+                'requested': len(product_ids),
+                'refreshed': len(returned_ids),
+                'updated': updated,
+                'unchanged': unchanged,
+                'missing_in_shopify': missing,
+                'not_found': not_found,
+                'requests': len(batches)
+            }
+        except ShopifyAPIError as e:
+            return False, e.message, None
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error refreshing products: {str(e)}")
+            return False, f"Error refreshing products: {str(e)}", None
 
     @staticmethod
     def get_store_products(store_id: int, page: int = 1, per_page: int = 20) -> tuple:
@@ -172,6 +588,8 @@ class ProductService:
                 'original_description': desc.original_description,
                 'optimized_description': desc.optimized_description,
                 'status': desc.status.value,
+                'prompt_tokens': desc.prompt_tokens,
+                'completion_tokens': desc.completion_tokens,
                 'created_at': desc.created_at.isoformat() if desc.created_at else None,
                 'updated_at': desc.updated_at.isoformat() if desc.updated_at else None
             } for desc in descriptions]
@@ -180,22 +598,38 @@ class ProductService:
             return []
 
     @staticmethod
-    def create_optimized_description(product_id: int, optimized_description: str) -> tuple:
+    def create_optimized_description(product_id: int, optimized_description: str, prompt_tokens: int = None,
+                                     completion_tokens: int = None, created_after: datetime = None) -> tuple:
         """
-        Create a new optimized description for a product
+        Create a new optimized description for a product, with the token
+        counts of the LLM call that generated it. With created_after, an
+        identical draft saved since then is returned instead of a duplicate,
+        so a save retried by a redelivered job is idempotent.
         """
         try:
             # Get product
             product = Product.query.get(product_id)
             if not product:
                 return False, "Product not found", None
+
+            if created_after:
+                existing_description = OptimizedDescription.query.filter(
+                    OptimizedDescription.product_id == product_id,
+                    OptimizedDescription.optimized_description == optimized_description,
+                    OptimizedDescription.status == DescriptionStatus.DRAFT,
+                    OptimizedDescription.created_at >= created_after
+                ).first()
+                if existing_description:
+                    return True, "Optimized description already saved", existing_description.to_dict()
                 
             # Create optimized description
             description_data = {
                 'product_id': product_id,
                 'original_description': product.description,
                 'optimized_description': optimized_description,
-                'status': DescriptionStatus.DRAFT
+                'status': DescriptionStatus.DRAFT,
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens
             }
             
             new_description = CRUD.create(OptimizedDescription, description_data)
@@ -206,6 +640,8 @@ class ProductService:
                 'original_description': new_description.original_description,
                 'optimized_description': new_description.optimized_description,
                 'status': new_description.status.value,
+                'prompt_tokens': new_description.prompt_tokens,
+                'completion_tokens': new_description.completion_tokens,
                 'created_at': new_description.created_at.isoformat() if new_description.created_at else None
             }
         except Exception as e:
@@ -267,12 +703,6 @@ class ProductService:
             if not store:
                 return False, "Store not found", None
                 
-            # Prepare Shopify API request
-            headers = {
-                'X-Shopify-Access-Token': store.access_token,
-                'Content-Type': 'application/json'
-            }
-            
             # Update product in Shopify
             data = {
                 'product': {
@@ -281,9 +711,8 @@ class ProductService:
                 }
             }
             
-            response = requests.put(
-                f"https://{store.store_url}/admin/api/2024-01/products/{product.shopify_product_id}.json",
-                headers=headers,
+            response = ShopifyClient.for_store(store).put(
+                f"products/{product.shopify_product_id}.json",
                 json=data
             )
             
@@ -0,0 +1,111 @@
+import math
+import re
+from html.parser import HTMLParser
+
+# Rough token count of English text, close enough for budgets and cost estimates
+CHARS_PER_TOKEN = 4
+
+# Elements whose content never carries product copy
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'iframe', 'svg', 'head', 'template', 'object', 'embed', 'video',
+                'audio', 'canvas', 'form', 'button', 'select'}
+# Elements that start a new line of text
+BLOCK_TAGS = {'p', 'div', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'tr',
+              'table', 'thead', 'tbody', 'section', 'article', 'blockquote', 'hr', 'header', 'footer', 'pre'}
+CELL_TAGS = {'td', 'th'}
+# Void elements have no end tag, so they must not open a skipped section
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Collects the visible text of an HTML fragment, one line per block and
+    table cells separated by ' | '. Attributes (inline styles, tracking
+    pixel URLs, data attributes) are dropped with their tags.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skipped_depth = 0
+        self.row_has_cell = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS and tag not in VOID_TAGS:
+            self.skipped_depth += 1
+        elif self.skipped_depth:
+            return
+        elif tag in CELL_TAGS:
+            if self.row_has_cell:
+                self.parts.append(' | ')
+            self.row_has_cell = True
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+            if tag == 'tr':
+                self.row_has_cell = False
+            elif tag == 'li':
+                self.parts.append('- ')
+
+    def handle_startendtag(self, tag, attrs):
+        if not self.skipped_depth and tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and tag not in VOID_TAGS:
+            self.skipped_depth = max(self.skipped_depth - 1, 0)
+        elif not self.skipped_depth and tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skipped_depth:
+            self.parts.append(data.replace('\n', ' '))
+
+
+class PromptCompaction:
+    """
+    Reduces product input to the compact text an LLM prompt needs. Shopify
+    body_html is converted to plain text (markup, inline styles, scripts and
+    tracking pixels dropped, lists and tables kept as lines) and cut to a
+    token budget, so large descriptions stop inflating every prompt.
+    """
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Approximate token count of a text
+        """
+        return math.ceil(len(text or '') / CHARS_PER_TOKEN)
+
+    @staticmethod
+    def html_to_text(html: str) -> str:
+        """
+        Visible text of an HTML fragment with whitespace collapsed and empty lines removed
+        """
+        if not html:
+            return ''
+        extractor = _TextExtractor()
+        extractor.feed(html)
+        extractor.close()
+        lines = (SPACES.sub(' ', line).strip() for line in ''.join(extractor.parts).split('\n'))
+        return '\n'.join(line for line in lines if line and line != '|')
+
+    @staticmethod
+    def truncate_to_tokens(text: str, max_tokens: int) -> str:
+        """
+        Cut a text to about max_tokens, at a word boundary when there is one
+        """
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        cut = text[:max_chars]
+        boundary = max(cut.rfind(' '), cut.rfind('\n'))
+        if boundary > max_chars // 2:
+            cut = cut[:boundary]
+        return cut.rstrip() + ' ...'
+
+    @staticmethod
+    def compact_description(description: str, max_tokens: int) -> str:
+        """
+        Prompt ready text of a product description within a token budget
+        """
+        return PromptCompaction.truncate_to_tokens(PromptCompaction.html_to_text(description), max_tokens)
@@ -0,0 +1,200 @@
+import math
+import time
+from datetime import datetime
+import pytz
+from typing import Optional
+from flask import current_app
+from sqlalchemy import update
+from app import db, redis_obj
+from app.models.product import Product
+from app.models.store import Store
+from app.services.crud import CRUD
+from app.services.custom_errors import ShopifyAPIError
+from app.services.product_service import ProductService
+from app.services.store_service import StoreService
+from app.services.sync_checkpoint import SyncCheckpoint
+
+# Shopify ids seen by a sharded run, kept long enough for the slowest shard
+SEEN_IDS_TTL = 24 * 3600
+
+
+class ShardedSyncService:
+    """
+    Splits the sync of one very large store into Shopify product id ranges
+    that are fetched by parallel celery tasks (see app/tasks.py) and then
+    reconciled by a single finalize step. The run holds the store's sync lock
+    with its run id from planning to finalize, renewed by every stored page.
+    """
+
+    @staticmethod
+    def _seen_ids_key(run_id: str) -> str:
+        return f"product_sync:{run_id}:seen"
+
+    @staticmethod
+    def get_shard_settings(store: Store) -> tuple:
+        """
+        Shard size and parallelism of a store, falling back to the configured defaults
+        Returns: (shard_size: int, parallelism: int)
+        """
+        return (
+            store.sync_shard_size or current_app.config['SHOPIFY_SYNC_SHARD_SIZE'],
+            store.sync_parallelism or current_app.config['SHOPIFY_SYNC_SHARD_PARALLELISM']
+        )
+
+    @staticmethod
+    def plan_shards(store_id: int, shard_size: int) -> list:
+        """
+        Split the store's Shopify id space into ranges of about shard_size
+        products, using the ids already stored locally as quantiles. The last
+        range is open ended so products created since the last sync are included.
+        Returns: [(since_id, max_id)] where since_id < id < max_id, empty when
+        the store has no local products to split on
+        """
+        product_count = Product.query.filter_by(store_id=store_id).count()
+        if not product_count:
+            return []
+        boundaries = []
+        for shard_number in range(1, math.ceil(product_count / shard_size)):
+            boundaries.append(db.session.query(Product.shopify_product_id).filter(
+                Product.store_id == store_id
+            ).order_by(Product.shopify_product_id).offset(shard_number * shard_size).limit(1).scalar())
+
+        since_ids = [0] + [boundary - 1 for boundary in boundaries]
+        return list(zip(since_ids, boundaries + [None]))
+
+    @staticmethod
+    def sync_shards(store_id: int, shards: list, run_id: str, full_resync: bool = False) -> dict:
+        """
+        Fetch and upsert the given id ranges of a store one after another
+        Returns: summary of the shards with the highest updated_at seen and their start time
+        """
+        started = time.monotonic()
+        summary = {
+            'success': True,
+            'message': None,
+            'started_at': datetime.now(pytz.UTC).isoformat(),
+            'shards': len(shards),
+            'pages': 0,
+            'products_seen': 0,
+            'added': 0,
+            'updated': 0,
+            'unchanged': 0,
+            'watermark': None
+        }
+        try:
+            store = StoreService.get_store_by_id(store_id)
+            if not store:
+                return dict(summary, success=False, message="Store not found")
+
+            chunk_size = current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+            existing_products = ProductService._load_existing_products(store_id)
+            watermark = None if full_resync else ProductService._get_sync_watermark(store)
+            new_watermark = watermark
+
+            for since_id, max_id in shards:
+                for shopify_products, _ in ProductService._iter_shopify_product_id_range(
+                        store, since_id, max_id, updated_at_min=watermark):
+                    added, updated, unchanged = ProductService._upsert_products(
+                        store_id, shopify_products, existing_products, chunk_size
+                    )
+                    if redis_obj is not None:
+                        redis_obj.sadd(ShardedSyncService._seen_ids_key(run_id),
+                                       *[shopify_product['id'] for shopify_product in shopify_products])
+                        redis_obj.expire(ShardedSyncService._seen_ids_key(run_id), SEEN_IDS_TTL)
+                    SyncCheckpoint.renew_lock(store_id, run_id)
+
+                    summary['pages'] += 1
+                    summary['products_seen'] += len(shopify_products)
+                    summary['added'] += added
+                    summary['updated'] += updated
+                    summary['unchanged'] += unchanged
+                    new_watermark = ProductService._advance_watermark(new_watermark, shopify_products)
+
+            summary['watermark'] = new_watermark.isoformat() if new_watermark else None
+        except ShopifyAPIError as e:
+            summary.update(success=False, message=e.message)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error syncing product shards of store {store_id}: {str(e)}")
+            summary.update(success=False, message=f"Error syncing products: {str(e)}")
+
+        summary['elapsed'] = round(time.monotonic() - started, 3)
+        return summary
+
+    @staticmethod
+    def _mark_missing_products_deleted(store_id: int, seen_ids: set, chunk_size: int) -> int:
+        """
+        Flag local products that Shopify no longer returned as deleted
+        Returns: number of products flagged
+        """
+        missing_ids = [
+            product_id for shopify_product_id, (product_id, _) in
+            ProductService._load_existing_products(store_id).items()
+            if shopify_product_id not in seen_ids
+        ]
+        for offset in range(0, len(missing_ids), chunk_size):
+            db.session.execute(
+                update(Product).where(Product.id.in_(missing_ids[offset:offset + chunk_size])).values(
+                    status='deleted', content_hash=None
+                )
+            )
+            CRUD.db_commit()
+        return len(missing_ids)
+
+    @staticmethod
+    def finalize(store_id: int, run_id: str, shard_summaries: list, full_resync: bool = False) -> tuple:
+        """
+        Combine the shard summaries once every shard has finished. When all
+        shards succeeded the store's watermark is advanced and, for a full
+        resync, products missing from Shopify are flagged as deleted. A full
+        resync fails without Redis, which holds the ids the shards saw.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            failed = [summary for summary in shard_summaries if not summary['success']]
+            totals = {
+                key: sum(summary[key] for summary in shard_summaries)
+                for key in ('shards', 'pages', 'products_seen', 'added', 'updated', 'unchanged')
+            }
+            totals['deleted'] = 0
+            totals['failed_lanes'] = len(failed)
+
+            if failed:
+                return False, f"Sharded sync failed: {failed[0]['message']}", totals
+
+            # Without Redis no shard could record the ids it saw, every product would look deleted
+            if full_resync and redis_obj is None:
+                totals['deleted'] = None
+                current_app.logger.error(f"Full resync of store {store_id} cannot detect deleted products "
+                                         f"without Redis")
+                return False, "Full resync failed: deleted products cannot be detected without Redis", totals
+
+            watermarks = [datetime.fromisoformat(summary['watermark'])
+                          for summary in shard_summaries if summary['watermark']]
+            # Capped at the start of the earliest shard, whose pages may predate later edits
+            new_watermark: Optional[datetime] = ProductService._final_watermark(
+                max(watermarks, default=None),
+                min(datetime.fromisoformat(summary['started_at']) for summary in shard_summaries)
+            ) if watermarks else None
+            if new_watermark:
+                CRUD.update(Store, {'id': store_id}, {'sync_watermark': new_watermark})
+            totals['watermark'] = new_watermark.isoformat() if new_watermark else None
+
+            # A delta sync only sees changed products, so deletions can only be detected on a full pass
+            if full_resync:
+                seen_ids = {int(shopify_product_id) for shopify_product_id in
+                            redis_obj.smembers(ShardedSyncService._seen_ids_key(run_id))}
+                totals['deleted'] = ShardedSyncService._mark_missing_products_deleted(
+                    store_id, seen_ids, current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+                )
+
+            return True, (f"Products synced successfully. Added: {totals['added']}, Updated: {totals['updated']}, "
+                          f"Unchanged: {totals['unchanged']}, Deleted: {totals['deleted']}"), totals
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error finalizing sharded sync of store {store_id}: {str(e)}")
+            return False, f"Error finalizing sync: {str(e)}", None
+        finally:
+            if redis_obj is not None:
+                redis_obj.delete(ShardedSyncService._seen_ids_key(run_id))
+            SyncCheckpoint.release_lock(store_id, run_id)
@@ -0,0 +1,340 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+import pytz
+from itertools import islice
+from typing import Callable, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from flask import current_app
+from app import db
+from app.models.store import Store
+from app.services.crud import CRUD
+from app.services.custom_errors import ShopifyAPIError
+from app.services.shopify_client import ShopifyClient, RETRY_STATUS_CODES
+from app.services.shopify_rate_limiter import ShopifyRateLimiter
+from app.services.product_service import ProductService
+from app.services.store_service import StoreService
+from app.services.sync_checkpoint import SyncCheckpoint
+from config import Config_is
+
+BULK_PRODUCTS_QUERY = """
+{
+  products%s {
+    edges {
+      node {
+        id
+        legacyResourceId
+        title
+        descriptionHtml
+        vendor
+        productType
+        handle
+        status
+        createdAt
+        updatedAt
+      }
+    }
+  }
+}
+"""
+
+BULK_OPERATION_RUN_QUERY = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+CURRENT_BULK_OPERATION_QUERY = """
+{
+  currentBulkOperation {
+    id
+    status
+    errorCode
+    objectCount
+    url
+  }
+}
+"""
+
+BULK_OPERATION_FINISHED_STATUSES = ('COMPLETED', 'FAILED', 'CANCELED', 'EXPIRED')
+
+
+class ShopifyBulkService:
+    """
+    Product sync engine based on Shopify GraphQL Bulk Operations.
+    Shopify builds the whole catalog export server side, so very large
+    stores are synced with a handful of calls instead of one REST call per page.
+    Result files are downloaded from cloud storage through a session of
+    their own, outside the shops' rate limits and circuit breakers.
+    """
+    _download_session = None
+    _download_session_pid = None
+    _download_session_lock = threading.Lock()
+
+    @classmethod
+    def _get_download_session(cls) -> requests.Session:
+        """
+        Pooled session for bulk result downloads, dropped after a fork
+        """
+        with cls._download_session_lock:
+            if cls._download_session is None or cls._download_session_pid != os.getpid():
+                session = requests.Session()
+                retries = Retry(total=Config_is.SHOPIFY_MAX_RETRIES, backoff_factor=Config_is.SHOPIFY_RETRY_BACKOFF,
+                                status_forcelist=RETRY_STATUS_CODES, allowed_methods=['GET'], raise_on_status=False)
+                session.mount('https://', HTTPAdapter(pool_maxsize=Config_is.SHOPIFY_POOL_SIZE, max_retries=retries))
+                cls._download_session = session
+                cls._download_session_pid = os.getpid()
+            return cls._download_session
+
+    @staticmethod
+    def _graphql(store: Store, query: str, variables: dict = None) -> dict:
+        """
+        Run a GraphQL Admin API request and return its data
+        """
+        response = ShopifyClient.for_store(store).post(
+            'graphql.json',
+            json={'query': query, 'variables': variables or {}}
+        )
+
+        if response.status_code != 200:
+            current_app.logger.error(f"Error calling Shopify GraphQL API: {response.text}")
+            raise ShopifyAPIError(f"Error calling Shopify GraphQL API: {response.status_code}", response.status_code)
+
+        result = response.json()
+        ShopifyRateLimiter.update_from_graphql(store.store_url, result)
+        if result.get('errors'):
+            current_app.logger.error(f"Shopify GraphQL errors: {result['errors']}")
+            raise ShopifyAPIError(f"Shopify GraphQL errors: {result['errors']}")
+        return result['data']
+
+    @staticmethod
+    def start_bulk_product_query(store: Store, updated_at_min: Optional[str] = None) -> str:
+        """
+        Submit a bulkOperationRunQuery exporting the store's products
+        Returns: the bulk operation id
+        """
+        search = f'(query: "updated_at:>=\'{updated_at_min}\'")' if updated_at_min else ''
+        data = ShopifyBulkService._graphql(store, BULK_OPERATION_RUN_QUERY, {
+            'query': BULK_PRODUCTS_QUERY % search
+        })['bulkOperationRunQuery']
+
+        if data['userErrors']:
+            raise ShopifyAPIError(f"Error starting bulk operation: {data['userErrors'][0]['message']}", 400)
+        return data['bulkOperation']['id']
+
+    @staticmethod
+    def wait_for_bulk_operation(store: Store, operation_id: str, poll_interval: float, timeout: float) -> dict:
+        """
+        Poll currentBulkOperation until the given operation has finished
+        Returns: the finished bulk operation
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            operation = ShopifyBulkService._graphql(store, CURRENT_BULK_OPERATION_QUERY)['currentBulkOperation']
+            # 410: the operation is gone for good, a sync waiting for it has to start over
+            if not operation or operation['id'] != operation_id:
+                raise ShopifyAPIError("Bulk operation was replaced by another one", 410)
+
+            if operation['status'] in BULK_OPERATION_FINISHED_STATUSES:
+                if operation['status'] != 'COMPLETED':
+                    raise ShopifyAPIError(
+                        f"Bulk operation {operation['status'].lower()}: {operation.get('errorCode')}", 410
+                    )
+                return operation
+
+            if time.monotonic() > deadline:
+                raise ShopifyAPIError("Timed out waiting for bulk operation", 504)
+            time.sleep(poll_interval)
+
+    @staticmethod
+    def _rest_product_from_node(node: dict) -> dict:
+        """
+        Reshape a GraphQL product node into the REST payload the upsert stage expects
+        """
+        return {
+            'id': int(node['legacyResourceId']),
+            'title': node['title'],
+            'body_html': node.get('descriptionHtml', ''),
+            'vendor': node.get('vendor', ''),
+            'product_type': node.get('productType', ''),
+            'handle': node.get('handle', ''),
+            'status': (node.get('status') or 'active').lower(),
+            'created_at': node.get('createdAt'),
+            'updated_at': node.get('updatedAt')
+        }
+
+    @staticmethod
+    def iter_bulk_result(url: str) -> Iterator[dict]:
+        """
+        Stream the JSONL result file of a bulk operation one line at a time
+        Yields: REST shaped Shopify products
+        """
+        # The result file is served from cloud storage, not from the shop itself
+        with ShopifyBulkService._get_download_session().get(
+                url, stream=True, timeout=(Config_is.SHOPIFY_CONNECT_TIMEOUT, Config_is.SHOPIFY_READ_TIMEOUT)
+        ) as response:
+            if response.status_code != 200:
+                raise ShopifyAPIError(f"Error downloading bulk operation result: {response.status_code}",
+                                      response.status_code)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                node = json.loads(line)
+                # Only top level product objects are exported, nested rows carry a __parentId
+                if '__parentId' in node:
+                    continue
+                yield ShopifyBulkService._rest_product_from_node(node)
+
+    @staticmethod
+    def fetch_products_with_bulk_operation(store_id: int, full_resync: bool = False,
+                                           progress_callback: Callable[[dict], None] = None,
+                                           lock_owner: str = None) -> tuple:
+        """
+        Sync a store's products through a GraphQL bulk operation.
+        The result file is streamed straight into the bulk upsert stage in
+        chunks, so it is never held in memory as a whole. progress_callback,
+        when given, receives the running totals after every chunk.
+        A checkpoint is saved once the export is started and after every
+        committed chunk; a sync with the same full_resync setting resumes an
+        interrupted one, waiting for its export if it was still running.
+        A sync of a store that is already being synced is refused, unless
+        lock_owner (a sync job id) is the one holding its lock.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        lock_token = None
+        try:
+            store = StoreService.get_store_by_id(store_id)
+            if not store:
+                return False, "Store not found", []
+
+            lock_token = SyncCheckpoint.acquire_lock(store_id, lock_owner)
+            if lock_token is None:
+                return False, "A product sync of this store is already running", []
+
+            sync_started = time.monotonic()
+            chunk_size = current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+            checkpoint = SyncCheckpoint.load(store_id, 'bulk')
+
+            # The export of an interrupted sync is waited for again if it was still running,
+            # a finished one is streamed again skipping the products already committed
+            if checkpoint and checkpoint['full_resync'] == full_resync:
+                current_app.logger.info(
+                    f"Resuming bulk product sync of store {store_id} after {checkpoint['products_seen']} products"
+                )
+            else:
+                watermark = None if full_resync else ProductService._get_sync_watermark(store)
+                export_started_at = datetime.now(pytz.UTC)
+                checkpoint = {
+                    'full_resync': full_resync,
+                    'operation_id': ShopifyBulkService.start_bulk_product_query(
+                        store, watermark.isoformat() if watermark else None
+                    ),
+                    'export_completed': False,
+                    'url': None,
+                    'started_at': export_started_at.isoformat(),
+                    'watermark': watermark.isoformat() if watermark else None,
+                    'new_watermark': watermark.isoformat() if watermark else None,
+                    'products_seen': 0,
+                    'chunks': 0,
+                    'added': 0,
+                    'updated': 0,
+                    'unchanged': 0
+                }
+                # Shopify runs one bulk query per shop at a time, a retry must wait for this one
+                SyncCheckpoint.save(store_id, 'bulk', checkpoint, lock_token)
+
+            operation_id = checkpoint['operation_id']
+            if not checkpoint.get('export_completed', True):
+                # The lock is only renewed by checkpoints, held through the whole export wait
+                SyncCheckpoint.renew_lock(store_id, lock_token, current_app.config['SHOPIFY_BULK_TIMEOUT'] +
+                                          current_app.config['SHOPIFY_SYNC_LOCK_TTL'])
+                operation = ShopifyBulkService.wait_for_bulk_operation(
+                    store, operation_id,
+                    current_app.config['SHOPIFY_BULK_POLL_INTERVAL'],
+                    current_app.config['SHOPIFY_BULK_TIMEOUT']
+                )
+                checkpoint.update(export_completed=True, url=operation.get('url'))
+                SyncCheckpoint.save(store_id, 'bulk', checkpoint, lock_token)
+            result_url = checkpoint['url']
+            export_elapsed = time.monotonic() - sync_started
+
+            existing_products = ProductService._load_existing_products(store_id)
+            watermark = datetime.fromisoformat(checkpoint['watermark']) if checkpoint['watermark'] else None
+            new_watermark = datetime.fromisoformat(checkpoint['new_watermark']) if checkpoint['new_watermark'] else None
+            resumed_products = checkpoint['products_seen']
+            products_added = checkpoint['added']
+            products_updated = checkpoint['updated']
+            products_unchanged = checkpoint['unchanged']
+            products_seen = resumed_products
+            chunks_committed = checkpoint.get('chunks', 0)
+
+            # An empty export has no result file
+            if result_url:
+                shopify_products = islice(ShopifyBulkService.iter_bulk_result(result_url), resumed_products, None)
+                for chunk in iter(lambda: list(islice(shopify_products, chunk_size)), []):
+                    added, updated, unchanged = ProductService._upsert_products(
+                        store_id, chunk, existing_products, chunk_size
+                    )
+                    products_added += added
+                    products_updated += updated
+                    products_unchanged += unchanged
+                    products_seen += len(chunk)
+                    chunks_committed += 1
+                    new_watermark = ProductService._advance_watermark(new_watermark, chunk)
+                    checkpoint.update({
+                        'new_watermark': new_watermark.isoformat() if new_watermark else None,
+                        'products_seen': products_seen,
+                        'chunks': chunks_committed,
+                        'added': products_added,
+                        'updated': products_updated,
+                        'unchanged': products_unchanged
+                    })
+                    SyncCheckpoint.save(store_id, 'bulk', checkpoint, lock_token)
+                    if progress_callback:
+                        # A bulk sync has no pages, the committed chunks stand in for them
+                        progress_callback({
+                            'pages': chunks_committed,
+                            'products_seen': products_seen,
+                            'rows_written': products_added + products_updated
+                        })
+
+            # Products edited while the export ran may be missing from it, the next sync fetches them
+            new_watermark = ProductService._final_watermark(new_watermark, datetime.fromisoformat(
+                checkpoint.get('started_at') or datetime.now(pytz.UTC).isoformat()
+            ))
+            if new_watermark and new_watermark != watermark:
+                CRUD.update(Store, {'id': store_id}, {'sync_watermark': new_watermark})
+            SyncCheckpoint.clear(store_id, 'bulk')
+
+            return True, (f"Products synced successfully. Added: {products_added}, Updated: {products_updated}, "
+                          f"Unchanged: {products_unchanged}"), {
+                'added': products_added,
+                'updated': products_updated,
+                'unchanged': products_unchanged,
+                'full_resync': watermark is None,
+                'watermark': new_watermark.isoformat() if new_watermark else None,
+                'products_seen': products_seen,
+                'pages': chunks_committed,
+                'resumed_from_product': resumed_products or None,
+                'bulk_operation_id': operation_id,
+                'export_elapsed': round(export_elapsed, 3),
+                'elapsed': round(time.monotonic() - sync_started, 3)
+            }
+        except ShopifyAPIError as e:
+            # The export failed or its result file expired, start over next time
+            if e.status in (403, 404, 410):
+                SyncCheckpoint.clear(store_id, 'bulk')
+            return False, e.message, []
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Error syncing products with bulk operation: {str(e)}")
+            return False, f"Error syncing products: {str(e)}", []
+        finally:
+            SyncCheckpoint.release_lock(store_id, lock_token)
@@ -0,0 +1,177 @@
+import math
+import os
+import random
+import threading
+import time
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app, has_app_context
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.custom_errors import ShopifyAPIError
+from app.services.shopify_rate_limiter import ShopifyRateLimiter
+from config import Config_is
+
+# Methods that are safe to send again after a server error or a dropped connection
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class ShopifyClient:
+    """
+    HTTP client for a single Shopify shop.
+    Connections are pooled per shop and per process, every request gets
+    connect/read timeouts, and throttled or failed requests are retried
+    with jittered exponential backoff honouring Retry-After.
+    Admin API calls are governed by the shop's shared rate limit bucket;
+    with wait_for_capacity=False they fail fast with ShopifyRateLimitError
+    instead of waiting for capacity.
+    Admin calls also go through the shop's CircuitBreaker: while the shop
+    keeps failing they are refused at once with a 503 ShopifyAPIError.
+    """
+    _sessions = {}
+    _sessions_pid = None
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, shop: str, access_token: str = None, api_version: str = None,
+                 wait_for_capacity: bool = True):
+        self.shop = shop
+        self.access_token = access_token
+        self.wait_for_capacity = wait_for_capacity
+        self.api_version = api_version or Config_is.SHOPIFY_API_VERSION
+        self.timeout = (Config_is.SHOPIFY_CONNECT_TIMEOUT, Config_is.SHOPIFY_READ_TIMEOUT)
+        self.max_retries = Config_is.SHOPIFY_MAX_RETRIES
+        self.backoff = Config_is.SHOPIFY_RETRY_BACKOFF
+        self.max_retry_wait = Config_is.SHOPIFY_RETRY_MAX_WAIT
+
+    @classmethod
+    def for_store(cls, store, wait_for_capacity: bool = True) -> 'ShopifyClient':
+        """
+        Build a client authenticated as the given store
+        """
+        return cls(store.store_url, store.access_token, wait_for_capacity=wait_for_capacity)
+
+    @classmethod
+    def _get_session(cls, shop: str) -> requests.Session:
+        """
+        Get the pooled session of a shop, dropping sessions inherited across a fork
+        """
+        with cls._sessions_lock:
+            if cls._sessions_pid != os.getpid():
+                cls._sessions = {}
+                cls._sessions_pid = os.getpid()
+
+            session = cls._sessions.get(shop)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=Config_is.SHOPIFY_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._sessions[shop] = session
+            return session
+
+    def api_url(self, path: str) -> str:
+        """
+        Full Admin API URL of a path such as 'products.json'
+        """
+        return f"https://{self.shop}/admin/api/{self.api_version}/{path.lstrip('/')}"
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """
+        Seconds to wait before the given retry attempt, at most max_retry_wait
+        """
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                pass
+        # A malformed or huge Retry-After must not hold the worker for long
+        if not math.isfinite(delay):
+            delay = self.max_retry_wait
+        return min(max(delay, 0.0), self.max_retry_wait)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request to the shop, url may be absolute or an Admin API path.
+        The last response is returned once retries are exhausted.
+        """
+        method = method.upper()
+        if not url.startswith('http'):
+            url = self.api_url(url)
+
+        headers = kwargs.pop('headers', None) or {}
+        if self.access_token:
+            headers.setdefault('X-Shopify-Access-Token', self.access_token)
+        kwargs.setdefault('timeout', self.timeout)
+        session = self._get_session(self.shop)
+
+        # OAuth and bulk result downloads do not count against the Admin API limits
+        rate_limited_api = None
+        if '/admin/api/' in url:
+            rate_limited_api = 'graphql' if url.endswith('/graphql.json') else 'rest'
+
+        # Bulk result downloads are served by Shopify's storage, not by the shop
+        circuit = f"shopify:{self.shop}" if '/admin/' in url else None
+        probe = None
+        if circuit:
+            allowed, retry_in, probe = CircuitBreaker.allow(circuit)
+            if not allowed:
+                raise ShopifyAPIError(f"Shopify is failing for {self.shop}, retry in {retry_in:.1f}s", 503)
+
+        try:
+            response = self._send_with_retries(session, method, url, headers, rate_limited_api, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if circuit:
+                CircuitBreaker.record(circuit, success=False, probe=probe)
+            raise
+        if circuit:
+            CircuitBreaker.record(circuit, success=not CircuitBreaker.is_failure_status(response.status_code),
+                                  probe=probe)
+        return response
+
+    def _send_with_retries(self, session: requests.Session, method: str, url: str, headers: dict,
+                           rate_limited_api: Optional[str], **kwargs) -> requests.Response:
+        """
+        Send a request, retrying throttled and failed attempts
+        """
+        attempt = 0
+        while True:
+            if rate_limited_api:
+                ShopifyRateLimiter.acquire(self.shop, rate_limited_api, wait=self.wait_for_capacity)
+            try:
+                response = session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                response = None
+            else:
+                if rate_limited_api == 'rest':
+                    ShopifyRateLimiter.update_from_response(self.shop, response)
+                retryable = response.status_code == 429 or (
+                    response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS
+                )
+                if not retryable or attempt >= self.max_retries:
+                    return response
+
+            delay = self._retry_delay(attempt, response)
+            if response is not None:
+                # Hand a streamed connection back to the pool before trying again
+                response.close()
+            if has_app_context():
+                current_app.logger.warning(
+                    f"Retrying Shopify {method} {url} in {delay:.2f}s "
+                    f"({response.status_code if response is not None else 'connection error'})"
+                )
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request('PUT', url, **kwargs)
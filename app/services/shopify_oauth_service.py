@@ -1,10 +1,10 @@
 import hmac
 import hashlib
-import requests
 import json
 from urllib.parse import urlencode
 from flask import current_app
 from app.services.store_service import StoreService
+from app.services.shopify_client import ShopifyClient
 from app import redis_obj
 
 class ShopifyOAuthService:
@@ -91,7 +91,7 @@ class ShopifyOAuthService:
         Exchange authorization code for access token
         """
         try:
-            response = requests.post(
+            response = ShopifyClient(shop).post(
                 f"https://{shop}/admin/oauth/access_token",
                 data={
                     'client_id': current_app.config['SHOPIFY_API_KEY'],
@@ -115,11 +115,7 @@ class ShopifyOAuthService:
         Get shop information using the access token
         """
         try:
-            headers = {'X-Shopify-Access-Token': access_token}
-            response = requests.get(
-                f"https://{shop}/admin/api/2024-01/shop.json",
-                headers=headers
-            )
+            response = ShopifyClient(shop, access_token).get('shop.json')
             
             if response.status_code == 200:
                 return response.json()['shop']
@@ -0,0 +1,153 @@
+import time
+from typing import Optional
+from flask import current_app, has_app_context
+from redis.exceptions import RedisError
+from app import redis_obj
+from app.services.custom_errors import ShopifyRateLimitError
+from config import Config_is
+
+# Token bucket shared by every process, refilled from the Redis server clock.
+# The capacity and rate stored in the bucket (learnt from Shopify responses)
+# take precedence over the configured defaults passed as ARGV.
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'capacity', 'rate')
+local capacity = tonumber(bucket[3]) or tonumber(ARGV[1])
+local rate = tonumber(bucket[4]) or tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Align the bucket with the usage Shopify reported, never granting more than it allows
+OBSERVE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at', 'rate')
+local capacity = tonumber(ARGV[1])
+local available = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3]) or tonumber(bucket[3]) or tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate, available)
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now, 'capacity', capacity, 'rate', rate)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(tokens)
+"""
+
+# Points reserved for a GraphQL request before its actual cost is known
+GRAPHQL_REQUEST_COST = 10
+
+
+class ShopifyRateLimiter:
+    """
+    Cross-process rate limit governor for the Shopify Admin API.
+    Web and celery workers share one Redis token bucket per shop and API
+    (REST leaky bucket or GraphQL cost points), consulted before every call
+    and corrected from the limits Shopify reports in each response.
+    When Redis is unavailable calls are let through rather than blocked.
+    """
+
+    @staticmethod
+    def _bucket_key(shop: str, api: str) -> str:
+        return f"shopify_rate:{api}:{shop}"
+
+    @staticmethod
+    def _defaults(api: str) -> tuple:
+        """
+        Configured (capacity, refill rate per second) of an API bucket
+        """
+        if api == 'graphql':
+            return Config_is.SHOPIFY_GRAPHQL_BUCKET_SIZE, Config_is.SHOPIFY_GRAPHQL_RESTORE_RATE
+        return Config_is.SHOPIFY_REST_BUCKET_SIZE, Config_is.SHOPIFY_REST_LEAK_RATE
+
+    @staticmethod
+    def _log_redis_error(e: Exception):
+        if has_app_context():
+            current_app.logger.warning(f"Shopify rate limiter unavailable: {str(e)}")
+
+    @staticmethod
+    def acquire(shop: str, api: str = 'rest', wait: bool = True, max_wait: Optional[float] = None) -> float:
+        """
+        Take capacity for one call to the shop, waiting for the bucket to refill
+        unless wait is False, in which case ShopifyRateLimitError is raised
+        Returns: seconds spent waiting
+        """
+        if redis_obj is None:
+            return 0.0
+
+        capacity, rate = ShopifyRateLimiter._defaults(api)
+        cost = GRAPHQL_REQUEST_COST if api == 'graphql' else 1
+        max_wait = Config_is.SHOPIFY_RATE_LIMIT_MAX_WAIT if max_wait is None else max_wait
+        waited = 0.0
+
+        while True:
+            try:
+                delay = float(redis_obj.eval(
+                    ACQUIRE_SCRIPT, 1, ShopifyRateLimiter._bucket_key(shop, api), capacity, rate, cost
+                ))
+            except RedisError as e:
+                ShopifyRateLimiter._log_redis_error(e)
+                return waited
+
+            if delay <= 0:
+                return waited
+            if not wait or waited + delay > max_wait:
+                raise ShopifyRateLimitError(f"Shopify rate limit reached for {shop}, retry in {delay:.2f}s")
+            time.sleep(delay)
+            waited += delay
+
+    @staticmethod
+    def _observe(shop: str, api: str, capacity: float, available: float, rate: Optional[float] = None):
+        if redis_obj is None:
+            return
+        default_rate = ShopifyRateLimiter._defaults(api)[1]
+        try:
+            redis_obj.eval(
+                OBSERVE_SCRIPT, 1, ShopifyRateLimiter._bucket_key(shop, api),
+                capacity, available, rate if rate is not None else '', default_rate
+            )
+        except RedisError as e:
+            ShopifyRateLimiter._log_redis_error(e)
+
+    @staticmethod
+    def update_from_response(shop: str, response):
+        """
+        Sync the REST bucket with the X-Shopify-Shop-Api-Call-Limit header (e.g. '32/40'),
+        draining it when Shopify answered 429
+        """
+        call_limit = response.headers.get('X-Shopify-Shop-Api-Call-Limit')
+        if call_limit:
+            try:
+                used, capacity = (float(value) for value in call_limit.split('/'))
+            except ValueError:
+                return
+            ShopifyRateLimiter._observe(shop, 'rest', capacity, 0 if response.status_code == 429 else capacity - used)
+        elif response.status_code == 429:
+            ShopifyRateLimiter._observe(shop, 'rest', ShopifyRateLimiter._defaults('rest')[0], 0)
+
+    @staticmethod
+    def update_from_graphql(shop: str, result: dict):
+        """
+        Sync the GraphQL bucket with the throttleStatus of a GraphQL response
+        """
+        throttle_status = (result.get('extensions') or {}).get('cost', {}).get('throttleStatus')
+        if not throttle_status:
+            return
+        ShopifyRateLimiter._observe(
+            shop, 'graphql',
+            throttle_status['maximumAvailable'],
+            throttle_status['currentlyAvailable'],
+            throttle_status['restoreRate']
+        )
@@ -1,9 +1,9 @@
 from typing import Optional, Tuple, List
-import requests
 from flask import current_app
 from app.models.store import Store
 from app import db
 from app.services.crud import CRUD
+from app.services.shopify_client import ShopifyClient
 
 class StoreService:
     @staticmethod
@@ -12,11 +12,7 @@ class StoreService:
         Verify if the Shopify access token is valid
         """
         try:
-            headers = {'X-Shopify-Access-Token': access_token}
-            response = requests.get(
-                f"https://{shop_url}/admin/api/2024-01/shop.json",
-                headers=headers
-            )
+            response = ShopifyClient(shop_url, access_token).get('shop.json')
             return response.status_code == 200
         except Exception as e:
             current_app.logger.error(f"Error verifying Shopify token: {str(e)}")
@@ -0,0 +1,128 @@
+import json
+import uuid
+from typing import Optional
+from flask import current_app
+from redis.exceptions import RedisError
+from app import redis_obj
+from config import Config_is
+
+# Take a lock that is free or already holds the caller's token. ARGV: token, seconds
+ACQUIRE_LOCK_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# Renew or release a lock only while it still holds the caller's token
+RENEW_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SyncCheckpoint:
+    """
+    Progress of an in-flight product sync, saved to Redis after every
+    committed chunk so a sync interrupted by a crash or a deploy resumes
+    where it stopped instead of starting over from the first page.
+    A failure to save a checkpoint never fails the sync itself.
+
+    Only one sync of a store runs at a time: it holds the store's lock,
+    which expires SHOPIFY_SYNC_LOCK_TTL seconds after the last checkpoint
+    renewed it, so the lock of a crashed sync frees itself. A sync run for
+    a job locks with the job id, so a redelivery of the job after its worker
+    died takes the lock back at once instead of waiting for it to expire.
+    """
+
+    @staticmethod
+    def _key(store_id: int, engine: str) -> str:
+        return f"product_sync_checkpoint:{engine}:{store_id}"
+
+    @staticmethod
+    def _lock_key(store_id: int) -> str:
+        return f"product_sync_lock:{store_id}"
+
+    @staticmethod
+    def acquire_lock(store_id: int, owner: str = None) -> Optional[str]:
+        """
+        Take the store's sync lock, or take it back when owner (a job id) already holds it
+        Returns: the lock token, None when another sync of the store holds it
+        """
+        token = owner or uuid.uuid4().hex
+        if redis_obj is None:
+            return token
+        try:
+            if redis_obj.eval(ACQUIRE_LOCK_SCRIPT, 1, SyncCheckpoint._lock_key(store_id), token,
+                              Config_is.SHOPIFY_SYNC_LOCK_TTL):
+                return token
+            return None
+        except RedisError as e:
+            current_app.logger.warning(f"Could not lock product sync of store {store_id}: {str(e)}")
+            return token
+
+    @staticmethod
+    def renew_lock(store_id: int, token: str, seconds: int = None):
+        """
+        Keep holding the store's sync lock for seconds, SHOPIFY_SYNC_LOCK_TTL by default
+        """
+        if redis_obj is None or not token:
+            return
+        try:
+            redis_obj.eval(RENEW_LOCK_SCRIPT, 1, SyncCheckpoint._lock_key(store_id), token,
+                           int(seconds or Config_is.SHOPIFY_SYNC_LOCK_TTL))
+        except RedisError as e:
+            current_app.logger.warning(f"Could not renew product sync lock of store {store_id}: {str(e)}")
+
+    @staticmethod
+    def release_lock(store_id: int, token: str):
+        if redis_obj is None or not token:
+            return
+        try:
+            redis_obj.eval(RELEASE_LOCK_SCRIPT, 1, SyncCheckpoint._lock_key(store_id), token)
+        except RedisError as e:
+            current_app.logger.warning(f"Could not release product sync lock of store {store_id}: {str(e)}")
+
+    @staticmethod
+    def load(store_id: int, engine: str) -> Optional[dict]:
+        if redis_obj is None:
+            return None
+        try:
+            checkpoint = redis_obj.get(SyncCheckpoint._key(store_id, engine))
+        except RedisError as e:
+            current_app.logger.warning(f"Could not load sync checkpoint of store {store_id}: {str(e)}")
+            return None
+        return json.loads(checkpoint) if checkpoint else None
+
+    @staticmethod
+    def save(store_id: int, engine: str, checkpoint: dict, lock_token: str = None):
+        """
+        Save a checkpoint, renewing the store's sync lock when its token is given
+        """
+        if redis_obj is None:
+            return
+        try:
+            redis_obj.setex(SyncCheckpoint._key(store_id, engine), Config_is.SHOPIFY_SYNC_CHECKPOINT_TTL,
+                            json.dumps(checkpoint))
+        except RedisError as e:
+            current_app.logger.warning(f"Could not save sync checkpoint of store {store_id}: {str(e)}")
+        SyncCheckpoint.renew_lock(store_id, lock_token)
+
+    @staticmethod
+    def clear(store_id: int, engine: str):
+        if redis_obj is None:
+            return
+        try:
+            redis_obj.delete(SyncCheckpoint._key(store_id, engine))
+        except RedisError as e:
+            current_app.logger.warning(f"Could not clear sync checkpoint of store {store_id}: {str(e)}")
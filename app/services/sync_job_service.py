@@ -0,0 +1,173 @@
+import json
+import time
+import uuid
+from typing import Optional
+from flask import current_app
+from app import redis_obj
+from app.services.product_service import ProductService
+from app.services.shopify_bulk_service import ShopifyBulkService
+from app.services.store_service import StoreService
+from app.services.task_queue import enqueue_task
+
+# Finished jobs stay queryable for a week
+SYNC_JOB_TTL = 7 * 24 * 3600
+
+
+class SyncJobService:
+    """
+    Product syncs run as celery jobs. The job state and progress live in
+    Redis so the web workers can report them while the sync is running.
+    """
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"product_sync_job:{job_id}"
+
+    @staticmethod
+    def _save_job(job: dict):
+        redis_obj.setex(SyncJobService._job_key(job['id']), SYNC_JOB_TTL, json.dumps(job))
+
+    @staticmethod
+    def _load_job(job_id: str) -> Optional[dict]:
+        if redis_obj is None:
+            return None
+        stored_job = redis_obj.get(SyncJobService._job_key(job_id))
+        return json.loads(stored_job) if stored_job else None
+
+    @staticmethod
+    def _update_job(job_id: str, **fields) -> Optional[dict]:
+        job = SyncJobService._load_job(job_id)
+        if not job:
+            return None
+        job.update(fields)
+        SyncJobService._save_job(job)
+        return job
+
+    @staticmethod
+    def start_sync_job(store_id: int, user_id: int, full_resync: bool = False, mode: str = 'rest') -> tuple:
+        """
+        Queue a product sync for a store
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            # Job state only lives in Redis, a job nobody could follow is not started
+            if redis_obj is None:
+                current_app.logger.error("Cannot start a product sync job: Redis is not configured")
+                return False, "Error: Redis is not configured", None
+
+            store = StoreService.get_store_by_id(store_id)
+            if not store:
+                return False, "Store not found", None
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'store_id': store_id,
+                'user_id': user_id,
+                'mode': mode,
+                'full_resync': full_resync,
+                'status': 'queued',
+                'pages': 0,
+                'products_seen': 0,
+                'rows_written': 0,
+                'total': None,
+                'errors': [],
+                'result': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None
+            }
+            SyncJobService._save_job(job)
+            enqueue_task('sync_store_products', job['id'])
+
+            return True, "Product sync started", SyncJobService.job_to_dict(job)
+        except Exception as e:
+            current_app.logger.error(f"Error starting product sync job: {str(e)}")
+            return False, f"Error starting product sync: {str(e)}", None
+
+    @staticmethod
+    def run_sync_job(job_id: str) -> dict:
+        """
+        Run a queued sync job, recording its progress as pages are stored
+        Returns: the finished job
+        """
+        job = SyncJobService._load_job(job_id)
+        if not job:
+            raise ValueError(f"Sync job {job_id} not found")
+
+        job = SyncJobService._update_job(job_id, status='running', started_at=time.time())
+        store = StoreService.get_store_by_id(job['store_id'])
+        if store:
+            try:
+                watermark = None if job['full_resync'] else ProductService._get_sync_watermark(store)
+                SyncJobService._update_job(job_id, total=ProductService.count_shopify_products(store, watermark))
+            except Exception as e:
+                current_app.logger.warning(f"Could not estimate size of sync job {job_id}: {str(e)}")
+
+        def report_progress(progress: dict):
+            SyncJobService._update_job(job_id, **progress)
+
+        # Locked with the job id, so a redelivery of this job after its worker died takes the lock back
+        if job['mode'] == 'bulk':
+            success, message, data = ShopifyBulkService.fetch_products_with_bulk_operation(
+                job['store_id'], full_resync=job['full_resync'], progress_callback=report_progress,
+                lock_owner=job_id
+            )
+        else:
+            success, message, data = ProductService.fetch_products_from_shopify(
+                job['store_id'], full_resync=job['full_resync'], progress_callback=report_progress,
+                lock_owner=job_id
+            )
+
+        job = SyncJobService._load_job(job_id)
+        if success:
+            data.pop('page_stats', None)
+        else:
+            job['errors'].append(message)
+        job.update(
+            status='completed' if success else 'failed',
+            result={'message': message, 'data': data or None},
+            finished_at=time.time()
+        )
+        SyncJobService._save_job(job)
+        return job
+
+    @staticmethod
+    def job_to_dict(job: dict) -> dict:
+        """
+        Public view of a job, with the ETA of a running job extrapolated from its progress
+        """
+        eta = None
+        if job['status'] == 'running' and job['total'] and job['products_seen']:
+            elapsed = time.time() - job['started_at']
+            remaining = max(job['total'] - job['products_seen'], 0)
+            eta = round(elapsed / job['products_seen'] * remaining, 1)
+
+        return {
+            'id': job['id'],
+            'store_id': job['store_id'],
+            'mode': job['mode'],
+            'full_resync': job['full_resync'],
+            'status': job['status'],
+            'pages': job['pages'],
+            'products_seen': job['products_seen'],
+            'rows_written': job['rows_written'],
+            'total': job['total'],
+            'eta_seconds': eta,
+            'errors': job['errors'],
+            'result': job['result'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+
+    @staticmethod
+    def get_sync_job(job_id: str) -> Optional[dict]:
+        """
+        Get a sync job by id
+        """
+        try:
+            job = SyncJobService._load_job(job_id)
+            return SyncJobService.job_to_dict(job) if job else None
+        except Exception as e:
+            current_app.logger.error(f"Error getting sync job: {str(e)}")
+            return None
@@ -0,0 +1,14 @@
+from celery import Celery
+from config import Config_is
+
+# Producer-only celery app used by the web process to enqueue tasks by name.
+# Importing app.tasks instead would build a second Flask app and push its context.
+celery_client = Celery('tasks', broker=Config_is.AMQP, backend=Config_is.CELERY_RESULT_BACKEND)
+
+
+def enqueue_task(task_name: str, *args, countdown: float = None, **kwargs) -> str:
+    """
+    Send a task defined in app/tasks.py to the workers, to run countdown seconds from now when given
+    Returns: the celery task id
+    """
+    return celery_client.send_task(f'app.tasks.{task_name}', args=args, kwargs=kwargs, countdown=countdown).id
@@ -1,7 +1,13 @@
+import codecs
+import json
 import re
+from typing import Iterable, Iterator
 
 from .custom_errors import BadRequest
 
+_json_decoder = json.JSONDecoder()
+_json_separator = re.compile(r'[\s,]*')
+
 
 def email_validation(email: str) -> bool:
     # checks whether the email formats are in proper format or not
@@ -9,3 +15,53 @@ def email_validation(email: str) -> bool:
     if match:
         return True
     raise BadRequest("Please give a valid email address.")
+
+
+def iter_json_array_items(chunks: Iterable[bytes], key: str) -> Iterator:
+    """
+    Incrementally decode the items of the array under `key` in a JSON object
+    arriving as UTF-8 byte chunks, yielding every item as soon as it is complete
+    so the whole document never has to be held as one string or parse tree.
+    The array is expected to hold objects, as in Shopify's {"products": [...]}
+    """
+    array_start = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buffer = ''
+    position = 0
+    in_array = False
+    exhausted = False
+
+    while True:
+        if not in_array:
+            match = array_start.search(buffer)
+            if match:
+                in_array = True
+                position = match.end()
+                continue
+        else:
+            position = _json_separator.match(buffer, position).end()
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    return
+                try:
+                    item, position = _json_decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Most likely an item cut in half by the chunk boundary
+                    if exhausted:
+                        raise
+                else:
+                    yield item
+                    continue
+
+        if exhausted:
+            if in_array:
+                raise ValueError(f"Unexpected end of JSON while reading '{key}'")
+            return
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
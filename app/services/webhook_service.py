@@ -0,0 +1,274 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import defaultdict
+from typing import Optional
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy import update
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from app import db, redis_obj
+from app.models.product import Product
+from app.models.store import Store
+from app.services.crud import CRUD
+from app.services.product_service import ProductService, SHOPIFY_PRODUCT_FIELDS
+from app.services.shopify_client import ShopifyClient
+
+PRODUCT_WEBHOOK_TOPICS = ('products/create', 'products/update', 'products/delete')
+
+# Newest payload per shop/product, its version (the product's updated_at)
+# and the time each pending product becomes due
+PENDING_EVENTS_KEY = 'shopify_webhooks:pending'
+PENDING_VERSIONS_KEY = 'shopify_webhooks:pending_versions'
+DUE_EVENTS_KEY = 'shopify_webhooks:due'
+
+# Errors worth applying a store's events again on the next run, anything else would only fail again
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, RedisError, OSError)
+
+# Deletes carry no updated_at and win over any update, whatever order they arrive in
+DELETE_EVENT_VERSION = 2 ** 62
+
+# Keep an event unless the pending one of the same product is newer; Shopify
+# does not deliver webhooks in order. The product becomes due at ARGV[4]
+# unless it is pending already.
+# KEYS: pending, versions, due. ARGV: field, event, version, due at
+QUEUE_EVENT_SCRIPT = """
+local stored_version = redis.call('HGET', KEYS[2], ARGV[1])
+if stored_version and tonumber(stored_version) > tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[4], ARGV[1])
+return 1
+"""
+
+# Atomically take the due products together with their latest payload
+POP_DUE_EVENTS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local events = {}
+for _, field in ipairs(due) do
+    local event = redis.call('HGET', KEYS[2], field)
+    redis.call('HDEL', KEYS[2], field)
+    redis.call('HDEL', KEYS[3], field)
+    redis.call('ZREM', KEYS[1], field)
+    if event then
+        table.insert(events, event)
+    end
+end
+return events
+"""
+
+
+class ShopifyWebhookService:
+    """
+    Receives Shopify product webhooks. Events are only verified and queued
+    in Redis by the web request; bursts of events for the same product are
+    coalesced for a short window and applied as a single upsert by a
+    periodic celery task.
+    """
+
+    @staticmethod
+    def verify_hmac(body: bytes, hmac_header: str, secret: str = None) -> bool:
+        """
+        Check the X-Shopify-Hmac-Sha256 header against the raw request body
+        """
+        secret = secret or current_app.config['SHOPIFY_API_SECRET']
+        if not hmac_header or not secret:
+            return False
+        digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).digest()
+        return hmac.compare_digest(base64.b64encode(digest).decode('utf-8'), hmac_header)
+
+    @staticmethod
+    def is_valid_product_payload(payload) -> bool:
+        """
+        Whether a webhook payload identifies a product
+        """
+        return isinstance(payload, dict) and isinstance(payload.get('id'), int) and not isinstance(payload['id'], bool)
+
+    @staticmethod
+    def _is_applicable_event(event: dict) -> bool:
+        """
+        Whether a queued event can be applied: a delete, or an update whose
+        payload maps onto a product
+        """
+        if event['topic'] == 'products/delete':
+            return True
+        payload = event['payload']
+        if not isinstance(payload.get('title'), str) or not payload['title']:
+            return False
+        try:
+            ProductService._product_data_from_shopify(payload)
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def _event_version(topic: str, payload: dict) -> float:
+        """
+        Order of a product's events: its updated_at, deletes last
+        """
+        if topic == 'products/delete':
+            return DELETE_EVENT_VERSION
+        updated_at = ProductService._convert_shopify_datetime(payload.get('updated_at'))
+        return updated_at.timestamp() if updated_at else 0
+
+    @staticmethod
+    def _queue_event(event: dict, due_at: float) -> bool:
+        """
+        Store an event as its product's pending one unless a newer one is pending
+        Returns: whether the event was kept
+        """
+        return bool(redis_obj.eval(
+            QUEUE_EVENT_SCRIPT, 3, PENDING_EVENTS_KEY, PENDING_VERSIONS_KEY, DUE_EVENTS_KEY,
+            f"{event['shop']}:{event['payload']['id']}", json.dumps(event),
+            ShopifyWebhookService._event_version(event['topic'], event['payload']), due_at
+        ))
+
+    @staticmethod
+    def enqueue_product_event(shop: str, topic: str, payload: dict) -> bool:
+        """
+        Queue a product event, replacing the pending event of the same product
+        unless that one is newer. The product becomes due one coalescing
+        window after its first pending event.
+        Returns: whether the event was kept
+        """
+        return ShopifyWebhookService._queue_event(
+            {'shop': shop, 'topic': topic, 'payload': payload, 'received_at': time.time()},
+            time.time() + current_app.config['SHOPIFY_WEBHOOK_COALESCE_WINDOW']
+        )
+
+    @staticmethod
+    def _mark_products_deleted(store_id: int, shopify_product_ids: list):
+        db.session.execute(
+            update(Product).where(
+                Product.store_id == store_id,
+                Product.shopify_product_id.in_(shopify_product_ids)
+            ).values(status='deleted', content_hash=None)
+        )
+        CRUD.db_commit()
+
+    @staticmethod
+    def _apply_shop_events(store: Store, shop_events: list) -> tuple:
+        """
+        Upsert the updated products of a store and mark its deleted ones
+        Returns: (upserted: int, deleted: int)
+        """
+        deleted_ids = [event['payload']['id'] for event in shop_events
+                       if event['topic'] == 'products/delete']
+        shopify_products = [event['payload'] for event in shop_events
+                            if event['topic'] != 'products/delete']
+        if shopify_products:
+            existing_products = ProductService._load_existing_products(
+                store.id, [shopify_product['id'] for shopify_product in shopify_products]
+            )
+            ProductService._upsert_products(
+                store.id, shopify_products, existing_products, current_app.config['SHOPIFY_SYNC_CHUNK_SIZE']
+            )
+        if deleted_ids:
+            ShopifyWebhookService._mark_products_deleted(store.id, deleted_ids)
+        return len(shopify_products), len(deleted_ids)
+
+    @staticmethod
+    def process_due_events(batch_size: int = 500) -> tuple:
+        """
+        Apply every product event whose coalescing window has passed. Events
+        that cannot be applied are dropped. The events of a store that fail on
+        a database or connection error are queued again for the next run,
+        unless a newer event of the same product arrived meanwhile, up to
+        SHOPIFY_WEBHOOK_MAX_ATTEMPTS runs; other errors drop them.
+        Returns: (success: bool, message: str, data: dict)
+        """
+        try:
+            events = [json.loads(event) for event in redis_obj.eval(
+                POP_DUE_EVENTS_SCRIPT, 3, DUE_EVENTS_KEY, PENDING_EVENTS_KEY, PENDING_VERSIONS_KEY,
+                time.time(), batch_size
+            )]
+        except Exception as e:
+            current_app.logger.error(f"Error processing product webhooks: {str(e)}")
+            return False, f"Error processing product webhooks: {str(e)}", None
+
+        dropped = 0
+        events_by_shop = defaultdict(list)
+        for event in events:
+            if not ShopifyWebhookService._is_applicable_event(event):
+                current_app.logger.warning(f"Dropping invalid {event['topic']} webhook of product "
+                                           f"{event['payload']['id']} from {event['shop']}")
+                dropped += 1
+                continue
+            events_by_shop[event['shop']].append(event)
+
+        upserted = 0
+        deleted = 0
+        skipped = 0
+        requeued = 0
+        for shop, shop_events in events_by_shop.items():
+            try:
+                store: Optional[Store] = Store.query.filter_by(store_url=shop).first()
+                if not store:
+                    skipped += len(shop_events)
+                    continue
+                shop_upserted, shop_deleted = ShopifyWebhookService._apply_shop_events(store, shop_events)
+                upserted += shop_upserted
+                deleted += shop_deleted
+            except Exception as e:
+                db.session.rollback()
+                if not isinstance(e, TRANSIENT_ERRORS):
+                    current_app.logger.error(f"Error applying {len(shop_events)} product webhooks of {shop}, "
+                                             f"dropping them: {str(e)}")
+                    dropped += len(shop_events)
+                    continue
+                current_app.logger.error(f"Error applying {len(shop_events)} product webhooks of {shop}, "
+                                         f"queueing them again: {str(e)}")
+                due_at = time.time() + current_app.config['SHOPIFY_WEBHOOK_COALESCE_WINDOW']
+                for event in shop_events:
+                    event['attempts'] = event.get('attempts', 1) + 1
+                    if event['attempts'] > current_app.config['SHOPIFY_WEBHOOK_MAX_ATTEMPTS']:
+                        current_app.logger.error(f"Dropping {event['topic']} webhook of product "
+                                                 f"{event['payload']['id']} from {shop} after "
+                                                 f"{event['attempts'] - 1} attempts")
+                        dropped += 1
+                        continue
+                    ShopifyWebhookService._queue_event(event, due_at)
+                    requeued += 1
+
+        data = {
+            'events': len(events),
+            'upserted': upserted,
+            'deleted': deleted,
+            'skipped': skipped,
+            'requeued': requeued,
+            'dropped': dropped
+        }
+        if requeued or dropped:
+            return False, (f"Error applying {requeued + dropped} of {len(events)} product events, "
+                           f"{requeued} queued again, {dropped} dropped"), data
+        return True, f"Processed {len(events)} product events", data
+
+    @staticmethod
+    def register_product_webhooks(store: Store) -> bool:
+        """
+        Subscribe the store to the product webhooks handled by this app
+        """
+        try:
+            client = ShopifyClient.for_store(store)
+            address = f"{current_app.config['SHOPIFY_APP_URL']}/v1/webhooks/shopify/products"
+            for topic in PRODUCT_WEBHOOK_TOPICS:
+                response = client.post('webhooks.json', json={
+                    'webhook': {
+                        'topic': topic,
+                        'address': address,
+                        'format': 'json',
+                        'fields': SHOPIFY_PRODUCT_FIELDS.split(',')
+                    }
+                })
+                # 422 means the subscription already exists
+                if response.status_code not in (201, 422):
+                    current_app.logger.error(f"Error registering {topic} webhook: {response.text}")
+                    return False
+            return True
+        except Exception as e:
+            current_app.logger.error(f"Error registering product webhooks: {str(e)}")
+            return False
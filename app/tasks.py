@@ -1,15 +1,27 @@
-from celery import Celery
+import uuid
+from celery import Celery, chord
 from app import create_app
 import json
 from config import Config
 from datetime import datetime, timedelta
 from app import db
 from app.models.time_zone import TimeZone
-from app.services.crud import CRUD
 
 app = create_app()
 app.app_context().push()
-app = Celery('tasks', broker=Config.AMQP)
+
+# Services can only be imported once create_app has loaded the blueprints
+from app.services.crud import CRUD
+from app.services.sync_orchestrator import SyncOrchestrator
+from app.services.sharded_sync_service import ShardedSyncService
+from app.services.shopify_bulk_service import ShopifyBulkService
+from app.services.sync_checkpoint import SyncCheckpoint
+from app.services.store_service import StoreService
+from app.services.sync_job_service import SyncJobService
+from app.services.optimize_job_service import OptimizeJobService
+from app.services.webhook_service import ShopifyWebhookService
+
+app = Celery('tasks', broker=Config.AMQP, backend=Config.CELERY_RESULT_BACKEND)
 
 crud = CRUD()
 
@@ -21,6 +33,10 @@ app.conf.beat_schedule = {
         'task': 'app.tasks.start_processing',
         'schedule': timedelta(minutes=1)
     },
+    'process-product-webhooks': {
+        'task': 'app.tasks.process_product_webhooks',
+        'schedule': timedelta(seconds=Config.SHOPIFY_WEBHOOK_COALESCE_WINDOW)
+    },
     # 'options': {
     #     'expires': 15.0  # beat scheduled tasks will be removed automatically
     # }
@@ -47,3 +63,79 @@ def job_three(**kwargs):
 @app.task
 def start_processing():
     job_three.delay()
+
+
+# Redelivered when the worker dies mid-sync; the sync then resumes from its checkpoint
+@app.task(acks_late=True, reject_on_worker_lost=True)
+def sync_store_products(job_id: str):
+    """Run a product sync job queued by the sync endpoint"""
+    return SyncJobService.run_sync_job(job_id)
+
+
+# Redelivered when the worker dies mid-job; products already finished are skipped
+@app.task(acks_late=True, reject_on_worker_lost=True)
+def bulk_optimize_products(job_id: str):
+    """Generate and save the descriptions of a bulk optimization job"""
+    return OptimizeJobService.run_optimize_job(job_id)
+
+
+@app.task
+def process_product_webhooks():
+    """Apply the product webhooks whose coalescing window has passed"""
+    success, message, data = ShopifyWebhookService.process_due_events()
+    return {'success': success, 'message': message, 'data': data}
+
+
+@app.task
+def sync_all_stores(store_ids: list = None, max_workers: int = None, full_resync: bool = False, mode: str = 'rest'):
+    """Sync the products of the given stores, or of every store, in parallel"""
+    success, message, data = SyncOrchestrator.sync_stores(
+        store_ids=store_ids,
+        max_workers=max_workers,
+        full_resync=full_resync,
+        mode=mode
+    )
+    return {'success': success, 'message': message, 'data': data}
+
+
+@app.task
+def sync_store_sharded(store_id: int, full_resync: bool = False):
+    """Split one store's sync into id range shards processed by parallel tasks"""
+    store = StoreService.get_store_by_id(store_id)
+    if not store:
+        return {'success': False, 'message': 'Store not found', 'data': None}
+
+    shard_size, parallelism = ShardedSyncService.get_shard_settings(store)
+    shards = ShardedSyncService.plan_shards(store_id, shard_size)
+    if not shards:
+        # Without local ids to split on, the first sync of a store runs as one bulk operation
+        success, message, data = ShopifyBulkService.fetch_products_with_bulk_operation(store_id, full_resync)
+        return {'success': success, 'message': message, 'data': data}
+
+    # Held until finalize releases it, so no other sync of the store runs meanwhile
+    run_id = uuid.uuid4().hex
+    if SyncCheckpoint.acquire_lock(store_id, run_id) is None:
+        return {'success': False, 'message': 'A product sync of this store is already running', 'data': None}
+
+    # Shards are dealt round robin to at most `parallelism` lanes that run concurrently
+    lanes = [shards[lane::parallelism] for lane in range(min(parallelism, len(shards)))]
+    chord(
+        sync_store_shard_lane.s(store_id, lane, run_id, full_resync) for lane in lanes
+    )(finalize_sharded_sync.s(store_id, run_id, full_resync))
+    return {'success': True, 'message': f'Started {len(shards)} shards in {len(lanes)} lanes', 'data': {
+        'run_id': run_id,
+        'shards': shards
+    }}
+
+
+@app.task
+def sync_store_shard_lane(store_id: int, shards: list, run_id: str, full_resync: bool = False):
+    """Sync a list of id range shards of a store"""
+    return ShardedSyncService.sync_shards(store_id, shards, run_id, full_resync)
+
+
+@app.task
+def finalize_sharded_sync(shard_summaries: list, store_id: int, run_id: str, full_resync: bool = False):
+    """Reconcile deletions and advance the watermark once every shard lane has finished"""
+    success, message, data = ShardedSyncService.finalize(store_id, run_id, shard_summaries, full_resync)
+    return {'success': success, 'message': message, 'data': data}
@@ -1,7 +1,11 @@
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
 import app
-from app import create_app
+from app import create_app, db
 from app.models import User
+# app.api has to be loaded before app.services to avoid a circular import
+import app.api
 
 """
 fixtures can be run with different scopes:
@@ -28,3 +32,17 @@ def test_client():
         # Establish an application context
         with flask_app.app_context():
             yield testing_client  # this is where the testing happens!
+
+
+@pytest.fixture
+def sqlite_db(test_client, monkeypatch):
+    """
+    Empty in-memory sqlite database with every table, used in place of the configured one
+    """
+    engine = create_engine('sqlite://', poolclass=StaticPool)
+    db.session.remove()
+    monkeypatch.setitem(db.engines, None, engine)
+    db.metadata.create_all(engine)
+    yield db
+    db.session.remove()
+    engine.dispose()
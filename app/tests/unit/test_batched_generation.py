@@ -0,0 +1,14 @@
+from app.services.batched_generation import BatchedGeneration
+
+
+def test_parse_batched_response_keeps_valid_requested_items():
+    """
+    Given a fenced JSON answer with an empty, an unrequested and a missing product
+    When the answer is split per product
+    Then only the requested products with a non-empty description are returned
+    """
+    text = '```json\n{"1": "<p>Mug</p>", "2": "  ", "9": "<p>Other</p>"}\n```'
+
+    assert BatchedGeneration.parse_response(text, [1, 2, 3]) == {1: '<p>Mug</p>'}
+    assert BatchedGeneration.parse_response('not json', [1]) == {}
+    assert BatchedGeneration.parse_response('["<p>Mug</p>"]', [1]) == {}
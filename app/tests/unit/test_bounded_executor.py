@@ -0,0 +1,27 @@
+import time
+
+from app.services.bounded_executor import BoundedExecutor
+
+
+def test_bounded_executor_keeps_order_and_isolates_failures(test_client):
+    """
+    Given calls that finish out of order, raise, or hang past the item timeout
+    When they run on the bounded executor
+    Then results come back in input order with the failures reported per item
+    """
+    def call(item):
+        if item == 'boom':
+            raise RuntimeError('boom')
+        if item == 'hang':
+            time.sleep(2)
+        time.sleep(0.05 if item == 'slow' else 0)
+        return True, 'ok', item
+
+    started = time.monotonic()
+    results = BoundedExecutor.run(call, ['slow', 'fast', 'boom', 'hang'], max_workers=4, item_timeout=0.5)
+
+    assert results[0] == (True, 'ok', 'slow')
+    assert results[1] == (True, 'ok', 'fast')
+    assert results[2] == (False, 'Error: boom', None)
+    assert results[3][0] is False and 'Timed out' in results[3][1]
+    assert time.monotonic() - started < 1.5
@@ -0,0 +1,69 @@
+import fakeredis
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import CircuitBreaker
+from config import Config_is
+
+
+def _use_fake_redis(monkeypatch, reset_timeout: float):
+    monkeypatch.setattr(circuit_breaker, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(Config_is, 'CIRCUIT_FAILURE_THRESHOLD', 2)
+    monkeypatch.setattr(Config_is, 'CIRCUIT_RESET_TIMEOUT', reset_timeout)
+
+
+def test_circuit_opens_after_failures_and_refuses_calls(test_client, monkeypatch):
+    """
+    Given a closed circuit
+    When calls fail up to the failure threshold
+    Then the circuit opens and refuses calls until the reset timeout, and a late success does not close it
+    """
+    _use_fake_redis(monkeypatch, reset_timeout=30)
+
+    CircuitBreaker.record('provider', success=False)
+    assert CircuitBreaker.allow('provider')[0]
+    CircuitBreaker.record('provider', success=False)
+
+    allowed, retry_in, probe = CircuitBreaker.allow('provider')
+    assert not allowed and 0 < retry_in <= 30 and probe is None
+    CircuitBreaker.record('provider', success=True)
+    assert not CircuitBreaker.allow('provider')[0]
+
+
+def test_only_the_probe_closes_a_half_open_circuit(test_client, monkeypatch):
+    """
+    Given an open circuit whose reset timeout has passed
+    When a probe is let through while a call admitted before the circuit opened reports back
+    Then a single probe is admitted, the older call's success is ignored and only the probe's success closes it
+    """
+    _use_fake_redis(monkeypatch, reset_timeout=0)
+    CircuitBreaker.record('provider', success=False)
+    CircuitBreaker.record('provider', success=False)
+
+    allowed, _, probe = CircuitBreaker.allow('provider')
+    assert allowed and probe
+    assert not CircuitBreaker.allow('provider')[0]
+
+    CircuitBreaker.record('provider', success=True)
+    CircuitBreaker.record('provider', success=True, probe='stale-probe')
+    assert not CircuitBreaker.allow('provider')[0]
+
+    CircuitBreaker.record('provider', success=True, probe=probe)
+    assert CircuitBreaker.allow('provider') == (True, 0.0, None)
+
+
+def test_failed_probe_opens_the_circuit_again(test_client, monkeypatch):
+    """
+    Given a half-open circuit
+    When a call admitted before the circuit opened fails and then the probe fails
+    Then only the probe's failure opens the circuit again
+    """
+    _use_fake_redis(monkeypatch, reset_timeout=0)
+    CircuitBreaker.record('provider', success=False)
+    CircuitBreaker.record('provider', success=False)
+    _, _, probe = CircuitBreaker.allow('provider')
+
+    CircuitBreaker.record('provider', success=False)
+    assert circuit_breaker.redis_obj.hget(CircuitBreaker._circuit_key('provider'), 'state') == 'half_open'
+
+    CircuitBreaker.record('provider', success=False, probe=probe)
+    assert circuit_breaker.redis_obj.hget(CircuitBreaker._circuit_key('provider'), 'state') == 'open'
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from flask import current_app
+
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.services.custom_errors import LLMProviderError
+
+
+def test_adaptive_concurrency_limiter_grows_additively_and_cuts_once_per_window(test_client, monkeypatch):
+    """
+    Given an adaptive limiter of 4 slots
+    When calls succeed within the latency target and then a burst of calls is throttled
+    Then the limit grows by one slot per limit's worth of successes and is halved only once for the burst
+    """
+    monkeypatch.setitem(current_app.config, 'LLM_LATENCY_TARGET', 1)
+    monkeypatch.setattr('app.services.concurrency_limiter.redis_obj', None)
+    limiter = AdaptiveConcurrencyLimiter('test', initial=4, minimum=1, maximum=8)
+
+    for _ in range(5):
+        limiter.record(time.monotonic(), 0.1)
+    assert limiter.snapshot()['limit'] == 5
+
+    burst_started = time.monotonic()
+    for _ in range(3):
+        limiter.record(burst_started, 0.1, throttled=True)
+    assert limiter.snapshot()['limit'] == 2
+    assert limiter.snapshot()['decreases'] == 1
+
+    limiter.record(time.monotonic(), 2.0)
+    assert limiter.snapshot()['limit'] == 1
+    assert AdaptiveConcurrencyLimiter.is_throttle(LLMProviderError('429', 429))
+    assert not AdaptiveConcurrencyLimiter.is_throttle(LLMProviderError('400', 400))
+
+
+def test_adaptive_concurrency_limiter_slots_block_beyond_the_limit(test_client):
+    """
+    Given an adaptive limiter of 2 slots
+    When 6 threads each hold a slot for a while
+    Then no more than 2 of them run at the same time
+    """
+    limiter = AdaptiveConcurrencyLimiter('test', initial=2, minimum=1, maximum=8)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def call():
+        with limiter.slot():
+            # Nested slots of the same thread are not counted twice
+            with limiter.slot():
+                with lock:
+                    running[0] += 1
+                    peak[0] = max(peak[0], running[0])
+                time.sleep(0.02)
+                with lock:
+                    running[0] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert limiter.snapshot()['in_flight'] == 0
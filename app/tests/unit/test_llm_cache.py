@@ -0,0 +1,62 @@
+import fakeredis
+import redis
+from flask import current_app
+
+from app.services import llm_cache
+from app.services.llm_cache import LLMResponseCache
+
+
+def test_llm_cache_key_covers_generation_inputs():
+    """
+    Given the same product generated with different settings
+    When cache keys are computed
+    Then identical input maps to one key and any changed input to another
+    """
+    product = {'id': 1, 'title': 'Mug', 'description': '<p>Blue</p>'}
+    key = LLMResponseCache.make_key('openai', 'gpt-4o-mini', 1, product, ['mug'], 0.7)
+
+    assert key == LLMResponseCache.make_key('openai', 'gpt-4o-mini', 1, dict(product, id=2), ['mug'], 0.7)
+    assert key != LLMResponseCache.make_key('gemini', 'gpt-4o-mini', 1, product, ['mug'], 0.7)
+    assert key != LLMResponseCache.make_key('openai', 'gpt-4o-mini', 2, product, ['mug'], 0.7)
+    assert key != LLMResponseCache.make_key('openai', 'gpt-4o-mini', 1, product, ['cup'], 0.7)
+    assert key != LLMResponseCache.make_key('openai', 'gpt-4o-mini', 1, product, ['mug'], 0.2)
+    assert key != LLMResponseCache.make_key('openai', 'gpt-4o-mini', 1, dict(product, description='<p>Red</p>'),
+                                            ['mug'], 0.7)
+
+
+def test_llm_cache_prunes_expired_entries_before_evicting(test_client, monkeypatch):
+    """
+    Given cache entries unused for longer than the TTL and a full cache
+    When new descriptions are cached
+    Then the expired entries are pruned from the index instead of live entries being evicted
+    """
+    monkeypatch.setattr(llm_cache, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setitem(current_app.config, 'LLM_CACHE_TTL', 100)
+    monkeypatch.setitem(current_app.config, 'LLM_CACHE_MAX_ENTRIES', 2)
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, 'time', lambda: now[0])
+
+    LLMResponseCache.set('old-1', 'Old description')
+    LLMResponseCache.set('old-2', 'Old description')
+    now[0] += 150
+    LLMResponseCache.set('new-1', 'New description')
+    LLMResponseCache.set('new-2', 'New description')
+
+    assert llm_cache.redis_obj.zrange(llm_cache.LLMResponseCache._lru_key(), 0, -1) == ['new-1', 'new-2']
+    stats = LLMResponseCache.stats()
+    assert (stats['entries'], stats['evictions']) == (2, 0)
+
+
+def test_llm_cache_stats_survive_redis_outage(test_client, monkeypatch):
+    """
+    Given a Redis server that cannot be reached
+    When the cache stats are requested
+    Then empty stats are returned instead of an error
+    """
+    class UnreachableRedis:
+        def pipeline(self):
+            raise redis.exceptions.ConnectionError('Connection refused')
+
+    monkeypatch.setattr(llm_cache, 'redis_obj', UnreachableRedis())
+
+    assert LLMResponseCache.stats() == {'hits': 0, 'misses': 0, 'evictions': 0, 'hit_rate': None, 'entries': 0}
@@ -0,0 +1,128 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import current_app
+
+from app.models.product import Product
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
+from app.services.custom_errors import LLMProviderError
+from app.services.gemini_service import GeminiService
+from app.services.llm_cache import LLMResponseCache
+from app.services.llm_clients import LLMClientRegistry
+from app.services.llm_provider import MAX_TOKENS
+from app.services.llm_router import LLMRouter
+from app.services.openai_service import OpenAIService
+
+
+def test_llm_router_hedges_stalled_primary_and_falls_back_on_errors(test_client, monkeypatch):
+    """
+    Given a primary provider that stalls and later fails, and a healthy fallback provider
+    When descriptions are generated through the router
+    Then the stalled request is hedged after the hedge delay and the failed one falls back
+    """
+    monkeypatch.setitem(current_app.config, 'GEMINI_API_KEY', 'gemini-key')
+    monkeypatch.setitem(current_app.config, 'OPENAI_API_KEY', 'openai-key')
+    monkeypatch.setitem(current_app.config, 'LLM_HEDGE_DEFAULT_DELAY', 0.2)
+    monkeypatch.setattr(LLMResponseCache, 'set', staticmethod(lambda digest, description: None))
+    monkeypatch.setattr(OpenAIService, '_complete', classmethod(lambda cls, prompt, **kwargs: ('from openai', None)))
+    product = {'id': 1, 'title': 'Mug', 'description': None}
+
+    def stalled(cls, prompt, **kwargs):
+        time.sleep(1)
+        return 'from gemini', None
+
+    monkeypatch.setattr(GeminiService, '_complete', classmethod(stalled))
+    started = time.monotonic()
+    success, _, data = LLMRouter.generate_for_product(product, regenerate=True)
+    assert success and data['provider'] == 'openai'
+    assert time.monotonic() - started < 0.8
+
+    def failing(cls, prompt, **kwargs):
+        raise LLMProviderError('unavailable', 503)
+
+    monkeypatch.setattr(GeminiService, '_complete', classmethod(failing))
+    success, _, data = LLMRouter.generate_for_product(product, regenerate=True)
+    assert success and data['optimized_description'] == 'from openai'
+
+
+def test_stream_without_text_is_an_error_and_not_cached(test_client, monkeypatch):
+    """
+    Given a provider whose stream ends without any text
+    When the description is streamed
+    Then the stream fails to start like an empty completion and nothing is cached
+    """
+    monkeypatch.setitem(current_app.config, 'GEMINI_API_KEY', 'gemini-key')
+    monkeypatch.setattr(Product, 'query', SimpleNamespace(
+        get=lambda product_id: SimpleNamespace(id=product_id, title='Mug', description=None)
+    ))
+    monkeypatch.setattr(GeminiService, '_stream_completion', classmethod(lambda cls, prompt: iter([])))
+    cached = []
+    monkeypatch.setattr(LLMResponseCache, 'set', staticmethod(lambda digest, description: cached.append(description)))
+
+    success, message, stream = GeminiService.stream_seo_description(1, regenerate=True)
+
+    assert not success and stream is None
+    assert message == "Error generating description: No response from API"
+    assert cached == []
+
+
+def test_stream_holds_a_concurrency_slot_and_reports_its_outcome_at_the_end(test_client, monkeypatch):
+    """
+    Given a provider stream that fails after its first chunk, and one that completes
+    When each description is streamed
+    Then a concurrency slot is held until the stream ends and the circuit hears the outcome only then
+    """
+    monkeypatch.setitem(current_app.config, 'GEMINI_API_KEY', 'gemini-key')
+    monkeypatch.setattr(Product, 'query', SimpleNamespace(
+        get=lambda product_id: SimpleNamespace(id=product_id, title='Mug', description=None)
+    ))
+    monkeypatch.setattr(LLMResponseCache, 'set', staticmethod(lambda digest, description: None))
+    monkeypatch.setattr(CircuitBreaker, 'allow', staticmethod(lambda name: (True, 0.0, 'probe-token')))
+    outcomes = []
+    monkeypatch.setattr(CircuitBreaker, 'record', staticmethod(
+        lambda name, success, probe=None: outcomes.append((success, probe))
+    ))
+    limiter = AdaptiveConcurrencyLimiter('gemini', 4, 1, 4)
+    monkeypatch.setattr(AdaptiveConcurrencyLimiter, 'for_provider', classmethod(lambda cls, provider: limiter))
+
+    def failing_stream(cls, prompt):
+        yield 'Great'
+        raise LLMProviderError('stream interrupted', 500)
+
+    monkeypatch.setattr(GeminiService, '_stream_completion', classmethod(failing_stream))
+    success, _, stream = GeminiService.stream_seo_description(1, regenerate=True)
+    assert success and limiter.in_flight == 1 and outcomes == []
+    with pytest.raises(LLMProviderError):
+        list(stream['chunks'])
+    assert limiter.in_flight == 0 and outcomes == [(False, 'probe-token')]
+
+    monkeypatch.setattr(GeminiService, '_stream_completion', classmethod(lambda cls, prompt: iter(['Great ', 'mug'])))
+    success, _, stream = GeminiService.stream_seo_description(1, regenerate=True)
+    assert next(stream['chunks']) == 'Great ' and outcomes == [(False, 'probe-token')]
+    assert list(stream['chunks']) == ['mug']
+    assert limiter.in_flight == 0 and outcomes[-1] == (True, 'probe-token')
+
+
+def test_gemini_requests_carry_a_timeout_scaled_with_the_tokens_asked(test_client, monkeypatch):
+    """
+    Given a Gemini model that records how it is called
+    When a single, a batched and a streamed completion are requested
+    Then each request is given LLM_ITEM_TIMEOUT per MAX_TOKENS asked, so a hung call gives up its concurrency slot
+    """
+    monkeypatch.setitem(current_app.config, 'LLM_ITEM_TIMEOUT', 30)
+    calls = []
+
+    def generate_content(prompt, stream=False, request_options=None):
+        calls.append(request_options)
+        return iter([SimpleNamespace(text='Blue')]) if stream else SimpleNamespace(text='Blue')
+
+    model = SimpleNamespace(generate_content=generate_content)
+    monkeypatch.setattr(LLMClientRegistry, 'get_gemini_model', classmethod(lambda cls, model_name=None: model))
+
+    GeminiService._complete('prompt')
+    GeminiService._complete('prompt', max_tokens=MAX_TOKENS * 3, json_output=True)
+    list(GeminiService._stream_completion('prompt'))
+
+    assert calls == [{'timeout': 30}, {'timeout': 90}, {'timeout': 30}]
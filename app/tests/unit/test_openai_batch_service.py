@@ -0,0 +1,156 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from flask import current_app
+
+from app.services.llm_cache import LLMResponseCache
+from app.services.openai_batch_service import OpenAIBatchService
+
+
+class _BatchAPIStub(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI files and batches API. Every batch is in progress when
+    first polled and completed after; product 2 fails in the first batch.
+    """
+    files = {}
+    batches = {}
+
+    def _reply(self, body, content_type='application/json'):
+        payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/v1/files':
+            # The JSONL lines of the multipart upload are the requests
+            requests = [json.loads(line) for line in body.split(b'\n') if line.startswith(b'{"custom_id"')]
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = requests
+            return self._reply({'id': file_id})
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {'input_file_id': json.loads(body)['input_file_id'], 'polls': 0}
+        return self._reply({'id': batch_id, 'status': 'validating'})
+
+    def do_GET(self):
+        if self.path.endswith('/content'):
+            return self._reply(self.files[self.path.split('/')[3]], 'application/jsonl')
+        batch_id = self.path.split('/')[3]
+        batch = self.batches[batch_id]
+        batch['polls'] += 1
+        if batch['polls'] == 1:
+            return self._reply({'id': batch_id, 'status': 'in_progress'})
+
+        output, errors = [], []
+        for request in self.files[batch['input_file_id']]:
+            if request['custom_id'] == 'product-2' and batch_id == 'batch-0':
+                errors.append({'custom_id': request['custom_id'], 'response': {
+                    'status_code': 500, 'body': {'error': {'message': 'server error'}}
+                }})
+            else:
+                output.append({'custom_id': request['custom_id'], 'response': {'status_code': 200, 'body': {
+                    'choices': [{'message': {'content': f"Description of {request['custom_id']}"}}],
+                    'usage': {'prompt_tokens': 100, 'completion_tokens': 40}
+                }}})
+        for name, lines in ((f"{batch_id}-output", output), (f"{batch_id}-errors", errors)):
+            self.files[name] = b''.join(json.dumps(line).encode() + b'\n' for line in lines)
+        return self._reply({
+            'id': batch_id, 'status': 'completed',
+            'output_file_id': f"{batch_id}-output", 'error_file_id': f"{batch_id}-errors"
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_openai_batch_run_resumes_from_state_and_resubmits_failures(test_client, monkeypatch):
+    """
+    Given products submitted through the batch API, one of which fails in its first batch
+    When the run is continued from its saved state until it finishes
+    Then running batches are polled instead of submitted again and only the failed product is resubmitted
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _BatchAPIStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(current_app.config, 'OPENAI_API_BASE', f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(current_app.config, 'OPENAI_API_KEY', 'openai-key')
+    monkeypatch.setattr(LLMResponseCache, 'set', staticmethod(lambda digest, description: None))
+    products = {product_id: {'id': product_id, 'title': f"Product {product_id}", 'description': None}
+                for product_id in (1, 2, 3)}
+    results, saved = [], []
+    pending = [1, 2, 3]
+    state = None
+
+    try:
+        for _ in range(3):
+            success, _, state = OpenAIBatchService.run(
+                product_ids=pending,
+                regenerate=True,
+                state=state,
+                on_result=results.append,
+                on_state=lambda state: saved.append(json.loads(json.dumps(state))),
+                load_products=lambda product_ids: [products[product_id] for product_id in product_ids],
+                wait=False
+            )
+            assert success
+            pending = [product_id for product_id in pending
+                       if product_id not in {result['product_id'] for result in results}]
+    finally:
+        server.shutdown()
+
+    assert state['finished'] and saved[-1] == state
+    assert [batch['id'] for batch in state['batches']] == ['batch-0', 'batch-1']
+    assert [request['custom_id'] for request in _BatchAPIStub.files[state['batches'][1]['input_file_id']]] == ['product-2']
+    assert sorted(result['product_id'] for result in results) == [1, 2, 3]
+    assert all(result['optimized_description'] == f"Description of product-{result['product_id']}"
+               and result['prompt_tokens'] == 100 for result in results)
+
+
+class _StalledBatchAPIStub(_BatchAPIStub):
+    """
+    Batches that never finish; cancelling them is recorded
+    """
+    cancelled = []
+
+    def do_POST(self):
+        if self.path.endswith('/cancel'):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            self.cancelled.append(self.path.split('/')[3])
+            return self._reply({'id': self.path.split('/')[3], 'status': 'cancelling'})
+        return super().do_POST()
+
+    def do_GET(self):
+        return self._reply({'id': self.path.split('/')[3], 'status': 'in_progress'})
+
+
+def test_openai_batch_run_cancels_timed_out_batches(test_client, monkeypatch):
+    """
+    Given batches that are still running past OPENAI_BATCH_TIMEOUT
+    When the run checks on them
+    Then each is cancelled, its products resubmitted once and finally reported as failed
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StalledBatchAPIStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(current_app.config, 'OPENAI_API_BASE', f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setitem(current_app.config, 'OPENAI_API_KEY', 'openai-key')
+    monkeypatch.setitem(current_app.config, 'OPENAI_BATCH_TIMEOUT', 0)
+    results = []
+
+    try:
+        success, _, state = OpenAIBatchService.run(
+            product_ids=[1],
+            regenerate=True,
+            on_result=results.append,
+            load_products=lambda product_ids: [{'id': 1, 'title': 'Product 1', 'description': None}],
+            wait=False
+        )
+    finally:
+        server.shutdown()
+
+    assert success and state['finished']
+    assert _StalledBatchAPIStub.cancelled == [batch['id'] for batch in state['batches']]
+    assert len(state['batches']) == current_app.config['OPENAI_BATCH_MAX_ATTEMPTS']
+    assert results == [{'product_id': 1, 'error': "Error generating description: batch timed_out"}]
@@ -0,0 +1,29 @@
+import fakeredis
+
+from app.services import optimize_job_service
+from app.services.optimize_job_service import OptimizeJobService
+
+
+def test_resume_optimize_job_only_resumes_stalled_jobs(test_client, monkeypatch):
+    """
+    Given a running job whose worker keeps renewing its lease, and one whose lease expired
+    When both are resumed
+    Then the live job is left alone and the stalled one is queued again
+    """
+    monkeypatch.setattr(optimize_job_service, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    queued = []
+    monkeypatch.setattr(optimize_job_service, 'enqueue_task', lambda task_name, *args, **kwargs: queued.append(args))
+    for job_id in ('live', 'stalled'):
+        OptimizeJobService._save_job({
+            'id': job_id, 'user_id': 1, 'product_ids': [1, 2], 'keywords': None, 'regenerate': False,
+            'mode': 'batch', 'openai_batch': None, 'status': 'waiting', 'error': None,
+            'created_at': 0, 'started_at': 0, 'finished_at': None
+        })
+    OptimizeJobService._renew_lease('live')
+
+    success, message, _ = OptimizeJobService.resume_optimize_job('live', user_id=1)
+    assert not success and message == "The job is still waiting"
+
+    success, _, job = OptimizeJobService.resume_optimize_job('stalled', user_id=1)
+    assert success and job['status'] == 'queued'
+    assert queued == [('stalled',)]
@@ -0,0 +1,286 @@
+import json
+from types import SimpleNamespace
+
+from app.services.product_service import ProductService, SHOPIFY_PRODUCT_FIELDS
+from app.services.shopify_client import ShopifyClient
+
+
+class FakeResponse:
+    def __init__(self, products, link=None):
+        self.status_code = 200
+        self.text = ''
+        self.headers = {'Link': link} if link else {}
+        self._products = products
+
+    def iter_content(self, chunk_size=1):
+        body = json.dumps({'products': self._products}).encode('utf-8')
+        for offset in range(0, len(body), 7):
+            yield body[offset:offset + 7]
+
+    def close(self):
+        pass
+
+
+def test_parse_next_page_info():
+    """
+    Given a Shopify Link header with previous and next cursors
+    When the next cursor is extracted
+    Then only the rel="next" page_info is returned
+    """
+    link = ('<https://shop.myshopify.com/admin/api/2024-01/products.json?limit=250&page_info=prev123>; rel="previous", '
+            '<https://shop.myshopify.com/admin/api/2024-01/products.json?limit=250&page_info=next456>; rel="next"')
+    assert ProductService._parse_next_page_info(link) == 'next456'
+    assert ProductService._parse_next_page_info(link.split(', ')[0]) is None
+    assert ProductService._parse_next_page_info(None) is None
+
+
+def test_iter_shopify_product_pages_follows_cursors(monkeypatch):
+    """
+    Given a catalog split across two pages
+    When the pages are iterated
+    Then the page_info cursor of the first page is sent for the second one
+    """
+    calls = []
+    pages = [
+        FakeResponse([{'id': 1}, {'id': 2}],
+                     '<https://shop.myshopify.com/admin/api/2024-01/products.json?page_info=abc>; rel="next"'),
+        FakeResponse([{'id': 3}]),
+    ]
+
+    def fake_request(self, method, url, params=None, **kwargs):
+        calls.append(dict(params))
+        return pages[len(calls) - 1]
+
+    monkeypatch.setattr(ShopifyClient, 'request', fake_request)
+    store = SimpleNamespace(store_url='shop.myshopify.com', access_token='token')
+
+    result = [(products, next_page_info) for products, _, next_page_info in
+              ProductService._iter_shopify_product_pages(store, limit=2)]
+
+    assert result == [([{'id': 1}, {'id': 2}], 'abc'), ([{'id': 3}], None)]
+    assert calls == [{'limit': 2, 'fields': SHOPIFY_PRODUCT_FIELDS},
+                     {'limit': 2, 'fields': SHOPIFY_PRODUCT_FIELDS, 'page_info': 'abc'}]
+
+
+def test_product_fingerprint_ignores_non_content_fields():
+    """
+    Given two payloads of the same product that only differ in updated_at
+    When their content fingerprints are computed
+    Then the fingerprints match, and change as soon as a content field changes
+    """
+    product = {'id': 1, 'title': 'Mug', 'body_html': '<p>Blue</p>', 'updated_at': '2024-01-01T00:00:00Z'}
+    touched = dict(product, updated_at='2024-02-01T00:00:00Z')
+    edited = dict(product, body_html='<p>Red</p>')
+
+    fingerprint = ProductService._product_data_from_shopify(product)['content_hash']
+
+    assert len(fingerprint) == 32
+    assert fingerprint == ProductService._product_data_from_shopify(touched)['content_hash']
+    assert fingerprint != ProductService._product_data_from_shopify(edited)['content_hash']
+
+
+def test_update_description_endpoint_keeps_token_counts(test_client, monkeypatch):
+    """
+    Given a generated description and a signed in user
+    When the description is edited through PUT /descriptions/<id>
+    Then it is updated as a draft without touching its token counts
+    """
+    from flask import current_app
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+    from app.models.optimized_description import OptimizedDescription, DescriptionStatus
+    from app.services.crud import CRUD
+
+    monkeypatch.setitem(current_app.config, 'JWT_SECRET_KEY', 'test-secret')
+    description = SimpleNamespace(id=7, product_id=1, original_description='old', optimized_description='generated',
+                                  status=DescriptionStatus.DRAFT, prompt_tokens=120, completion_tokens=80,
+                                  updated_at=None)
+    monkeypatch.setattr(User, 'query', SimpleNamespace(get=lambda user_id: SimpleNamespace(id=1)))
+    monkeypatch.setattr(OptimizedDescription, 'query', SimpleNamespace(get=lambda description_id: description))
+    updates = []
+
+    def fake_update(model, filters, data):
+        updates.append(data)
+        description.optimized_description = data['optimized_description']
+
+    monkeypatch.setattr(CRUD, 'update', fake_update)
+
+    # A client of its own, the fixture's preserves the request context past the app context
+    response = current_app.test_client().put('/v1/product/descriptions/7', json={'optimized_description': 'edited'},
+                               headers={'Authorization': f"Bearer {create_access_token(identity='1')}"})
+
+    assert response.status_code == 200
+    assert response.get_json()['data']['optimized_description'] == 'edited'
+    assert updates == [{'optimized_description': 'edited', 'status': DescriptionStatus.DRAFT}]
+
+
+def test_final_watermark_stops_before_sync_start(test_client):
+    """
+    Given a sync that saw a product updated after the sync started
+    When its final watermark is computed
+    Then the watermark stops at the sync start minus the safety margin, so mid-sync edits are fetched again
+    """
+    from datetime import datetime, timedelta
+    import pytz
+
+    started_at = datetime(2024, 1, 2, 12, 0, tzinfo=pytz.UTC)
+    margin = timedelta(seconds=test_client.application.config['SHOPIFY_SYNC_WATERMARK_MARGIN'])
+
+    assert ProductService._final_watermark(started_at + timedelta(minutes=5), started_at) == started_at - margin
+    assert ProductService._final_watermark(started_at - timedelta(days=1), started_at) == started_at - timedelta(days=1)
+    assert ProductService._final_watermark(None, started_at) is None
+
+
+def test_fetch_products_finalizes_completed_checkpoint_and_respects_lock(test_client, monkeypatch):
+    """
+    Given a checkpoint saved after the last page of a sync that died before clearing it
+    When the store is synced again, while another sync holds its lock and as a redelivery of the dead sync's job
+    Then the locked attempt is refused and the redelivered job takes its lock back and only finalizes,
+    without fetching or counting pages twice
+    """
+    import fakeredis
+    from app.services import product_service, sync_checkpoint
+    from app.services.sync_checkpoint import SyncCheckpoint
+
+    monkeypatch.setattr(sync_checkpoint, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(product_service.StoreService, 'get_store_by_id',
+                        staticmethod(lambda store_id: SimpleNamespace(id=store_id, sync_watermark=None)))
+    monkeypatch.setattr(ProductService, '_load_existing_products', staticmethod(lambda store_id: {}))
+    monkeypatch.setattr(product_service.CRUD, 'update', lambda model, condition, data: None)
+
+    def no_pages(*args, **kwargs):
+        raise AssertionError('a finished sync must not fetch pages again')
+
+    monkeypatch.setattr(ProductService, '_iter_shopify_product_pages', staticmethod(no_pages))
+    SyncCheckpoint.save(1, 'rest', {
+        'full_resync': False, 'started_at': '2024-01-02T12:00:00+00:00', 'page_info': None,
+        'watermark': None, 'new_watermark': '2024-01-02T11:00:00+00:00',
+        'pages': 3, 'products_seen': 600, 'added': 5, 'updated': 7, 'unchanged': 588
+    })
+
+    other_sync = SyncCheckpoint.acquire_lock(1)
+    success, message, _ = ProductService.fetch_products_from_shopify(1)
+    assert not success and message == "A product sync of this store is already running"
+    SyncCheckpoint.release_lock(1, other_sync)
+
+    # The worker running job-1 died holding the lock
+    assert SyncCheckpoint.acquire_lock(1, 'job-1') == 'job-1'
+    assert SyncCheckpoint.acquire_lock(1, 'job-2') is None
+    success, _, data = ProductService.fetch_products_from_shopify(1, lock_owner='job-1')
+    assert success
+    assert (data['added'], data['updated'], data['pages']) == (5, 7, 3)
+    assert SyncCheckpoint.load(1, 'rest') is None
+    assert SyncCheckpoint.acquire_lock(1)
+
+
+def test_refresh_endpoint_fetches_products_by_id_in_batches(sqlite_db, monkeypatch):
+    """
+    Given a store with 520 local products, one of them deleted in Shopify and one renamed there
+    When the products and an unknown id are refreshed through the refresh endpoint
+    Then Shopify is asked for 250 ids per request, each from a worker with its own app context,
+    the results go through the sync upsert and the unknown and deleted products are reported
+    """
+    import threading
+    from flask import current_app, has_app_context
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+    from app.models.product import Product
+    from app.services import product_service
+
+    monkeypatch.setitem(current_app.config, 'JWT_SECRET_KEY', 'test-secret')
+    monkeypatch.setattr(User, 'query', SimpleNamespace(get=lambda user_id: SimpleNamespace(id=1)))
+    monkeypatch.setattr(product_service.StoreService, 'get_store_by_id', staticmethod(
+        lambda store_id: SimpleNamespace(id=store_id, store_url='shop.myshopify.com', access_token='token')
+    ))
+    shopify_products = {1000 + index: {'id': 1000 + index, 'title': f'Product {index}'} for index in range(520)}
+    for shopify_product in shopify_products.values():
+        product_data = ProductService._product_data_from_shopify(shopify_product)
+        sqlite_db.session.add(Product(store_id=1, shopify_product_id=shopify_product['id'], **product_data))
+    sqlite_db.session.commit()
+    product_ids = [product_id for product_id, in sqlite_db.session.query(Product.id).order_by(Product.id)]
+    deleted_product_id = product_ids[0]
+    del shopify_products[1000]
+    shopify_products[1001] = {'id': 1001, 'title': 'Renamed'}
+
+    main_thread = threading.current_thread()
+    requested_ids = []
+
+    def get(client, url, params=None, **kwargs):
+        assert has_app_context() and threading.current_thread() is not main_thread
+        ids = [int(shopify_product_id) for shopify_product_id in params['ids'].split(',')]
+        requested_ids.append(ids)
+        return FakeResponse([shopify_products[shopify_product_id] for shopify_product_id in ids
+                             if shopify_product_id in shopify_products])
+
+    monkeypatch.setattr(ShopifyClient, 'get', get)
+    upserted = []
+    upsert_products = ProductService._upsert_products
+
+    def spy_upsert_products(store_id, products, existing_products, chunk_size):
+        upserted.extend(product['id'] for product in products)
+        return upsert_products(store_id, products, existing_products, chunk_size)
+
+    monkeypatch.setattr(ProductService, '_upsert_products', staticmethod(spy_upsert_products))
+
+    # A client of its own, the fixture's preserves the request context past the app context
+    response = current_app.test_client().post(
+        '/v1/product/stores/1/products/refresh', json={'product_ids': product_ids + [99999]},
+        headers={'Authorization': f"Bearer {create_access_token(identity='1')}"}
+    )
+
+    assert response.status_code == 200
+    assert sorted(len(ids) for ids in requested_ids) == [20, 250, 250]
+    assert sorted(upserted) == sorted(shopify_products)
+    assert response.get_json()['data'] == {
+        'requested': 521,
+        'refreshed': 519,
+        'updated': 1,
+        'unchanged': 518,
+        'missing_in_shopify': [deleted_product_id],
+        'not_found': [99999],
+        'requests': 3
+    }
+
+
+def test_upsert_products_inserts_then_only_writes_changed_rows(sqlite_db):
+    """
+    Given an empty store and chunks of two products, one chunk holding the same product twice
+    When the store is synced, then synced again with one product changed and one created meanwhile by another sync
+    Then the first sync inserts one row per product, and the second updates the changed and concurrently
+    created rows without touching the updated_at of the unchanged ones
+    """
+    from datetime import datetime
+    from app.models.product import Product
+
+    existing_products = {}
+    added, updated, unchanged = ProductService._upsert_products(1, [
+        {'id': 1, 'title': 'Mug'},
+        {'id': 2, 'title': 'Cup'},
+        {'id': 3, 'title': 'Plate (old)'},
+        {'id': 3, 'title': 'Plate'}
+    ], existing_products, chunk_size=2)
+
+    assert (added, updated, unchanged) == (3, 0, 0)
+    titles = dict(sqlite_db.session.query(Product.shopify_product_id, Product.title))
+    assert titles == {1: 'Mug', 2: 'Cup', 3: 'Plate'}
+    assert set(existing_products) == {1, 2, 3}
+
+    old_updated_at = datetime(2024, 1, 1)
+    sqlite_db.session.query(Product).update({'updated_at': old_updated_at})
+    sqlite_db.session.commit()
+    # Another sync stored product 3 after this one loaded the existing products
+    del existing_products[3]
+
+    added, updated, unchanged = ProductService._upsert_products(1, [
+        {'id': 1, 'title': 'Large mug'},
+        {'id': 2, 'title': 'Cup'},
+        {'id': 3, 'title': 'Dinner plate'}
+    ], existing_products, chunk_size=2)
+
+    assert (added, updated, unchanged) == (1, 1, 1)
+    rows = {shopify_product_id: (title, updated_at) for shopify_product_id, title, updated_at in
+            sqlite_db.session.query(Product.shopify_product_id, Product.title, Product.updated_at)}
+    assert rows[2] == ('Cup', old_updated_at)
+    assert rows[1][0] == 'Large mug' and rows[1][1] != old_updated_at
+    assert rows[3][0] == 'Dinner plate' and rows[3][1] != old_updated_at
+    assert sqlite_db.session.query(Product).count() == 3
@@ -0,0 +1,37 @@
+from app.services.prompt_compaction import PromptCompaction
+
+
+def test_html_to_text_keeps_copy_lists_and_tables_only():
+    """
+    Given Shopify body_html with inline styles, a tracking pixel, a script, a list and a table
+    When it is reduced to text
+    Then only the visible copy remains, one line per block with table cells separated by pipes
+    """
+    html = (
+        '<div style="color:#333;font-family:Arial"><h2>Stoneware&nbsp;mug</h2>'
+        '<p>A <b>350 ml</b> mug.<br>Dishwasher safe.</p>'
+        '<img src="https://pixel.example.com/t.gif" width="1" height="1">'
+        '<script>dataLayer.push({event: "view_item"})</script><style>td { padding: 4px }</style>'
+        '<ul><li>Handmade</li><li>Matte glaze</li></ul>'
+        '<table><tr><th>Size</th><th>Weight</th></tr><tr><td>350 ml</td><td>400 g</td></tr></table></div>'
+    )
+
+    assert PromptCompaction.html_to_text(html) == (
+        'Stoneware mug\nA 350 ml mug.\nDishwasher safe.\n- Handmade\n- Matte glaze\nSize | Weight\n350 ml | 400 g'
+    )
+    assert PromptCompaction.html_to_text(None) == ''
+
+
+def test_compact_description_enforces_the_token_budget():
+    """
+    Given a description far longer than the token budget
+    When it is compacted
+    Then it is cut at a word boundary within the budget and marked as truncated
+    """
+    description = '<p>' + 'glazed stoneware ' * 500 + '</p>'
+
+    compacted = PromptCompaction.compact_description(description, 50)
+
+    assert compacted.endswith('stoneware ...') or compacted.endswith('glazed ...')
+    assert PromptCompaction.estimate_tokens(compacted) <= 51
+    assert PromptCompaction.compact_description('<p>Short mug</p>', 50) == 'Short mug'
@@ -0,0 +1,124 @@
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+import fakeredis
+import pytz
+
+from app.models.product import Product
+from app.services import sharded_sync_service, sync_checkpoint
+from app.services.crud import CRUD
+from app.services.product_service import ProductService
+from app.services.sharded_sync_service import ShardedSyncService
+from app.services.shopify_client import ShopifyClient
+from app.services.sync_checkpoint import SyncCheckpoint
+
+
+class FakeResponse:
+    def __init__(self, products):
+        self.status_code = 200
+        self.text = ''
+        self._body = json.dumps({'products': products}).encode('utf-8')
+
+    def iter_content(self, chunk_size=1):
+        yield self._body
+
+    def close(self):
+        pass
+
+
+def test_plan_shards_splits_local_ids_into_ranges(sqlite_db):
+    """
+    Given a store with five local products and a store with none
+    When their syncs are planned in shards of two products
+    Then the first is split at its local id quantiles with an open last range, and the second is not sharded
+    """
+    sqlite_db.session.add_all([
+        Product(store_id=1, shopify_product_id=shopify_product_id, title=f'Product {shopify_product_id}')
+        for shopify_product_id in (50, 10, 40, 20, 30)
+    ])
+    sqlite_db.session.commit()
+
+    assert ShardedSyncService.plan_shards(1, 2) == [(0, 30), (29, 50), (49, None)]
+    assert ShardedSyncService.plan_shards(1, 10) == [(0, None)]
+    assert ShardedSyncService.plan_shards(2, 2) == []
+
+
+def test_iter_product_id_range_pages_with_since_id_and_stops_at_max_id(test_client, monkeypatch):
+    """
+    Given a catalog of products 10 to 70
+    When the products with 20 < id < 60 updated since a watermark are walked two per page
+    Then pages are requested by since_id with the watermark, and the walk stops at the first id past the range
+    """
+    catalog = [{'id': shopify_product_id, 'title': 'Mug'} for shopify_product_id in range(10, 80, 10)]
+    requests_sent = []
+
+    def get(client, url, params=None, **kwargs):
+        requests_sent.append(params)
+        products = [product for product in catalog if product['id'] > params['since_id']]
+        return FakeResponse(products[:params['limit']])
+
+    monkeypatch.setattr(ShopifyClient, 'get', get)
+    watermark = datetime(2024, 1, 2, tzinfo=pytz.UTC)
+    store = SimpleNamespace(store_url='shop.myshopify.com', access_token='token')
+
+    pages = [[product['id'] for product in products] for products, _ in
+             ProductService._iter_shopify_product_id_range(store, 20, 60, limit=2, updated_at_min=watermark)]
+
+    assert pages == [[30, 40], [50]]
+    assert [params['since_id'] for params in requests_sent] == [20, 40]
+    assert all(params['updated_at_min'] == watermark.isoformat() for params in requests_sent)
+
+
+def test_sharded_run_renews_and_releases_the_store_lock(test_client, monkeypatch):
+    """
+    Given a sharded run holding the store's sync lock with its run id
+    When a lane stores its pages and the run is finalized
+    Then no other sync can take the lock meanwhile, the lanes renew it and finalize releases it
+    """
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(sharded_sync_service, 'redis_obj', redis)
+    monkeypatch.setattr(sync_checkpoint, 'redis_obj', redis)
+    monkeypatch.setattr(sharded_sync_service.StoreService, 'get_store_by_id',
+                        staticmethod(lambda store_id: SimpleNamespace(id=store_id, sync_watermark=None)))
+    monkeypatch.setattr(ProductService, '_load_existing_products', staticmethod(lambda store_id: {}))
+    monkeypatch.setattr(ProductService, '_iter_shopify_product_id_range', staticmethod(
+        lambda store, since_id, max_id, updated_at_min=None: iter([([{'id': since_id + 1}], 0.1)])
+    ))
+    monkeypatch.setattr(ProductService, '_upsert_products', staticmethod(lambda *args: (1, 0, 0)))
+    monkeypatch.setattr(CRUD, 'update', staticmethod(lambda *args: None))
+
+    assert SyncCheckpoint.acquire_lock(1, 'run-1') == 'run-1'
+    assert SyncCheckpoint.acquire_lock(1) is None
+    redis.expire(SyncCheckpoint._lock_key(1), 5)
+
+    summary = ShardedSyncService.sync_shards(1, [(0, 30), (29, None)], 'run-1')
+    assert summary['success'] and summary['pages'] == 2
+    assert redis.ttl(SyncCheckpoint._lock_key(1)) > 5
+
+    success, _, data = ShardedSyncService.finalize(1, 'run-1', [summary])
+    assert success and data['added'] == 2
+    assert not redis.exists(SyncCheckpoint._lock_key(1))
+
+
+def test_full_resync_without_redis_fails_instead_of_skipping_deletions(test_client, monkeypatch):
+    """
+    Given the shards of a full resync that all succeeded while Redis was unavailable
+    When the resync is finalized
+    Then it fails and reports that deleted products were not detected, without advancing the watermark
+    """
+    monkeypatch.setattr(sharded_sync_service, 'redis_obj', None)
+    monkeypatch.setattr(sync_checkpoint, 'redis_obj', None)
+    updates = []
+    monkeypatch.setattr(CRUD, 'update', staticmethod(lambda *args: updates.append(args)))
+    shard_summary = {
+        'success': True, 'message': None, 'started_at': '2024-01-02T10:00:00+00:00', 'shards': 1, 'pages': 1,
+        'products_seen': 2, 'added': 2, 'updated': 0, 'unchanged': 0, 'watermark': '2024-01-02T09:00:00+00:00'
+    }
+
+    success, message, data = ShardedSyncService.finalize(1, 'run', [shard_summary], full_resync=True)
+
+    assert not success
+    assert 'deleted products' in message
+    assert data['deleted'] is None and data['added'] == 2
+    assert updates == []
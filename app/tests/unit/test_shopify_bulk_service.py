@@ -0,0 +1,140 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from flask import current_app
+
+from app.services import shopify_bulk_service, sync_checkpoint
+from app.services.product_service import ProductService
+from app.services.shopify_bulk_service import ShopifyBulkService, BULK_OPERATION_RUN_QUERY
+from app.services.sync_checkpoint import SyncCheckpoint
+
+BULK_RESULT = [
+    {'id': 'gid://shopify/Product/101', 'legacyResourceId': '101', 'title': 'Mug', 'descriptionHtml': '<p>Blue</p>',
+     'vendor': 'Acme', 'productType': 'Kitchen', 'handle': 'mug', 'status': 'ACTIVE',
+     'createdAt': '2024-01-01T00:00:00Z', 'updatedAt': '2024-02-01T00:00:00Z'},
+    {'id': 'gid://shopify/ProductImage/1', '__parentId': 'gid://shopify/Product/101'},
+    {'id': 'gid://shopify/Product/102', 'legacyResourceId': '102', 'title': 'Cup', 'descriptionHtml': '',
+     'vendor': 'Acme', 'productType': 'Kitchen', 'handle': 'cup', 'status': 'DRAFT',
+     'createdAt': '2024-01-02T00:00:00Z', 'updatedAt': '2024-02-02T00:00:00Z'},
+]
+
+
+class BulkResultHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = '\n'.join(json.dumps(line) for line in BULK_RESULT).encode('utf-8') + b'\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/jsonl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def bulk_result_url():
+    server = HTTPServer(('127.0.0.1', 0), BulkResultHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/bulk-result.jsonl"
+    server.shutdown()
+
+
+def test_iter_bulk_result_streams_rest_shaped_products(bulk_result_url):
+    """
+    Given a stub server serving a bulk operation JSONL result
+    When the result is streamed
+    Then each top level product is yielded in the REST payload shape and nested rows are skipped
+    """
+    products = list(ShopifyBulkService.iter_bulk_result(bulk_result_url))
+
+    assert [product['id'] for product in products] == [101, 102]
+    assert products[0]['body_html'] == '<p>Blue</p>'
+    assert products[0]['product_type'] == 'Kitchen'
+    assert products[1]['status'] == 'draft'
+
+
+@pytest.fixture
+def bulk_sync(test_client, monkeypatch, bulk_result_url):
+    """
+    Stubbed store, GraphQL API and upsert stage of a bulk sync, with checkpoints in fakeredis
+    """
+    monkeypatch.setattr(sync_checkpoint, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_SYNC_CHUNK_SIZE', 1)
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_BULK_POLL_INTERVAL', 0)
+    monkeypatch.setattr(shopify_bulk_service.StoreService, 'get_store_by_id', staticmethod(
+        lambda store_id: SimpleNamespace(id=store_id, store_url='shop.myshopify.com', sync_watermark=None)
+    ))
+    monkeypatch.setattr(ProductService, '_load_existing_products', staticmethod(lambda store_id: {}))
+    state = {'queries': [], 'statuses': [], 'upserted': [], 'watermarks': []}
+
+    def graphql(store, query, variables=None):
+        if query == BULK_OPERATION_RUN_QUERY:
+            state['queries'].append('run')
+            return {'bulkOperationRunQuery': {'bulkOperation': {'id': 'gid://shopify/BulkOperation/1',
+                                                                'status': 'CREATED'}, 'userErrors': []}}
+        state['queries'].append('poll')
+        status = state['statuses'].pop(0)
+        return {'currentBulkOperation': {'id': 'gid://shopify/BulkOperation/1', 'status': status, 'errorCode': None,
+                                         'url': bulk_result_url if status == 'COMPLETED' else None}}
+
+    def upsert_products(store_id, products, existing_products, chunk_size):
+        state['upserted'].append([product['id'] for product in products])
+        return len(products), 0, 0
+
+    monkeypatch.setattr(ShopifyBulkService, '_graphql', staticmethod(graphql))
+    monkeypatch.setattr(ProductService, '_upsert_products', staticmethod(upsert_products))
+    monkeypatch.setattr(shopify_bulk_service.CRUD, 'update',
+                        staticmethod(lambda model, filters, data: state['watermarks'].append(data['sync_watermark'])))
+    return state
+
+
+def test_bulk_sync_runs_the_export_and_upserts_its_result(bulk_sync):
+    """
+    Given a store whose bulk export runs for one poll before completing
+    When the store is synced with the bulk engine in chunks of one product
+    Then the export is started and polled, each product is upserted and reported as a page, and the sync finishes
+    """
+    bulk_sync['statuses'] = ['RUNNING', 'COMPLETED']
+    progress = []
+
+    success, _, data = ShopifyBulkService.fetch_products_with_bulk_operation(1, progress_callback=progress.append)
+
+    assert success
+    assert bulk_sync['queries'] == ['run', 'poll', 'poll']
+    assert bulk_sync['upserted'] == [[101], [102]]
+    assert [update['pages'] for update in progress] == [1, 2]
+    assert (data['added'], data['pages'], data['products_seen']) == (2, 2, 2)
+    assert len(bulk_sync['watermarks']) == 1
+    assert SyncCheckpoint.load(1, 'bulk') is None
+    assert SyncCheckpoint.acquire_lock(1)
+
+
+def test_bulk_sync_resumes_waiting_for_a_running_export(bulk_sync):
+    """
+    Given a bulk sync that died while its export was still running, and later one whose export fails
+    When the store is synced again
+    Then the running export is waited for instead of starting another one,
+    and a failed export clears the checkpoint so the next sync starts over
+    """
+    SyncCheckpoint.save(1, 'bulk', {
+        'full_resync': False, 'operation_id': 'gid://shopify/BulkOperation/1', 'export_completed': False, 'url': None,
+        'started_at': '2024-03-01T00:00:00+00:00', 'watermark': None, 'new_watermark': None, 'products_seen': 0,
+        'chunks': 0, 'added': 0, 'updated': 0, 'unchanged': 0
+    })
+    bulk_sync['statuses'] = ['COMPLETED']
+
+    success, _, data = ShopifyBulkService.fetch_products_with_bulk_operation(1)
+
+    assert success and data['added'] == 2
+    assert bulk_sync['queries'] == ['poll']
+
+    bulk_sync['statuses'] = ['RUNNING', 'FAILED']
+    success, message, _ = ShopifyBulkService.fetch_products_with_bulk_operation(1)
+    assert not success and message == "Bulk operation failed: None"
+    assert SyncCheckpoint.load(1, 'bulk') is None
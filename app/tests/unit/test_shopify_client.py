@@ -0,0 +1,98 @@
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.custom_errors import ShopifyAPIError
+from app.services.shopify_client import ShopifyClient
+
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    """Answers 429 to the first request and 200 afterwards"""
+    requests_seen = 0
+
+    def do_GET(self):
+        ThrottlingHandler.requests_seen += 1
+        if ThrottlingHandler.requests_seen == 1:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_shop():
+    ThrottlingHandler.requests_seen = 0
+    server = HTTPServer(('127.0.0.1', 0), ThrottlingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_port}"
+    server.shutdown()
+
+
+def test_request_retries_throttled_responses(stub_shop):
+    """
+    Given a shop that throttles the first request with Retry-After: 0
+    When a GET is sent through the client
+    Then it is retried on the pooled session and the successful response is returned
+    """
+    client = ShopifyClient(stub_shop, 'token')
+
+    response = client.get(f"http://{stub_shop}/admin/api/2024-01/shop.json")
+
+    assert response.status_code == 200
+    assert ThrottlingHandler.requests_seen == 2
+    assert ShopifyClient._get_session(stub_shop) is ShopifyClient._get_session(stub_shop)
+
+
+def test_api_url_uses_configured_version():
+    """
+    Given a client created with an explicit API version
+    When an Admin API path is resolved
+    Then the URL points at that version instead of the configured default
+    """
+    client = ShopifyClient('shop.myshopify.com', api_version='2025-01')
+
+    assert client.api_url('/products.json') == 'https://shop.myshopify.com/admin/api/2025-01/products.json'
+
+
+def test_request_fails_fast_while_the_shop_circuit_is_open(stub_shop, monkeypatch):
+    """
+    Given a shop whose circuit breaker is open
+    When a GET is sent through the client
+    Then a 503 ShopifyAPIError is raised without the shop being called
+    """
+    monkeypatch.setattr(CircuitBreaker, 'allow', staticmethod(lambda name: (False, 12.0, None)))
+    client = ShopifyClient(stub_shop, 'token')
+
+    with pytest.raises(ShopifyAPIError) as error:
+        client.get(f"http://{stub_shop}/admin/api/2024-01/shop.json")
+
+    assert error.value.status == 503
+    assert ThrottlingHandler.requests_seen == 0
+
+
+def test_retry_delay_is_capped_at_the_configured_maximum():
+    """
+    Given throttled responses asking to retry after a huge, infinite, negative or valid number of seconds
+    When the delay before the next retry is computed
+    Then it never exceeds the configured maximum wait nor goes below zero
+    """
+    client = ShopifyClient('shop.myshopify.com')
+    client.max_retry_wait = 30
+
+    def delay(retry_after):
+        return client._retry_delay(0, SimpleNamespace(headers={'Retry-After': retry_after}))
+
+    assert delay('86400') == 30
+    assert delay('inf') == 30
+    assert delay('nan') == 30
+    assert delay('-5') == 0
+    assert delay('2.5') == 2.5
@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.services import shopify_rate_limiter
+from app.services.custom_errors import ShopifyRateLimitError
+from app.services.shopify_rate_limiter import ShopifyRateLimiter
+from config import Config_is
+
+
+class UnreachableRedis:
+    def eval(self, *args):
+        raise RedisConnectionError('Connection refused')
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(shopify_rate_limiter, 'redis_obj', redis)
+    monkeypatch.setattr(Config_is, 'SHOPIFY_REST_BUCKET_SIZE', 2)
+    monkeypatch.setattr(Config_is, 'SHOPIFY_REST_LEAK_RATE', 20)
+    return redis
+
+
+def _tokens(redis, api: str = 'rest') -> float:
+    return float(redis.hget(ShopifyRateLimiter._bucket_key('shop.myshopify.com', api), 'tokens'))
+
+
+def test_acquire_waits_for_the_bucket_to_refill(redis):
+    """
+    Given a REST bucket of two calls refilled at 20 calls per second
+    When three calls are made at once
+    Then the first two go through at once and the third waits about one refill interval
+    """
+    assert ShopifyRateLimiter.acquire('shop.myshopify.com') == 0
+    assert ShopifyRateLimiter.acquire('shop.myshopify.com') == 0
+
+    waited = ShopifyRateLimiter.acquire('shop.myshopify.com')
+
+    assert 0 < waited <= 0.06
+
+
+def test_acquire_fails_fast_without_waiting(redis, monkeypatch):
+    """
+    Given an empty REST bucket
+    When a call asks not to wait, or to wait less than the bucket needs to refill
+    Then ShopifyRateLimitError is raised without sleeping
+    """
+    monkeypatch.setattr(Config_is, 'SHOPIFY_REST_LEAK_RATE', 1)
+    monkeypatch.setattr(shopify_rate_limiter.time, 'sleep', lambda seconds: pytest.fail('must not sleep'))
+    ShopifyRateLimiter.acquire('shop.myshopify.com')
+    ShopifyRateLimiter.acquire('shop.myshopify.com')
+
+    with pytest.raises(ShopifyRateLimitError):
+        ShopifyRateLimiter.acquire('shop.myshopify.com', wait=False)
+    with pytest.raises(ShopifyRateLimitError):
+        ShopifyRateLimiter.acquire('shop.myshopify.com', max_wait=0.1)
+
+
+def test_buckets_follow_the_limits_shopify_reports(redis):
+    """
+    Given REST responses with X-Shopify-Shop-Api-Call-Limit, a 429, and a GraphQL throttleStatus
+    When they are applied to the shop's buckets
+    Then the buckets take Shopify's capacity, remaining calls or points and restore rate
+    """
+    ShopifyRateLimiter.update_from_response('shop.myshopify.com', SimpleNamespace(
+        status_code=200, headers={'X-Shopify-Shop-Api-Call-Limit': '38/40'}
+    ))
+    bucket = redis.hgetall(ShopifyRateLimiter._bucket_key('shop.myshopify.com', 'rest'))
+    assert float(bucket['capacity']) == 40 and float(bucket['rate']) == 20
+    assert _tokens(redis) == 2
+
+    ShopifyRateLimiter.update_from_response('shop.myshopify.com', SimpleNamespace(status_code=429, headers={}))
+    assert _tokens(redis) == 0
+
+    ShopifyRateLimiter.update_from_graphql('shop.myshopify.com', {'extensions': {'cost': {'throttleStatus': {
+        'maximumAvailable': 2000.0, 'currentlyAvailable': 150, 'restoreRate': 100.0
+    }}}})
+    bucket = redis.hgetall(ShopifyRateLimiter._bucket_key('shop.myshopify.com', 'graphql'))
+    assert (float(bucket['capacity']), float(bucket['tokens']), float(bucket['rate'])) == (2000, 150, 100)
+
+
+def test_rate_limiter_lets_calls_through_when_redis_fails(test_client, monkeypatch):
+    """
+    Given a Redis server that cannot be reached
+    When capacity is taken and Shopify's limits are applied
+    Then calls are let through at once and nothing raises
+    """
+    monkeypatch.setattr(shopify_rate_limiter, 'redis_obj', UnreachableRedis())
+
+    assert ShopifyRateLimiter.acquire('shop.myshopify.com', wait=False) == 0
+    ShopifyRateLimiter.update_from_response('shop.myshopify.com', SimpleNamespace(
+        status_code=429, headers={'X-Shopify-Shop-Api-Call-Limit': '40/40'}
+    ))
@@ -0,0 +1,102 @@
+import time
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from flask import current_app
+from flask_jwt_extended import create_access_token
+
+from app.models import User
+from app.services import sync_job_service
+from app.services.sync_job_service import SyncJobService
+
+
+@pytest.fixture
+def redis(test_client, monkeypatch):
+    redis = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(sync_job_service, 'redis_obj', redis)
+    monkeypatch.setattr(sync_job_service.StoreService, 'get_store_by_id',
+                        staticmethod(lambda store_id: SimpleNamespace(id=store_id, sync_watermark=None)))
+    return redis
+
+
+def test_sync_endpoint_queues_a_job_and_reports_its_status(redis, monkeypatch):
+    """
+    Given a signed in user and a store
+    When a sync is started through the sync endpoint and its job is then looked up
+    Then the sync is queued as a celery job, answered with 202, and the job status is served for its store only
+    """
+    monkeypatch.setitem(current_app.config, 'JWT_SECRET_KEY', 'test-secret')
+    monkeypatch.setattr(User, 'query', SimpleNamespace(get=lambda user_id: SimpleNamespace(id=1)))
+    queued = []
+    monkeypatch.setattr(sync_job_service, 'enqueue_task', lambda task, *args: queued.append((task, args)))
+    # A client of its own, the fixture's preserves the request context past the app context
+    client = current_app.test_client()
+    headers = {'Authorization': f"Bearer {create_access_token(identity='1')}"}
+
+    response = client.post('/v1/product/stores/3/products/sync', json={'mode': 'bulk'}, headers=headers)
+
+    assert response.status_code == 202
+    job = response.get_json()['data']
+    assert (job['store_id'], job['mode'], job['status'], job['eta_seconds']) == (3, 'bulk', 'queued', None)
+    assert queued == [('sync_store_products', (job['id'],))]
+    response = client.get(f"/v1/product/stores/3/products/sync/{job['id']}", headers=headers)
+    assert response.status_code == 200 and response.get_json()['data']['id'] == job['id']
+    assert client.get(f"/v1/product/stores/4/products/sync/{job['id']}", headers=headers).status_code == 404
+
+
+def test_run_sync_job_records_progress_and_result(redis, monkeypatch):
+    """
+    Given a queued REST sync job of a store with 400 products
+    When the job runs and the sync reports its progress
+    Then the running job shows the progress with an ETA, and the finished job holds the result
+    """
+    monkeypatch.setattr(sync_job_service, 'enqueue_task', lambda task, *args: None)
+    monkeypatch.setattr(sync_job_service.ProductService, 'count_shopify_products',
+                        staticmethod(lambda store, watermark: 400))
+    _, _, job = SyncJobService.start_sync_job(3, 1)
+    running_jobs = []
+
+    def fetch_products(store_id, full_resync, progress_callback, lock_owner):
+        assert lock_owner == job['id']
+        progress_callback({'pages': 1, 'products_seen': 100, 'rows_written': 100})
+        running_jobs.append(SyncJobService.get_sync_job(job['id']))
+        return True, "Products synced successfully", {'added': 400, 'page_stats': [{'page': 1}]}
+
+    monkeypatch.setattr(sync_job_service.ProductService, 'fetch_products_from_shopify', staticmethod(fetch_products))
+
+    finished_job = SyncJobService.run_sync_job(job['id'])
+
+    assert running_jobs[0]['status'] == 'running'
+    assert (running_jobs[0]['total'], running_jobs[0]['products_seen']) == (400, 100)
+    assert running_jobs[0]['eta_seconds'] is not None
+    assert finished_job['status'] == 'completed'
+    assert finished_job['result'] == {'message': "Products synced successfully", 'data': {'added': 400}}
+
+
+def test_job_eta_is_extrapolated_from_progress(test_client):
+    """
+    Given a running job that saw a quarter of its products in 10 seconds
+    When it is reported
+    Then its ETA is the 30 seconds the remaining products should take
+    """
+    job = {
+        'id': 'job', 'store_id': 3, 'mode': 'rest', 'full_resync': False, 'status': 'running', 'pages': 1,
+        'products_seen': 250, 'rows_written': 250, 'total': 1000, 'errors': [], 'result': None,
+        'created_at': time.time() - 11, 'started_at': time.time() - 10, 'finished_at': None
+    }
+
+    assert SyncJobService.job_to_dict(job)['eta_seconds'] == pytest.approx(30, abs=0.5)
+    assert SyncJobService.job_to_dict(dict(job, status='completed'))['eta_seconds'] is None
+
+
+def test_sync_job_is_refused_without_redis(test_client, monkeypatch):
+    """
+    Given no Redis configured
+    When a sync job is started
+    Then it is refused with an explicit error instead of failing on the missing client
+    """
+    monkeypatch.setattr(sync_job_service, 'redis_obj', None)
+
+    assert SyncJobService.start_sync_job(3, 1) == (False, "Error: Redis is not configured", None)
+    assert SyncJobService.get_sync_job('job') is None
@@ -0,0 +1,43 @@
+import json
+
+from flask import current_app, g
+
+from app.services import sync_orchestrator
+
+
+def test_sync_stores_command_syncs_each_store_in_its_own_app_context(test_client, monkeypatch):
+    """
+    Given three stores, one whose sync raises and one whose sync fails
+    When they are synced with the sync-stores command on a single worker
+    Then every store is synced in a fresh app context, the failures do not stop the others
+    and the summary adds up the stores
+    """
+    synced = []
+
+    def fetch_products(store_id, full_resync):
+        # g belongs to the app context, anything left by the previous store means a shared context
+        assert 'synced_store_id' not in g
+        g.synced_store_id = store_id
+        synced.append((store_id, full_resync))
+        if store_id == 2:
+            raise RuntimeError('database unavailable')
+        if store_id == 3:
+            return False, "Error fetching products: 401", None
+        return True, "Products synced successfully", {'pages': 2, 'products_seen': 300, 'added': 10, 'updated': 5}
+
+    monkeypatch.setattr(sync_orchestrator.ProductService, 'fetch_products_from_shopify', staticmethod(fetch_products))
+
+    result = current_app.test_cli_runner().invoke(args=[
+        'sync-stores', '--store-id', '3', '--store-id', '1', '--store-id', '2', '--workers', '1', '--full-resync'
+    ])
+
+    assert result.exit_code == 0
+    assert sorted(synced) == [(1, True), (2, True), (3, True)]
+    message, summary = result.output.split('\n', 1)
+    assert message == "Synced 3 stores. Succeeded: 1, Failed: 2"
+    summary = json.loads(summary)
+    assert (summary['succeeded'], summary['failed']) == (1, 2)
+    assert [(store['store_id'], store['success'], store['rows_written']) for store in summary['stores']] == [
+        (1, True, 15), (2, False, 0), (3, False, 0)
+    ]
+    assert summary['stores'][1]['message'] == "Error syncing products: database unavailable"
@@ -0,0 +1,21 @@
+import json
+
+import pytest
+
+from app.services.utils import iter_json_array_items
+
+
+def test_iter_json_array_items_across_chunk_boundaries():
+    """
+    Given a products payload split into chunks that cut through items and multi-byte characters
+    When its products are decoded incrementally
+    Then every product is yielded intact and a truncated payload is rejected
+    """
+    products = [{'id': product_id, 'title': 'Café ]},{ ' * product_id} for product_id in range(1, 20)]
+    body = json.dumps({'products': products}, ensure_ascii=False).encode('utf-8')
+    chunks = [body[offset:offset + 5] for offset in range(0, len(body), 5)]
+
+    assert list(iter_json_array_items(chunks, 'products')) == products
+    assert list(iter_json_array_items([b'{"products": []}'], 'products')) == []
+    with pytest.raises(ValueError):
+        list(iter_json_array_items([body[:-40]], 'products'))
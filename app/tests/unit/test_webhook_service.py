@@ -0,0 +1,144 @@
+import base64
+import hashlib
+import hmac
+import json
+from types import SimpleNamespace
+
+import fakeredis
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+
+from app.models.store import Store
+from app.services import webhook_service
+from app.services.webhook_service import ShopifyWebhookService, DUE_EVENTS_KEY, PENDING_EVENTS_KEY
+
+
+def test_verify_hmac():
+    """
+    Given a webhook body signed with the app secret
+    When the X-Shopify-Hmac-Sha256 header is verified
+    Then the genuine signature is accepted and a tampered body or missing header is rejected
+    """
+    body = b'{"id": 632910392, "title": "IPod Nano - 8GB"}'
+    signature = base64.b64encode(hmac.new(b'app-secret', body, hashlib.sha256).digest()).decode('utf-8')
+
+    assert ShopifyWebhookService.verify_hmac(body, signature, secret='app-secret')
+    assert not ShopifyWebhookService.verify_hmac(body + b' ', signature, secret='app-secret')
+    assert not ShopifyWebhookService.verify_hmac(body, None, secret='app-secret')
+
+
+def test_enqueue_product_event_keeps_newest_payload(test_client, monkeypatch):
+    """
+    Given several webhooks of the same product delivered out of order
+    When they are queued
+    Then only the newest payload stays pending, deletes win, and the product stays due at its first event's time
+    """
+    monkeypatch.setattr(webhook_service, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    update = {'id': 1, 'title': 'New', 'updated_at': '2024-01-02T10:00:00-05:00'}
+    older_update = {'id': 1, 'title': 'Old', 'updated_at': '2024-01-02T09:00:00-05:00'}
+
+    assert ShopifyWebhookService.enqueue_product_event('shop.myshopify.com', 'products/update', update)
+    due_at = webhook_service.redis_obj.zscore(DUE_EVENTS_KEY, 'shop.myshopify.com:1')
+    assert not ShopifyWebhookService.enqueue_product_event('shop.myshopify.com', 'products/update', older_update)
+    assert json.loads(webhook_service.redis_obj.hget(PENDING_EVENTS_KEY, 'shop.myshopify.com:1'))['payload'] == update
+
+    assert ShopifyWebhookService.enqueue_product_event('shop.myshopify.com', 'products/delete', {'id': 1})
+    assert not ShopifyWebhookService.enqueue_product_event('shop.myshopify.com', 'products/update', update)
+    event = json.loads(webhook_service.redis_obj.hget(PENDING_EVENTS_KEY, 'shop.myshopify.com:1'))
+    assert event['topic'] == 'products/delete'
+    assert webhook_service.redis_obj.zscore(DUE_EVENTS_KEY, 'shop.myshopify.com:1') == due_at
+
+
+def test_process_due_events_applies_due_events_and_requeues_failures(test_client, monkeypatch):
+    """
+    Given pending events of two stores, one due later, and a store whose events fail to apply
+    When the due events are processed
+    Then only due events are taken, the healthy store's are applied and the failing store's are queued again
+    """
+    monkeypatch.setattr(webhook_service, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_WEBHOOK_COALESCE_WINDOW', 0)
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/update', {'id': 1, 'title': 'A'})
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/delete', {'id': 2})
+    ShopifyWebhookService.enqueue_product_event('bad.myshopify.com', 'products/update', {'id': 3, 'title': 'C'})
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_WEBHOOK_COALESCE_WINDOW', 60)
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/update', {'id': 4, 'title': 'D'})
+
+    stores = {shop: SimpleNamespace(id=store_id, store_url=shop)
+              for store_id, shop in enumerate(('good.myshopify.com', 'bad.myshopify.com'))}
+    monkeypatch.setattr(Store, 'query', SimpleNamespace(
+        filter_by=lambda store_url: SimpleNamespace(first=lambda: stores[store_url])
+    ))
+    applied = []
+
+    def apply_shop_events(store, shop_events):
+        if store.store_url == 'bad.myshopify.com':
+            raise OperationalError('UPDATE products', {}, ConnectionError('database unavailable'))
+        applied.extend((event['topic'], event['payload']['id']) for event in shop_events)
+        return 1, 1
+
+    monkeypatch.setattr(ShopifyWebhookService, '_apply_shop_events', staticmethod(apply_shop_events))
+
+    success, _, data = ShopifyWebhookService.process_due_events()
+
+    assert not success
+    assert sorted(applied) == [('products/delete', 2), ('products/update', 1)]
+    assert data == {'events': 3, 'upserted': 1, 'deleted': 1, 'skipped': 0, 'requeued': 1, 'dropped': 0}
+    assert sorted(webhook_service.redis_obj.hkeys(PENDING_EVENTS_KEY)) == ['bad.myshopify.com:3',
+                                                                            'good.myshopify.com:4']
+
+
+def test_process_due_events_drops_poison_events_and_caps_attempts(test_client, monkeypatch):
+    """
+    Given a store's due events where one update has no title, and another store's event on its last attempt
+    When the due events are processed and the second store's database is down
+    Then the poison event is dropped while the good ones are applied, and the last attempt is not queued again
+    """
+    monkeypatch.setattr(webhook_service, 'redis_obj', fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_WEBHOOK_COALESCE_WINDOW', 0)
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_WEBHOOK_MAX_ATTEMPTS', 3)
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/update', {'id': 1, 'title': 'A'})
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/update', {'id': 2, 'vendor': 'B'})
+    ShopifyWebhookService.enqueue_product_event('good.myshopify.com', 'products/delete', {'id': 3})
+    ShopifyWebhookService._queue_event({'shop': 'bad.myshopify.com', 'topic': 'products/update', 'attempts': 3,
+                                        'payload': {'id': 4, 'title': 'D'}, 'received_at': 0}, 0)
+
+    stores = {shop: SimpleNamespace(id=store_id, store_url=shop)
+              for store_id, shop in enumerate(('good.myshopify.com', 'bad.myshopify.com'))}
+    monkeypatch.setattr(Store, 'query', SimpleNamespace(
+        filter_by=lambda store_url: SimpleNamespace(first=lambda: stores[store_url])
+    ))
+    applied = []
+
+    def apply_shop_events(store, shop_events):
+        if store.store_url == 'bad.myshopify.com':
+            raise OperationalError('UPDATE products', {}, ConnectionError('database unavailable'))
+        applied.extend(event['payload']['id'] for event in shop_events)
+        return 1, 1
+
+    monkeypatch.setattr(ShopifyWebhookService, '_apply_shop_events', staticmethod(apply_shop_events))
+
+    success, _, data = ShopifyWebhookService.process_due_events()
+
+    assert not success
+    assert sorted(applied) == [1, 3]
+    assert data == {'events': 4, 'upserted': 1, 'deleted': 1, 'skipped': 0, 'requeued': 0, 'dropped': 2}
+    assert webhook_service.redis_obj.hkeys(PENDING_EVENTS_KEY) == []
+
+
+def test_product_webhook_rejects_payload_without_id(test_client, monkeypatch):
+    """
+    Given a correctly signed product webhook whose payload has no product id
+    When it is delivered
+    Then it is answered with 400 instead of failing while being queued
+    """
+    monkeypatch.setitem(current_app.config, 'SHOPIFY_API_SECRET', 'app-secret')
+    body = b'{"title": "IPod Nano - 8GB"}'
+    signature = base64.b64encode(hmac.new(b'app-secret', body, hashlib.sha256).digest()).decode('utf-8')
+
+    response = current_app.test_client().post('/v1/webhooks/shopify/products', data=body, headers={
+        'X-Shopify-Hmac-Sha256': signature,
+        'X-Shopify-Topic': 'products/update',
+        'X-Shopify-Shop-Domain': 'shop.myshopify.com'
+    })
+
+    assert response.status_code == 400
@@ -0,0 +1,104 @@
+"""
+Tokens and wall-clock time per product of one-at-a-time description
+generation against batched prompts of K products.
+
+Calls the configured provider (GEMINI_API_KEY / OPENAI_API_KEY) for
+synthetic products, bypassing the response cache. Prompt tokens are
+estimated at 4 characters per token, output tokens are the ones the
+provider reports. --estimate-only skips the API calls and only compares
+prompt tokens.
+
+    python benchmarks/batched_generation.py --provider gemini --products 20 --batch-size 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return round(len(text or '') / CHARS_PER_TOKEN)
+
+
+def build_products(count: int) -> list:
+    return [{
+        'id': product_id,
+        'title': f'Hand thrown stoneware mug no. {product_id}',
+        'description': '<p>A 350 ml mug with a speckled matte glaze, dishwasher and microwave safe.</p>'
+    } for product_id in range(1, count + 1)]
+
+
+def run_single(service, products: list, keywords: dict, estimate_only: bool) -> dict:
+    prompt_tokens = sum(estimate_tokens(service._build_prompt(product, keywords.get(product['id'])))
+                        for product in products)
+    output_tokens, failed = 0, 0
+    started = time.perf_counter()
+    if not estimate_only:
+        for product in products:
+            success, _, data = service._generate_description(product, keywords.get(product['id']), regenerate=True)
+            if success:
+                output_tokens += data['completion_tokens']
+            else:
+                failed += 1
+    return {'requests': len(products), 'prompt_tokens': prompt_tokens, 'output_tokens': output_tokens,
+            'failed': failed, 'elapsed': time.perf_counter() - started}
+
+
+def run_batched(service, products: list, keywords: dict, batch_size: int, estimate_only: bool) -> dict:
+    batches = [products[offset:offset + batch_size] for offset in range(0, len(products), batch_size)]
+    prompt_tokens = sum(estimate_tokens(service._build_batch_prompt(batch, keywords)) for batch in batches)
+    output_tokens, failed = 0, 0
+    started = time.perf_counter()
+    if not estimate_only:
+        for batch in batches:
+            success, _, data = service._generate_batch(batch, keywords)
+            descriptions = data['descriptions'] if success else {}
+            output_tokens += data['completion_tokens'] if success else 0
+            failed += len(batch) - len(descriptions)
+    return {'requests': len(batches), 'prompt_tokens': prompt_tokens, 'output_tokens': output_tokens,
+            'failed': failed, 'elapsed': time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--provider', choices=('gemini', 'openai'), default='gemini')
+    parser.add_argument('--products', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--estimate-only', action='store_true', help='compare prompt tokens without calling the API')
+    args = parser.parse_args()
+
+    from app import create_app
+    import app.api  # noqa: F401 - app.api has to be loaded before app.services
+    from app.services.gemini_service import GeminiService
+    from app.services.openai_service import OpenAIService
+
+    service = GeminiService if args.provider == 'gemini' else OpenAIService
+    products = build_products(args.products)
+    keywords = {product['id']: ['stoneware mug', 'handmade'] for product in products}
+
+    with create_app().app_context():
+        rows = [
+            ('one-at-a-time', run_single(service, products, keywords, args.estimate_only)),
+            (f'batched K={args.batch_size}', run_batched(service, products, keywords, args.batch_size,
+                                                         args.estimate_only)),
+        ]
+
+    columns = ('mode', 'requests', 'prompt_tok/product', 'output_tok/product', 'seconds/product', 'failed')
+    print(' '.join(f'{column:>20}' for column in columns))
+    for mode, row in rows:
+        print(' '.join(f'{value:>20}' for value in (
+            mode,
+            row['requests'],
+            round(row['prompt_tokens'] / args.products, 1),
+            '-' if args.estimate_only else round(row['output_tokens'] / args.products, 1),
+            '-' if args.estimate_only else round(row['elapsed'] / args.products, 3),
+            '-' if args.estimate_only else row['failed']
+        )))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Peak memory and parse time of one 250 product Shopify page, comparing the
+full products.json payload parsed with response.json() against the
+fields= projected payload decoded incrementally by ProductService.
+
+Every variant runs in a fresh interpreter so peak RSS is not shared.
+
+    python benchmarks/product_page_parsing.py [--pages 20]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PAGE_SIZE = 250
+READ_SIZE = 64 * 1024
+
+
+def build_product(product_id: int) -> dict:
+    """
+    A product shaped like a real products.json entry, with variants, images and options
+    """
+    return {
+        'id': product_id,
+        'title': f'Product {product_id}',
+        'body_html': '<p>' + 'Hand made ceramic mug with a matte glaze. ' * 40 + '</p>',
+        'vendor': 'Acme',
+        'product_type': 'Mugs',
+        'created_at': '2024-01-01T00:00:00-05:00',
+        'updated_at': '2024-03-01T00:00:00-05:00',
+        'published_at': '2024-01-01T00:00:00-05:00',
+        'handle': f'product-{product_id}',
+        'status': 'active',
+        'tags': 'ceramic, mug, kitchen, gift',
+        'admin_graphql_api_id': f'gid://shopify/Product/{product_id}',
+        'variants': [{
+            'id': product_id * 100 + variant, 'product_id': product_id, 'title': f'Size {variant}',
+            'price': '19.99', 'sku': f'SKU-{product_id}-{variant}', 'position': variant,
+            'inventory_policy': 'deny', 'compare_at_price': None, 'fulfillment_service': 'manual',
+            'inventory_management': 'shopify', 'option1': f'Size {variant}', 'option2': 'Blue', 'option3': None,
+            'created_at': '2024-01-01T00:00:00-05:00', 'updated_at': '2024-03-01T00:00:00-05:00',
+            'taxable': True, 'barcode': '0123456789012', 'grams': 350, 'weight': 0.35, 'weight_unit': 'kg',
+            'inventory_item_id': product_id * 1000 + variant, 'inventory_quantity': 12,
+            'requires_shipping': True, 'admin_graphql_api_id': f'gid://shopify/ProductVariant/{variant}'
+        } for variant in range(1, 21)],
+        'options': [{'id': product_id * 10 + option, 'product_id': product_id, 'name': f'Option {option}',
+                     'position': option, 'values': ['Small', 'Medium', 'Large', 'Blue', 'Red']}
+                    for option in range(1, 4)],
+        'images': [{
+            'id': product_id * 100 + image, 'product_id': product_id, 'position': image,
+            'created_at': '2024-01-01T00:00:00-05:00', 'updated_at': '2024-03-01T00:00:00-05:00',
+            'alt': None, 'width': 2048, 'height': 2048,
+            'src': f'https://cdn.shopify.com/s/files/1/0000/0001/products/{product_id}-{image}.jpg?v=1700000000',
+            'variant_ids': [], 'admin_graphql_api_id': f'gid://shopify/ProductImage/{image}'
+        } for image in range(1, 11)]
+    }
+
+
+def build_page(projected: bool) -> bytes:
+    from app.services.product_service import SHOPIFY_PRODUCT_FIELDS
+    fields = SHOPIFY_PRODUCT_FIELDS.split(',')
+    products = [build_product(product_id) for product_id in range(1, PAGE_SIZE + 1)]
+    if projected:
+        products = [{field: product[field] for field in fields} for product in products]
+    return json.dumps({'products': products}).encode('utf-8')
+
+
+def run_variant(variant: str, pages: int, results):
+    import app.api  # noqa: F401 - app.api has to be loaded before app.services
+    from app.services.utils import iter_json_array_items
+
+    body = build_page(projected=variant == 'projected_stream')
+
+    def parse_page() -> list:
+        if variant == 'full_json':
+            # requests buffers the body, decodes it to str and builds the whole tree
+            return json.loads(bytes(body).decode('utf-8')).get('products', [])
+        chunks = (body[offset:offset + READ_SIZE] for offset in range(0, len(body), READ_SIZE))
+        return list(iter_json_array_items(chunks, 'products'))
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    for _ in range(pages):
+        assert len(parse_page()) == PAGE_SIZE
+    elapsed = time.perf_counter() - started
+
+    # Allocation peak is traced on a separate pass, tracing would skew the timings
+    tracemalloc.start()
+    parse_page()
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results.put({
+        'variant': variant,
+        'payload_kb': round(len(body) / 1024, 1),
+        'parse_ms_per_page': round(elapsed / pages * 1000, 2),
+        'peak_alloc_kb': round(peak_traced / 1024, 1),
+        # ru_maxrss is in KB on Linux
+        'peak_rss_growth_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='pages parsed per variant')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    rows = []
+    for variant in ('full_json', 'projected_stream'):
+        process = context.Process(target=run_variant, args=(variant, args.pages, results))
+        process.start()
+        rows.append(results.get())
+        process.join()
+
+    columns = ('variant', 'payload_kb', 'parse_ms_per_page', 'peak_alloc_kb', 'peak_rss_growth_kb')
+    print(' '.join(f'{column:>20}' for column in columns))
+    for row in rows:
+        print(' '.join(f'{str(row[column]):>20}' for column in columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Prompt tokens per product with the raw Shopify body_html pasted into the
+prompt against the compacted description, and the time compaction takes.
+
+Uses synthetic descriptions shaped like real theme exports (inline styles,
+tracking pixels, scripts and spec tables) of about --size KB each. Token
+counts are estimated at 4 characters per token, no API is called.
+
+    python benchmarks/prompt_compaction.py --products 200 --size 30
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_body_html(product_id: int, size_kb: int) -> str:
+    """
+    A product description padded with markup until it reaches size_kb
+    """
+    style = 'style="font-family: Helvetica, Arial, sans-serif; color: #333333; line-height: 1.6; margin: 0 0 12px"'
+    sections = [
+        f'<div class="product-description" data-product-id="{product_id}" {style}>',
+        f'<h2 {style}>Hand thrown stoneware mug no. {product_id}</h2>',
+        f'<p {style}>A 350 ml mug with a speckled <strong>matte glaze</strong>, '
+        f'dishwasher and microwave safe.</p>',
+        '<img src="https://pixel.example.com/t.gif?campaign=summer&amp;utm_source=shopify" width="1" height="1">',
+        '<script>window.dataLayer = window.dataLayer || []; dataLayer.push({event: "view_item"});</script>',
+        '<style>.product-description table td { border: 1px solid #eeeeee; padding: 4px 8px; }</style>',
+    ]
+    row = 0
+    while sum(len(section) for section in sections) < size_kb * 1024:
+        row += 1
+        sections.append(
+            f'<table {style}><tbody><tr><td {style}><span {style}>Detail {row}</span></td>'
+            f'<td {style}><span {style}>Glazed by hand in small batches, value {row}</span></td></tr></tbody></table>'
+        )
+    sections.append('</div>')
+    return ''.join(sections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=200)
+    parser.add_argument('--size', type=int, default=30, help='KB of body_html per product')
+    args = parser.parse_args()
+
+    from app import create_app
+    import app.api  # noqa: F401 - app.api has to be loaded before app.services
+    from app.services.llm_provider import LLMProvider
+    from app.services.prompt_compaction import PromptCompaction
+
+    descriptions = [build_body_html(product_id, args.size) for product_id in range(1, args.products + 1)]
+    keywords = ['stoneware mug', 'handmade']
+
+    with create_app().app_context() as context:
+        budget = context.app.config['LLM_DESCRIPTION_TOKEN_BUDGET']
+        raw_tokens = sum(PromptCompaction.estimate_tokens(LLMProvider._build_prompt(
+            {'title': 'Stoneware mug', 'description': description}, keywords
+        )) for description in descriptions)
+
+        started = time.perf_counter()
+        compacted = [PromptCompaction.compact_description(description, budget) for description in descriptions]
+        elapsed = time.perf_counter() - started
+
+        compacted_tokens = sum(PromptCompaction.estimate_tokens(LLMProvider._build_prompt(
+            {'title': 'Stoneware mug', 'description': description}, keywords
+        )) for description in compacted)
+
+    columns = ('input', 'prompt_tok/product', 'ms/product')
+    print(' '.join(f'{column:>20}' for column in columns))
+    print(' '.join(f'{value:>20}' for value in ('raw body_html', round(raw_tokens / args.products, 1), '-')))
+    print(' '.join(f'{value:>20}' for value in (
+        f'compacted ({budget} tok)', round(compacted_tokens / args.products, 1),
+        round(elapsed * 1000 / args.products, 3)
+    )))
+
+
+if __name__ == '__main__':
+    main()
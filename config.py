@@ -22,15 +22,109 @@ class Config(object):
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME_PROD')
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    # Celery broker, the Redis instance unless a dedicated broker is configured
+    AMQP = os.environ.get('AMQP', REDIS_URL)
+    CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', REDIS_URL)
     
     # Shopify API credentials
     SHOPIFY_API_KEY = os.environ.get('SHOPIFY_API_KEY')
     SHOPIFY_API_SECRET = os.environ.get('SHOPIFY_API_SECRET')
     SHOPIFY_APP_URL = os.environ.get('SHOPIFY_APP_URL')
+    SHOPIFY_API_VERSION = os.environ.get('SHOPIFY_API_VERSION', '2024-01')
+    # Shopify HTTP client: timeouts in seconds, retries on 429/5xx and pooled connections per shop
+    SHOPIFY_CONNECT_TIMEOUT = float(os.environ.get('SHOPIFY_CONNECT_TIMEOUT', 5))
+    SHOPIFY_READ_TIMEOUT = float(os.environ.get('SHOPIFY_READ_TIMEOUT', 30))
+    SHOPIFY_MAX_RETRIES = int(os.environ.get('SHOPIFY_MAX_RETRIES', 3))
+    SHOPIFY_RETRY_BACKOFF = float(os.environ.get('SHOPIFY_RETRY_BACKOFF', 1))
+    # Longest wait before a retry, whatever Retry-After asks for
+    SHOPIFY_RETRY_MAX_WAIT = float(os.environ.get('SHOPIFY_RETRY_MAX_WAIT', 30))
+    SHOPIFY_POOL_SIZE = int(os.environ.get('SHOPIFY_POOL_SIZE', 10))
+    # Shared per-store rate limit buckets (REST calls / GraphQL cost points, refill per second)
+    SHOPIFY_REST_BUCKET_SIZE = float(os.environ.get('SHOPIFY_REST_BUCKET_SIZE', 40))
+    SHOPIFY_REST_LEAK_RATE = float(os.environ.get('SHOPIFY_REST_LEAK_RATE', 2))
+    SHOPIFY_GRAPHQL_BUCKET_SIZE = float(os.environ.get('SHOPIFY_GRAPHQL_BUCKET_SIZE', 1000))
+    SHOPIFY_GRAPHQL_RESTORE_RATE = float(os.environ.get('SHOPIFY_GRAPHQL_RESTORE_RATE', 50))
+    # Longest a call waits for rate limit capacity before failing
+    SHOPIFY_RATE_LIMIT_MAX_WAIT = float(os.environ.get('SHOPIFY_RATE_LIMIT_MAX_WAIT', 60))
+    # Number of products written per executemany batch / transaction during a sync
+    SHOPIFY_SYNC_CHUNK_SIZE = int(os.environ.get('SHOPIFY_SYNC_CHUNK_SIZE', 250))
+    # Seconds an interrupted sync can still be resumed from its checkpoint
+    SHOPIFY_SYNC_CHECKPOINT_TTL = int(os.environ.get('SHOPIFY_SYNC_CHECKPOINT_TTL', 24 * 3600))
+    # Seconds a store's sync lock is held without a checkpoint renewing it, before another sync may take over
+    SHOPIFY_SYNC_LOCK_TTL = int(os.environ.get('SHOPIFY_SYNC_LOCK_TTL', 15 * 60))
+    # The sync watermark never moves past a sync's start minus this margin (covers clock skew with Shopify)
+    SHOPIFY_SYNC_WATERMARK_MARGIN = int(os.environ.get('SHOPIFY_SYNC_WATERMARK_MARGIN', 300))
+    # Default products per shard and concurrent shard tasks of a sharded store sync
+    SHOPIFY_SYNC_SHARD_SIZE = int(os.environ.get('SHOPIFY_SYNC_SHARD_SIZE', 25000))
+    SHOPIFY_SYNC_SHARD_PARALLELISM = int(os.environ.get('SHOPIFY_SYNC_SHARD_PARALLELISM', 4))
+    # Seconds product webhooks are held so bursts for the same product are applied once
+    SHOPIFY_WEBHOOK_COALESCE_WINDOW = float(os.environ.get('SHOPIFY_WEBHOOK_COALESCE_WINDOW', 5))
+    # Runs a product webhook is attempted on database or connection errors before it is dropped
+    SHOPIFY_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('SHOPIFY_WEBHOOK_MAX_ATTEMPTS', 5))
+    # Concurrent products.json?ids= calls of a targeted product refresh
+    SHOPIFY_REFRESH_CONCURRENCY = int(os.environ.get('SHOPIFY_REFRESH_CONCURRENCY', 4))
+    # Number of stores synced concurrently by the multi-store orchestrator
+    STORE_SYNC_WORKERS = int(os.environ.get('STORE_SYNC_WORKERS', 8))
+    # GraphQL bulk operation sync, polling interval and overall timeout in seconds
+    SHOPIFY_BULK_POLL_INTERVAL = float(os.environ.get('SHOPIFY_BULK_POLL_INTERVAL', 5))
+    SHOPIFY_BULK_TIMEOUT = float(os.environ.get('SHOPIFY_BULK_TIMEOUT', 3600))
+
+    # Circuit breakers around LLM providers and each store's Shopify API: failures in a row
+    # (within the window, in seconds) that open a circuit, seconds it stays open before a probe
+    # call is let through, and seconds a probe may take before another one is allowed
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_FAILURE_WINDOW = float(os.environ.get('CIRCUIT_FAILURE_WINDOW', 60))
+    CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+    CIRCUIT_PROBE_TIMEOUT = float(os.environ.get('CIRCUIT_PROBE_TIMEOUT', 120))
 
     # Gemini settings
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-    GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-pro')
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-pro')
+
+    # OpenAI settings
+    OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
+    OPENAI_API_BASE = os.environ.get('OPENAI_API_BASE', 'https://api.openai.com/v1')
+    # Batch API runs of bulk optimization: most requests per batch input file, seconds between
+    # status polls, seconds a batch may take from submission and runs per product before it fails
+    OPENAI_BATCH_MAX_REQUESTS = int(os.environ.get('OPENAI_BATCH_MAX_REQUESTS', 10000))
+    OPENAI_BATCH_POLL_INTERVAL = float(os.environ.get('OPENAI_BATCH_POLL_INTERVAL', 60))
+    OPENAI_BATCH_TIMEOUT = float(os.environ.get('OPENAI_BATCH_TIMEOUT', 26 * 3600))
+    OPENAI_BATCH_MAX_ATTEMPTS = int(os.environ.get('OPENAI_BATCH_MAX_ATTEMPTS', 2))
+    # A running bulk optimization that reported no progress for this long is presumed dead and can be resumed
+    OPTIMIZE_JOB_LEASE = float(os.environ.get('OPTIMIZE_JOB_LEASE', 15 * 60))
+
+    # Bulk description generation, initial concurrent LLM calls per provider and seconds allowed per product
+    LLM_BULK_CONCURRENCY = int(os.environ.get('LLM_BULK_CONCURRENCY', 8))
+    LLM_ITEM_TIMEOUT = float(os.environ.get('LLM_ITEM_TIMEOUT', 60))
+    # Concurrency adapts between min and max: it grows while calls answer within the latency target
+    # (seconds per 1000 tokens asked) and is multiplied by the decrease on 429/503, timeouts or slow calls
+    LLM_CONCURRENCY_MIN = int(os.environ.get('LLM_CONCURRENCY_MIN', 1))
+    LLM_CONCURRENCY_MAX = int(os.environ.get('LLM_CONCURRENCY_MAX', 32))
+    LLM_CONCURRENCY_DECREASE = float(os.environ.get('LLM_CONCURRENCY_DECREASE', 0.5))
+    LLM_LATENCY_TARGET = float(os.environ.get('LLM_LATENCY_TARGET', 20))
+    # Seconds between reports of each process's current limits to Redis
+    LLM_CONCURRENCY_METRIC_INTERVAL = float(os.environ.get('LLM_CONCURRENCY_METRIC_INTERVAL', 10))
+    # Provider used for descriptions, and the one requests are hedged and fall back to
+    LLM_PRIMARY_PROVIDER = os.environ.get('LLM_PRIMARY_PROVIDER', 'gemini')
+    LLM_FALLBACK_PROVIDER = os.environ.get('LLM_FALLBACK_PROVIDER', 'openai')
+    # A request still unanswered after the primary's p95 latency is also sent to the fallback.
+    # The default delay applies until LLM_LATENCY_MIN_SAMPLES of the last LLM_LATENCY_WINDOW calls were timed
+    LLM_HEDGE_ENABLED = os.environ.get('LLM_HEDGE_ENABLED', 'true').lower() == 'true'
+    LLM_HEDGE_DEFAULT_DELAY = float(os.environ.get('LLM_HEDGE_DEFAULT_DELAY', 15))
+    LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 2))
+    LLM_LATENCY_WINDOW = int(os.environ.get('LLM_LATENCY_WINDOW', 200))
+    LLM_LATENCY_MIN_SAMPLES = int(os.environ.get('LLM_LATENCY_MIN_SAMPLES', 20))
+    # Products packed into one batched prompt per provider (1 sends one prompt per product)
+    # and attempts at products missing from a batched answer
+    GEMINI_BATCH_SIZE = int(os.environ.get('GEMINI_BATCH_SIZE', 1))
+    OPENAI_BATCH_SIZE = int(os.environ.get('OPENAI_BATCH_SIZE', 1))
+    LLM_BATCH_MAX_ATTEMPTS = int(os.environ.get('LLM_BATCH_MAX_ATTEMPTS', 3))
+    # Most tokens of a product's original description (reduced to plain text) put in a prompt
+    LLM_DESCRIPTION_TOKEN_BUDGET = int(os.environ.get('LLM_DESCRIPTION_TOKEN_BUDGET', 400))
+    # Cache of generated descriptions, seconds an entry lives and most entries kept (LRU evicted)
+    LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', 30 * 24 * 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', 50000))
     
     # Flask-Session settings
     SESSION_TYPE = os.environ.get('SESSION_TYPE', 'filesystem')
@@ -0,0 +1,44 @@
+"""Add unique index on products (store_id, shopify_product_id)
+
+Revision ID: 4f2a9c1e7b3d
+Revises: b3b9866b437b
+Create Date: 2026-10-17 09:12:41.503118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c1e7b3d'
+down_revision = 'b3b9866b437b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse duplicates left behind by the old per-row sync onto the oldest row
+    op.execute("""
+        UPDATE optimized_descriptions SET product_id = (
+            SELECT MIN(duplicate.id) FROM products AS original
+            JOIN products AS duplicate
+              ON duplicate.store_id = original.store_id
+             AND duplicate.shopify_product_id = original.shopify_product_id
+            WHERE original.id = optimized_descriptions.product_id
+        )
+    """)
+    op.execute("""
+        DELETE FROM products WHERE id NOT IN (
+            SELECT keep_id FROM (
+                SELECT MIN(id) AS keep_id FROM products GROUP BY store_id, shopify_product_id
+            ) AS survivors
+        )
+    """)
+
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.create_index('ix_products_store_id_shopify_product_id', ['store_id', 'shopify_product_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_index('ix_products_store_id_shopify_product_id')